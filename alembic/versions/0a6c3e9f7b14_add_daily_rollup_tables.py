@@ -0,0 +1,83 @@
+"""Add daily rollup tables for transactions and anomalies
+
+Revision ID: 0a6c3e9f7b14
+Revises: f5b1d8e3a927
+Create Date: 2026-10-19 17:48:12.530617
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6c3e9f7b14'
+down_revision: Union[str, Sequence[str], None] = 'f5b1d8e3a927'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('transaction_rollup_daily',
+    sa.Column('tanggal', sa.String(length=10), nullable=False),
+    sa.Column('mor', sa.String(), nullable=False),
+    sa.Column('provinsi', sa.String(), nullable=False),
+    sa.Column('kota_kabupaten', sa.String(), nullable=False),
+    sa.Column('no_spbu', sa.String(), nullable=False),
+    sa.Column('produk', sa.String(), nullable=False),
+    sa.Column('transaction_count', sa.BigInteger(), nullable=False),
+    sa.Column('total_volume_liter', sa.Numeric(precision=20, scale=3), nullable=False),
+    sa.Column('total_penjualan_rupiah', sa.Numeric(precision=20, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('tanggal', 'mor', 'provinsi', 'kota_kabupaten', 'no_spbu', 'produk')
+    )
+    op.create_table('anomaly_rollup_daily',
+    sa.Column('execution_id', sa.String(length=50), nullable=False),
+    sa.Column('tanggal', sa.String(length=10), nullable=False),
+    sa.Column('mor', sa.String(), nullable=False),
+    sa.Column('provinsi', sa.String(), nullable=False),
+    sa.Column('kota_kabupaten', sa.String(), nullable=False),
+    sa.Column('no_spbu', sa.String(), nullable=False),
+    sa.Column('produk', sa.String(), nullable=False),
+    sa.Column('anomalous_transactions', sa.BigInteger(), nullable=False),
+    sa.Column('anomalous_volume_liter', sa.Numeric(precision=20, scale=3), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['execution_id'], ['anomaly_executions.execution_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('execution_id', 'tanggal', 'mor', 'provinsi', 'kota_kabupaten', 'no_spbu', 'produk')
+    )
+
+    # Isi awal dari data yang sudah ada; setelah ini rollup dipelihara oleh import dan analisis
+    op.execute("""
+        INSERT INTO transaction_rollup_daily (
+            tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk,
+            transaction_count, total_volume_liter, total_penjualan_rupiah, updated_at
+        )
+        SELECT
+            tanggal, COALESCE(mor, ''), COALESCE(provinsi, ''), COALESCE(kota_kabupaten, ''),
+            COALESCE(no_spbu, ''), COALESCE(produk, ''),
+            COUNT(*), COALESCE(SUM(volume_liter), 0), COALESCE(SUM(penjualan_rupiah), 0), now()
+        FROM csv_import_log
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """)
+    op.execute("""
+        INSERT INTO anomaly_rollup_daily (
+            execution_id, tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk,
+            anomalous_transactions, anomalous_volume_liter, updated_at
+        )
+        SELECT
+            r.execution_id, l.tanggal, COALESCE(l.mor, ''), COALESCE(l.provinsi, ''), COALESCE(l.kota_kabupaten, ''),
+            COALESCE(l.no_spbu, ''), COALESCE(l.produk, ''),
+            COUNT(*), COALESCE(SUM(l.volume_liter), 0), now()
+        FROM anomaly_results r
+        JOIN csv_import_log l ON l.transaction_id_asersi = r.transaction_id_asersi
+        WHERE r.is_anomalous
+        GROUP BY 1, 2, 3, 4, 5, 6, 7
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('anomaly_rollup_daily')
+    op.drop_table('transaction_rollup_daily')
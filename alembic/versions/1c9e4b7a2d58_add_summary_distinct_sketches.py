@@ -0,0 +1,36 @@
+"""Add summary_distinct_sketches for mergeable distinct counts
+
+Revision ID: 1c9e4b7a2d58
+Revises: 0a6c3e9f7b14
+Create Date: 2026-10-19 18:31:45.207761
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c9e4b7a2d58'
+down_revision: Union[str, Sequence[str], None] = '0a6c3e9f7b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('summary_distinct_sketches',
+    sa.Column('summary_id', sa.Integer(), nullable=False),
+    sa.Column('column_name', sa.String(length=50), nullable=False),
+    sa.Column('precision', sa.Integer(), nullable=False),
+    sa.Column('registers', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['summary_id'], ['csv_summary_master_daily.summary_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('summary_id', 'column_name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('summary_distinct_sketches')
@@ -0,0 +1,28 @@
+"""Add import_metrics to CsvSummaryMasterDaily
+
+Revision ID: 3b8e1c7d9a42
+Revises: 6f370e0ade66
+Create Date: 2026-10-19 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e1c7d9a42'
+down_revision: Union[str, Sequence[str], None] = '6f370e0ade66'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('csv_summary_master_daily', sa.Column('import_metrics', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('csv_summary_master_daily', 'import_metrics')
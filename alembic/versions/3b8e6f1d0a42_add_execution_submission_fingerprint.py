@@ -0,0 +1,36 @@
+"""Add submission fingerprint to anomaly_executions
+
+Revision ID: 3b8e6f1d0a42
+Revises: 7d2f0b5c8e31
+Create Date: 2026-10-19 19:58:21.640392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e6f1d0a42'
+down_revision: Union[str, Sequence[str], None] = '7d2f0b5c8e31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('anomaly_executions', sa.Column('submission_fingerprint', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ux_anomaly_executions_inflight_fingerprint',
+        'anomaly_executions',
+        ['submission_fingerprint'],
+        unique=True,
+        postgresql_where=sa.text("status IN ('QUEUED', 'PENDING', 'RUNNING')"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_anomaly_executions_inflight_fingerprint', table_name='anomaly_executions')
+    op.drop_column('anomaly_executions', 'submission_fingerprint')
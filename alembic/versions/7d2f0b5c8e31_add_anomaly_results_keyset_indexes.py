@@ -0,0 +1,30 @@
+"""Add keyset indexes on anomaly_results for the results API
+
+Revision ID: 7d2f0b5c8e31
+Revises: 1c9e4b7a2d58
+Create Date: 2026-10-19 19:12:48.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2f0b5c8e31'
+down_revision: Union[str, Sequence[str], None] = '1c9e4b7a2d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_anomaly_results_execution_anomalous', 'anomaly_results', ['execution_id', 'is_anomalous', 'transaction_id_asersi'], unique=False)
+    op.create_index('ix_anomaly_results_summary', 'anomaly_results', ['summary_id', 'execution_id', 'transaction_id_asersi'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_anomaly_results_summary', table_name='anomaly_results')
+    op.drop_index('ix_anomaly_results_execution_anomalous', table_name='anomaly_results')
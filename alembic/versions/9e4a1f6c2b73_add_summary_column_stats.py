@@ -0,0 +1,28 @@
+"""Add column_stats to CsvSummaryMasterDaily
+
+Revision ID: 9e4a1f6c2b73
+Revises: 3b8e6f1d0a42
+Create Date: 2026-10-19 21:12:44.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4a1f6c2b73'
+down_revision: Union[str, Sequence[str], None] = '3b8e6f1d0a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('csv_summary_master_daily', sa.Column('column_stats', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('csv_summary_master_daily', 'column_stats')
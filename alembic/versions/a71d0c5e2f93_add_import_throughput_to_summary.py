@@ -0,0 +1,30 @@
+"""Add rows_per_second and stage_durations to CsvSummaryMasterDaily
+
+Revision ID: a71d0c5e2f93
+Revises: 3b8e1c7d9a42
+Create Date: 2026-10-19 10:03:17.540921
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a71d0c5e2f93'
+down_revision: Union[str, Sequence[str], None] = '3b8e1c7d9a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('csv_summary_master_daily', sa.Column('rows_per_second', sa.Numeric(precision=20, scale=3), nullable=True))
+    op.add_column('csv_summary_master_daily', sa.Column('stage_durations', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('csv_summary_master_daily', 'stage_durations')
+    op.drop_column('csv_summary_master_daily', 'rows_per_second')
@@ -0,0 +1,28 @@
+"""Add index on CsvImportLog.daily_summary_id
+
+Revision ID: c4e8a2b71d05
+Revises: a71d0c5e2f93
+Create Date: 2026-10-19 14:02:41.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2b71d05'
+down_revision: Union[str, Sequence[str], None] = 'a71d0c5e2f93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_csv_import_log_daily_summary_id'), 'csv_import_log', ['daily_summary_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_csv_import_log_daily_summary_id'), table_name='csv_import_log')
@@ -0,0 +1,36 @@
+"""Add pg_trgm GIN indexes for substring filters on CsvImportLog
+
+Revision ID: d9f3b6a0c182
+Revises: c4e8a2b71d05
+Create Date: 2026-10-19 15:21:09.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f3b6a0c182'
+down_revision: Union[str, Sequence[str], None] = 'c4e8a2b71d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_COLUMNS = ['plat_nomor', 'nik', 'no_spbu']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in TRIGRAM_COLUMNS:
+        op.create_index(
+            f'ix_csv_import_log_{column}_trgm', 'csv_import_log', [column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for column in TRIGRAM_COLUMNS:
+        op.drop_index(f'ix_csv_import_log_{column}_trgm', table_name='csv_import_log')
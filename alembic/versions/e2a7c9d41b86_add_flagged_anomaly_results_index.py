@@ -0,0 +1,34 @@
+"""Add partial index on flagged anomaly_results per execution
+
+Revision ID: e2a7c9d41b86
+Revises: d9f3b6a0c182
+Create Date: 2026-10-19 16:21:07.442918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c9d41b86'
+down_revision: Union[str, Sequence[str], None] = 'd9f3b6a0c182'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_anomaly_results_execution_flagged',
+        'anomaly_results',
+        ['execution_id', 'summary_id', 'transaction_id_asersi'],
+        unique=False,
+        postgresql_where=sa.text('is_anomalous'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_anomaly_results_execution_flagged', table_name='anomaly_results')
@@ -0,0 +1,28 @@
+"""Add (import_datetime, summary_id) index on csv_summary_master_daily
+
+Revision ID: f5b1d8e3a927
+Revises: e2a7c9d41b86
+Create Date: 2026-10-19 17:05:33.918204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5b1d8e3a927'
+down_revision: Union[str, Sequence[str], None] = 'e2a7c9d41b86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_csv_summary_master_daily_import_datetime', 'csv_summary_master_daily', ['import_datetime', 'summary_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_csv_summary_master_daily_import_datetime', table_name='csv_summary_master_daily')
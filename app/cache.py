@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import redis
+from fastapi.encoders import jsonable_encoder
+
+from db_config import REDIS_CONFIG
+
+# Versi per namespace disimpan di Redis dan diganti setiap kali data namespace berubah.
+# Nilainya token acak (bukan counter) sehingga Redis yang di-flush tidak pernah
+# menghasilkan ulang versi lama dan ETag lama tidak salah dianggap masih valid.
+CACHE_VERSION_PREFIX = 'cache:version:'
+CACHE_REDIS_TIMEOUT = float(os.getenv('CACHE_REDIS_TIMEOUT', '0.5'))
+
+# Cache respons endpoint baca: key memuat versi namespace, sehingga bump_version langsung
+# membuat semua respons lama tidak terjangkau (dan hilang sendiri setelah TTL).
+CACHE_RESPONSE_PREFIX = 'cache:response:'
+CACHE_METRICS_PREFIX = 'cache:metrics:'
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '600'))
+# Respons yang lebih besar dari ini tidak disimpan (mis. hasil anomali satu summary besar)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+SUMMARIES_NAMESPACE = 'summaries' # Diubah oleh import (csv_summary_master_daily)
+RESULTS_NAMESPACE = 'results' # Diubah oleh eksekusi analisis (anomaly_results)
+TEMPLATES_NAMESPACE = 'templates' # Diubah oleh CRUD template dan kriteria (katalog per proses, lihat app.template_catalog)
+RESPONSE_NAMESPACES = (SUMMARIES_NAMESPACE, RESULTS_NAMESPACE)
+
+_redis_client = None
+_redis_lock = threading.Lock()
+
+def get_cache_redis():
+    """
+    Client Redis untuk cache/versi data, dengan timeout pendek: Redis yang lambat
+    atau mati hanya mematikan cache, tidak memperlambat request.
+    """
+    global _redis_client
+    with _redis_lock:
+        if _redis_client is None:
+            _redis_client = redis.Redis(
+                host=REDIS_CONFIG['host'], port=int(REDIS_CONFIG['port']), db=REDIS_CONFIG['db'],
+                decode_responses=True, socket_timeout=CACHE_REDIS_TIMEOUT, socket_connect_timeout=CACHE_REDIS_TIMEOUT,
+            )
+        return _redis_client
+
+def get_version(namespace: str) -> str | None:
+    """Versi data namespace saat ini (dibuat jika belum ada), atau None jika Redis tidak tersedia."""
+    key = f"{CACHE_VERSION_PREFIX}{namespace}"
+    try:
+        client = get_cache_redis()
+        version = client.get(key)
+        if version is None:
+            client.set(key, uuid.uuid4().hex, nx=True)
+            version = client.get(key)
+        return version
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Versi cache '{namespace}' tidak dapat dibaca: {e}")
+        return None
+
+def bump_version(namespace: str):
+    """Menandai data namespace berubah. Dipanggil setelah commit; kegagalan Redis hanya dicatat."""
+    try:
+        get_cache_redis().set(f"{CACHE_VERSION_PREFIX}{namespace}", uuid.uuid4().hex)
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Versi cache '{namespace}' tidak dapat diperbarui: {e}")
+
+def make_etag(version: str, *parts) -> str:
+    """ETag dari versi namespace dan parameter permintaan (halaman/filter/proyeksi yang berbeda, ETag berbeda)."""
+    digest = hashlib.sha1("|".join([version, *map(str, parts)]).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Bandingkan secara weak: W/"x" dianggap sama dengan "x"
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return etag in candidates
+
+def json_body(content) -> str:
+    """Serialisasi JSON yang sama dengan JSONResponse FastAPI."""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+def _record_metrics(client, namespace: str, outcome: str, build_seconds: float = 0.0):
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrby(f"{CACHE_METRICS_PREFIX}{namespace}", outcome, 1)
+    if build_seconds:
+        pipe.hincrbyfloat(f"{CACHE_METRICS_PREFIX}{namespace}", 'build_seconds', build_seconds)
+    return pipe
+
+def cached_response(namespace: str, build, *parts, version: str | None = None) -> tuple[str, dict]:
+    """
+    Mengembalikan (body JSON, headers) untuk permintaan yang diidentifikasi oleh `parts`,
+    dari Redis bila ada untuk versi namespace saat ini, atau dari `build()` lalu disimpan.
+
+    Versi dibaca sebelum `build()` menyentuh database: data yang di-commit setelahnya
+    paling buruk tersimpan di bawah versi lama yang sudah tidak dipakai, tidak pernah
+    sebaliknya. Exception dari `build()` (mis. 404) tidak di-cache. Redis yang tidak
+    tersedia membuat setiap permintaan langsung ke `build()`.
+    """
+    version = version or get_version(namespace)
+    if version is None:
+        return build()
+    digest = hashlib.sha1("|".join(map(str, parts)).encode('utf-8')).hexdigest()
+    key = f"{CACHE_RESPONSE_PREFIX}{namespace}:{version}:{digest}"
+    try:
+        client = get_cache_redis()
+        cached = client.get(key)
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Cache respons '{namespace}' tidak dapat dibaca: {e}")
+        return build()
+
+    if cached is not None:
+        try:
+            _record_metrics(client, namespace, 'hits').execute()
+        except redis.exceptions.RedisError:
+            pass
+        # Format simpanan: header JSON satu baris, newline, lalu body (json.dumps tidak menghasilkan newline mentah)
+        raw_headers, body = cached.split('\n', 1)
+        return body, json.loads(raw_headers)
+
+    started = time.perf_counter()
+    body, headers = build()
+    pipe = _record_metrics(client, namespace, 'misses', time.perf_counter() - started)
+    if len(body) <= RESPONSE_CACHE_MAX_BYTES:
+        pipe.set(key, f"{json.dumps(headers)}\n{body}", ex=RESPONSE_CACHE_TTL)
+    else:
+        pipe.hincrby(f"{CACHE_METRICS_PREFIX}{namespace}", 'oversize', 1)
+    try:
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Cache respons '{namespace}' tidak dapat disimpan: {e}")
+    return body, headers
+
+def get_metrics() -> dict:
+    """
+    Hit/miss per namespace sejak counter terakhir di-reset. build_seconds adalah total waktu
+    membangun respons saat miss; rata-ratanya dikali jumlah hit memperkirakan waktu database yang dihemat.
+    """
+    client = get_cache_redis()
+    pipe = client.pipeline(transaction=False)
+    for namespace in RESPONSE_NAMESPACES:
+        pipe.hgetall(f"{CACHE_METRICS_PREFIX}{namespace}")
+    metrics = {}
+    for namespace, raw in zip(RESPONSE_NAMESPACES, pipe.execute()):
+        hits, misses = int(raw.get('hits', 0)), int(raw.get('misses', 0))
+        build_seconds = float(raw.get('build_seconds', 0.0))
+        average_build = build_seconds / misses if misses else 0.0
+        metrics[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'oversize': int(raw.get('oversize', 0)),
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+            'average_build_ms': round(average_build * 1000, 2),
+            'estimated_saved_seconds': round(average_build * hits, 2),
+        }
+    return metrics
+
+def reset_metrics():
+    get_cache_redis().delete(*(f"{CACHE_METRICS_PREFIX}{namespace}" for namespace in RESPONSE_NAMESPACES))
@@ -1,4 +1,6 @@
 from __future__ import annotations # Enable Postponed Evaluation of Annotations
+import json
+from datetime import datetime
 import logging
 from db_config import POSTGRES_CONFIG
 from contextlib import contextmanager
@@ -16,6 +18,7 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy import text
 
 from app.db_base import Base # Import Base from the new file
+from app import cache, rollup, rule_planner
 
 # --- SQLAlchemy Setup ---
 SQLALCHEMY_DATABASE_URL = URL.create(
@@ -53,15 +56,9 @@ def get_db_connection(config=None): # <--- TAMBAHKAN ARGUMEN INI
     # Koreksi: Set conn_config secara eksplisit di awal scope
     conn_config = config if config else POSTGRES_CONFIG
 
-    # DIAGNOSTIC LOG: Cetak konfigurasi yang digunakan
-    logging.warning("--- [DIAGNOSTIC] Attempting DB Connection ---")
-    for key, value in conn_config.items():
-        if key != "password":
-            logging.warning(f"[DIAGNOSTIC] Using config: {key} = {value}")
-            logging.warning("------------------------------------------")
-            logging.error(f"[DEBUG] POSTGRES_CONFIG used by psycopg2.connect: {conn_config}")
-        
-        from fastapi import HTTPException    
+    logging.debug(f"Opening DB connection to {conn_config.get('host')}:{conn_config.get('port')}/{conn_config.get('database')}")
+
+    from fastapi import HTTPException
     try:
         conn = psycopg2.connect(**conn_config) # <--- GUNAKAN conn_config
         yield conn
@@ -94,7 +91,6 @@ def bulk_insert_transactions(data_tuples: List[Tuple], summary_id: int):
     
     # Menambahkan daily_summary_id (FK), import_attempt_count (default 1), dan batch_original_duplicate_count (default 0) ke setiap baris
     data_with_defaults_and_fk = [item + (summary_id, 1, 0) for item in data_tuples] 
-    logging.warning(f"[DIAGNOSTIC] bulk_insert_transactions using summary_id: {summary_id}")
     
     insert_query = sql.SQL("""
         INSERT INTO {} ({}) 
@@ -109,17 +105,20 @@ def bulk_insert_transactions(data_tuples: List[Tuple], summary_id: int):
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                logging.warning(f"[DIAGNOSTIC] Attempting bulk insert for {len(data_with_defaults_and_fk)} rows.")
-                logging.error(f"[DEBUG] Data to insert (first 5 rows): {data_with_defaults_and_fk[:5]}")
+                logging.debug(f"Bulk inserting {len(data_with_defaults_and_fk)} rows for summary_id {summary_id}.")
                 extras.execute_values(
                     cursor,
                     insert_query,
                     data_with_defaults_and_fk,
                     page_size=10000
                 )
+                rows_affected = cursor.rowcount
+                # Rollup harian dan statistik kolom ikut di transaksi yang sama: tidak pernah tertinggal atau dobel dari import
+                rollup.apply_import(cursor, summary_id)
+                rule_planner.refresh_summary_column_stats(cursor, summary_id)
                 conn.commit()
-                logging.warning(f"[DIAGNOSTIC] Bulk insert committed. Rows affected: {cursor.rowcount}")
-                return cursor.rowcount
+                logging.debug(f"Bulk insert committed. Rows affected: {rows_affected}")
+                return rows_affected
     except Exception as e:
         logging.error(f"Bulk insert failed: {e}", exc_info=True)
         raise e
@@ -180,8 +179,6 @@ def create_summary_entry(
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                logging.error(f"[DEBUG] Executing query: {insert_query.as_string(conn)}")
-                logging.error(f"[DEBUG] With parameters: {import_datetime, import_duration, file_name, title, total_records_inserted, total_records_read, file_type, total_volume, total_penjualan, total_operator, produk_jbt, produk_jbkt, total_volume_liter, total_penjualan_rupiah, total_mode_transaksi, total_plat_nomor, total_nik, sektor_non_kendaraan, total_jumlah_roda_kendaraan_4, total_jumlah_roda_kendaraan_6, total_kuota, total_warna_plat_kuning, total_warna_plat_hitam, total_warna_plat_merah, total_warna_plat_putih, total_mor, total_provinsi, total_kota_kabupaten, total_no_spbu, numeric_totals}")
                 cursor.execute(insert_query, (
                     import_datetime, import_duration, file_name, title, total_records_inserted, total_records_read, file_type,
                     total_volume, total_penjualan, total_operator, produk_jbt, produk_jbkt,
@@ -194,39 +191,77 @@ def create_summary_entry(
                 ))
                 summary_id = cursor.fetchone()[0]
                 conn.commit()
-                logging.warning(f"[DIAGNOSTIC] Successfully created summary entry with ID: {summary_id}")
-
-                # Diagnostic: Verify if the summary_id exists immediately after commit
-                verify_query = sql.SQL("SELECT COUNT(*) FROM {} WHERE summary_id = %s").format(sql.Identifier(SUMMARY_TABLE))
-                cursor.execute(verify_query, (summary_id,))
-                if cursor.fetchone()[0] == 1:
-                    logging.warning(f"[DIAGNOSTIC] Verified: summary_id {summary_id} exists in {SUMMARY_TABLE}.")
-                else:
-                    logging.error(f"[DIAGNOSTIC] ERROR: summary_id {summary_id} DOES NOT EXIST in {SUMMARY_TABLE} after commit!")
-
+                cache.bump_version(cache.SUMMARIES_NAMESPACE)
+                logging.debug(f"Created summary entry with ID: {summary_id}")
                 return summary_id
     except Exception as e:
         logging.error(f"Failed to create summary entry: {e}", exc_info=True)
         raise e
 
-def update_summary_total_records(summary_id: int, total_records_inserted: int):
-    """
-    Memperbarui total_records_inserted untuk entry summary yang sudah ada.
-    """
-    logging.warning(f"--- [DIAGNOSTIC] Calling update_summary_total_records for summary_id: {summary_id} with total_records_inserted: {total_records_inserted} ---")
+def _update_summary_columns(summary_id: int, assignments: dict):
+    """Menjalankan satu UPDATE pada entry summary untuk kolom-kolom di `assignments`."""
     update_query = sql.SQL("""
-        UPDATE {} SET total_records_inserted = %s WHERE summary_id = %s
-    """).format(sql.Identifier(SUMMARY_TABLE))
+        UPDATE {} SET {} WHERE summary_id = %s
+    """).format(
+        sql.Identifier(SUMMARY_TABLE),
+        sql.SQL(', ').join(sql.SQL("{} = %s").format(sql.Identifier(column)) for column in assignments)
+    )
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(update_query, (*assignments.values(), summary_id))
+                conn.commit()
+                cache.bump_version(cache.SUMMARIES_NAMESPACE)
+                logging.debug(f"Updated summary {summary_id} ({', '.join(assignments)}): {cursor.rowcount} row(s) affected.")
+    except Exception as e:
+        logging.error(f"Failed to update summary {summary_id}: {e}", exc_info=True)
+        raise e
 
+def complete_summary_import(
+    summary_id: int,
+    total_records_inserted: int,
+    import_duration: float,
+    rows_per_second: float,
+    stage_durations: dict,
+    import_metrics: dict | None = None
+):
+    """
+    Menutup sebuah import: menyimpan jumlah record final, durasi end-to-end
+    (dari request diterima sampai recount), throughput, dan rincian durasi per tahap.
+    """
+    assignments = {
+        "total_records_inserted": total_records_inserted,
+        "import_duration": round(import_duration, 3),
+        "rows_per_second": round(rows_per_second, 3),
+        "stage_durations": json.dumps(stage_durations),
+    }
+    if import_metrics is not None:
+        assignments["import_metrics"] = json.dumps(import_metrics)
+    _update_summary_columns(summary_id, assignments)
+
+def save_summary_sketches(summary_id: int, sketches: dict):
+    """Menyimpan sketch HyperLogLog per kolom (lihat app.hll) untuk sebuah summary."""
+    if not sketches:
+        return
+    insert_query = sql.SQL("""
+        INSERT INTO summary_distinct_sketches (summary_id, column_name, precision, registers, created_at)
+        VALUES %s
+        ON CONFLICT (summary_id, column_name) DO UPDATE
+        SET precision = EXCLUDED.precision, registers = EXCLUDED.registers, created_at = EXCLUDED.created_at
+    """)
+    rows = [
+        (summary_id, column, sketch.precision, psycopg2.Binary(sketch.to_bytes()), datetime.now())
+        for column, sketch in sketches.items()
+    ]
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(update_query, (total_records_inserted, summary_id))
-                logging.warning(f"--- [DIAGNOSTIC] Update query executed. Rows affected: {cursor.rowcount} ---")
+                extras.execute_values(cursor, insert_query, rows)
                 conn.commit()
-                logging.warning(f"--- [DIAGNOSTIC] Update committed for summary_id: {summary_id} ---")
+                logging.debug(f"Saved {len(rows)} distinct-count sketches for summary {summary_id}.")
     except Exception as e:
-        logging.error(f"Failed to update summary total records: {e}", exc_info=True)
+        logging.error(f"Failed to save sketches for summary {summary_id}: {e}", exc_info=True)
         raise e
 
 def count_transactions_for_summary(summary_id: int) -> int:
@@ -236,16 +271,13 @@ def count_transactions_for_summary(summary_id: int) -> int:
     count_query = sql.SQL("""
         SELECT COUNT(*) FROM {} WHERE daily_summary_id = %s
     """).format(sql.Identifier(TRANSACTION_TABLE))
-    logging.warning(f"--- [DIAGNOSTIC] count_transactions_for_summary querying for summary_id: {summary_id} ---")
 
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 conn.rollback() # Clear any pending transaction state
                 cursor.execute(count_query, (summary_id,))
-                count = cursor.fetchone()[0]
-                logging.warning(f"--- [DIAGNOSTIC] count_transactions_for_summary for summary_id {summary_id} returned: {count} ---")
-                return count
+                return cursor.fetchone()[0]
     except Exception as e:
         logging.error(f"Failed to count transactions for summary_id {summary_id}: {e}", exc_info=True)
         raise e
@@ -254,7 +286,6 @@ def insert_mor_if_not_exists(mor_id: int, mor: str):
     """
     Memasukkan mor_id dan mor ke tabel_mor jika belum ada.
     """
-    logging.warning(f"[DIAGNOSTIC] Attempting to insert MOR: mor_id={mor_id}, mor='{mor}'")
     check_query = sql.SQL("SELECT mor_id FROM tabel_mor WHERE mor_id = %s")
     insert_query = sql.SQL("INSERT INTO tabel_mor (mor_id, mor, created_at, updated_at) VALUES (%s, %s, NOW(), NOW()) ON CONFLICT (mor_id) DO NOTHING")
 
@@ -264,12 +295,9 @@ def insert_mor_if_not_exists(mor_id: int, mor: str):
                 cursor.execute(check_query, (mor_id,))
                 existing_mor = cursor.fetchone()
                 if existing_mor is None:
-                    logging.warning(f"[DIAGNOSTIC] MOR {mor_id} not found. Inserting...")
                     cursor.execute(insert_query, (mor_id, mor))
                     conn.commit()
-                    logging.warning(f"[DIAGNOSTIC] Successfully inserted new MOR: {mor_id} - {mor}")
-                else:
-                    logging.warning(f"[DIAGNOSTIC] MOR {mor_id} - {mor} already exists. Skipping insert.")
+                    logging.info(f"Inserted new MOR: {mor_id} - {mor}")
     except Exception as e:
         logging.error(f"Failed to insert MOR {mor_id} - {mor}: {e}", exc_info=True)
         raise e
@@ -280,7 +308,6 @@ def get_spbu_details_by_no_spbu(no_spbu: str) -> Tuple[int | None, str | None, s
     berdasarkan nomor SPBU.
     Mengembalikan tuple (mor, provinsi, kota_kabupaten) atau (None, None, None) jika tidak ditemukan.
     """
-    logging.warning(f"[DIAGNOSTIC] Looking up SPBU details for no_spbu: {no_spbu}")
     query = sql.SQL("SELECT mor, provinsi, kota_kabupaten FROM tabel_spbu_master WHERE no_spbu = %s")
     
     try:
@@ -289,10 +316,9 @@ def get_spbu_details_by_no_spbu(no_spbu: str) -> Tuple[int | None, str | None, s
                 cursor.execute(query, (no_spbu,))
                 result = cursor.fetchone()
                 if result:
-                    logging.warning(f"[DIAGNOSTIC] Found SPBU details: {result}")
                     return result
                 else:
-                    logging.warning(f"[DIAGNOSTIC] SPBU details not found for no_spbu: {no_spbu}")
+                    logging.debug(f"SPBU details not found for no_spbu: {no_spbu}")
                     return None, None, None
     except Exception as e:
         logging.error(f"Failed to get SPBU details for no_spbu {no_spbu}: {e}", exc_info=True)
@@ -306,7 +332,6 @@ def get_all_spbu_details(no_spbu_list: List[str]) -> dict:
     if not no_spbu_list:
         return {}
 
-    logging.warning(f"[DIAGNOSTIC] Looking up details for {len(no_spbu_list)} unique SPBUs.")
     query = sql.SQL("SELECT no_spbu, mor, provinsi, kota_kabupaten FROM tabel_spbu_master WHERE no_spbu = ANY(%s)")
     
     spbu_details_map = {}
@@ -317,7 +342,7 @@ def get_all_spbu_details(no_spbu_list: List[str]) -> dict:
                 results = cursor.fetchall()
                 for row in results:
                     spbu_details_map[row[0]] = (row[1], row[2], row[3])
-        logging.warning(f"[DIAGNOSTIC] Found details for {len(spbu_details_map)} SPBUs.")
+        logging.debug(f"Found details for {len(spbu_details_map)} of {len(set(no_spbu_list))} SPBUs.")
         return spbu_details_map
     except Exception as e:
         logging.error(f"Failed to get all SPBU details: {e}", exc_info=True)
@@ -466,7 +491,7 @@ def insert_special_anomaly_criteria(db: Session):
         {
             "criteria_code": "TRANSACTION_INTERVAL_TOO_CLOSE",
             "criteria_name": "Interval Transaksi Terlalu Dekat",
-            "violation_rule": "interval < value seconds", # Placeholder for Python logic
+            "violation_rule": "seconds_since_prev() < value", # Dievaluasi oleh implementasi bawaan (lihat crud/analysis_crud.py)
             "value": "120", # 2 minutes in seconds
             "description": "Deteksi transaksi yang dilakukan dalam interval waktu terlalu dekat untuk plat nomor yang sama."
         },
@@ -559,6 +584,7 @@ def initialize_default_anomaly_rules(db_session: Session):
     
     try:
         db_session.commit()
+        cache.bump_version(cache.TEMPLATES_NAMESPACE)
         logging.info(f"All criteria linked to default template ID: {template_id}")
     except Exception as e:
         db_session.rollback()
@@ -0,0 +1,208 @@
+import datetime
+import decimal
+import json
+import logging
+import os
+
+from psycopg2 import sql
+
+# Kebijakan jika EXPLAIN menunjukkan Seq Scan penuh pada tabel besar:
+# 'warn' (default) hanya mencatat log, 'reject' menolak filter, 'off' tidak menjalankan EXPLAIN.
+FILTER_SEQSCAN_POLICY = os.getenv("FILTER_SEQSCAN_POLICY", "warn").lower()
+# Seq Scan pada tabel dengan estimasi baris di bawah batas ini dianggap wajar
+FILTER_SEQSCAN_ROW_THRESHOLD = int(os.getenv("FILTER_SEQSCAN_ROW_THRESHOLD", "1000000"))
+
+# Kolom csv_import_log yang boleh difilter beserta tipenya
+COLUMN_TYPES = {
+    'tanggal': 'date',
+    'jam': 'time',
+    'mor': 'text',
+    'provinsi': 'text',
+    'kota_kabupaten': 'text',
+    'no_spbu': 'text',
+    'no_nozzle': 'text',
+    'no_dispenser': 'text',
+    'produk': 'text',
+    'volume_liter': 'numeric',
+    'penjualan_rupiah': 'numeric',
+    'operator': 'text',
+    'mode_transaksi': 'text',
+    'plat_nomor': 'text',
+    'nik': 'text',
+    'sektor_non_kendaraan': 'text',
+    'jumlah_roda_kendaraan': 'text',
+    'kuota': 'text',
+    'warna_plat': 'text',
+}
+
+# Kolom dengan indeks GIN pg_trgm (lihat migrasi d9f3b6a0c182): pencarian prefix maupun substring
+# (LIKE 'x%' / '%x%') tetap memakai indeks. Kolom teks lain tidak punya indeks untuk LIKE: btree biasa
+# hanya melayani LIKE 'x%' dengan collation C atau text_pattern_ops, dan tidak ada migrasi yang membuatnya.
+TRIGRAM_COLUMNS = {'plat_nomor', 'nik', 'no_spbu'}
+
+_COMPARISON_OPERATORS = {'=', '!=', '<', '<=', '>', '>=', 'BETWEEN', 'IN', 'NOT IN'}
+
+# Whitelist operator per tipe kolom
+OPERATORS = {
+    'text': {'=', '!=', 'IN', 'NOT IN', 'STARTS_WITH', 'CONTAINS', 'NOT_CONTAINS'},
+    'numeric': _COMPARISON_OPERATORS,
+    'date': _COMPARISON_OPERATORS,
+    'time': _COMPARISON_OPERATORS,
+}
+
+# Nama operator lama yang dikirim frontend. 'LIKE' dulu selalu berarti '%value%'.
+OPERATOR_ALIASES = {
+    '<>': '!=',
+    'LIKE': 'CONTAINS',
+    'NOT LIKE': 'NOT_CONTAINS',
+    'STARTS WITH': 'STARTS_WITH',
+}
+
+class FilterError(ValueError):
+    """Filter tidak valid (kolom/operator tidak dikenal, nilai tidak sesuai tipe) atau ditolak oleh EXPLAIN."""
+
+def escape_like(value: str) -> str:
+    """Meng-escape karakter wildcard LIKE agar nilai dicocokkan apa adanya."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def normalize_operator(operator) -> str:
+    normalized = " ".join(str(operator).strip().upper().split())
+    return OPERATOR_ALIASES.get(normalized, normalized)
+
+def coerce_value(field: str, column_type: str, value):
+    """Mengubah nilai filter ke tipe kolom sehingga perbandingan tidak memaksa cast pada kolom."""
+    try:
+        if column_type == 'numeric':
+            return decimal.Decimal(str(value))
+        if column_type == 'date':
+            # tanggal disimpan sebagai teks YYYY-MM-DD, urutan leksikografis = urutan tanggal
+            return datetime.date.fromisoformat(str(value)).isoformat()
+        if column_type == 'time':
+            return datetime.time.fromisoformat(str(value)).strftime('%H:%M:%S')
+    except (ValueError, decimal.InvalidOperation):
+        raise FilterError(f"Nilai '{value}' tidak valid untuk kolom {field} ({column_type}).")
+    return str(value)
+
+def compile_condition(condition: dict):
+    """
+    Mengompilasi satu kondisi {field, operator, value} menjadi predikat SQL yang sargable.
+    Mengembalikan (sql.Composable, params) atau None jika nilai kosong (kondisi diabaikan).
+    """
+    field = condition.get('field')
+    operator = condition.get('operator')
+    value = condition.get('value')
+    if not field or not operator or value is None:
+        return None
+
+    column_type = COLUMN_TYPES.get(field)
+    if column_type is None:
+        raise FilterError(f"Kolom '{field}' tidak dapat difilter.")
+    op = normalize_operator(operator)
+    if op not in OPERATORS[column_type]:
+        raise FilterError(f"Operator '{operator}' tidak diizinkan untuk kolom {field} ({column_type}).")
+
+    column = sql.Identifier(field)
+
+    if op in ('IN', 'NOT IN'):
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            raise FilterError(f"Operator {op} pada kolom {field} membutuhkan minimal satu nilai.")
+        predicate = "{} = ANY(%s)" if op == 'IN' else "NOT ({} = ANY(%s))"
+        return sql.SQL(predicate).format(column), [[coerce_value(field, column_type, v) for v in values]]
+
+    if op == 'BETWEEN':
+        if not isinstance(value, list) or len(value) != 2:
+            raise FilterError(f"Operator BETWEEN pada kolom {field} membutuhkan dua nilai [awal, akhir].")
+        low, high = (coerce_value(field, column_type, v) for v in value)
+        return sql.SQL("{} BETWEEN %s AND %s").format(column), [low, high]
+
+    if op in ('STARTS_WITH', 'CONTAINS', 'NOT_CONTAINS'):
+        pattern = escape_like(str(value))
+        # Prefix dan substring hanya memakai indeks pada TRIGRAM_COLUMNS; di kolom lain kondisi ini dievaluasi
+        # pada baris hasil indeks lain (mis. daily_summary_id) atau lewat Seq Scan yang diperiksa check_filter_plan
+        pattern = f"{pattern}%" if op == 'STARTS_WITH' else f"%{pattern}%"
+        if op == 'NOT_CONTAINS':
+            return sql.SQL("{} NOT LIKE %s").format(column), [pattern]
+        if field not in TRIGRAM_COLUMNS:
+            logging.debug(f"Filter LIKE pada kolom {field} tidak didukung indeks trigram.")
+        return sql.SQL("{} LIKE %s").format(column), [pattern]
+
+    return sql.SQL("{} {} %s").format(column, sql.SQL(op)), [coerce_value(field, column_type, value)]
+
+def compile_filters(filters):
+    """
+    Mengompilasi filter (daftar grup; kondisi dalam grup di-OR, antar grup di-AND)
+    menjadi (sql.Composable atau None, params).
+    """
+    where_clauses = []
+    params = []
+    for group in filters or []:
+        group_clauses = []
+        for condition in group.get('conditions', []):
+            compiled = compile_condition(condition)
+            if compiled is None:
+                continue
+            clause, clause_params = compiled
+            group_clauses.append(clause)
+            params.extend(clause_params)
+        if group_clauses:
+            where_clauses.append(sql.SQL("({})").format(sql.SQL(" OR ").join(group_clauses)))
+
+    if not where_clauses:
+        return None, params
+    return sql.SQL(" AND ").join(where_clauses), params
+
+def apply_filters(base_query, filters):
+    """Menambahkan filter ke query yang sudah memiliki klausa WHERE."""
+    where_clause, params = compile_filters(filters)
+    if where_clause is None:
+        return base_query, params
+    return base_query + sql.SQL(" AND ") + where_clause, params
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+def explain_plan(cursor, query, params) -> dict:
+    """
+    Menjalankan EXPLAIN (tanpa ANALYZE) dan merangkum: total cost, estimasi baris,
+    serta tabel yang dibaca dengan Seq Scan beserta estimasi jumlah barisnya.
+    """
+    cursor.execute(sql.SQL("EXPLAIN (FORMAT JSON) ") + query, params)
+    plan_json = cursor.fetchone()[0]
+    if isinstance(plan_json, str):
+        plan_json = json.loads(plan_json)
+    plan = plan_json[0]['Plan']
+
+    seq_scans = sorted({node['Relation Name'] for node in _plan_nodes(plan) if node.get('Node Type') == 'Seq Scan'})
+    table_rows = {}
+    if seq_scans:
+        cursor.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)", (seq_scans,))
+        table_rows = dict(cursor.fetchall())
+    return {
+        'total_cost': plan.get('Total Cost'),
+        'estimated_rows': plan.get('Plan Rows'),
+        'seq_scans': [{'table': table, 'table_rows': table_rows.get(table)} for table in seq_scans],
+    }
+
+def check_filter_plan(cursor, query, params, policy: str = None) -> dict | None:
+    """
+    Memeriksa rencana eksekusi query ber-filter. Seq Scan pada tabel dengan lebih dari
+    FILTER_SEQSCAN_ROW_THRESHOLD baris dicatat sebagai warning, atau ditolak dengan
+    FilterError jika policy = 'reject'. Mengembalikan ringkasan EXPLAIN (None jika policy = 'off').
+    """
+    policy = (policy or FILTER_SEQSCAN_POLICY).lower()
+    if policy == 'off':
+        return None
+
+    summary = explain_plan(cursor, query, params)
+    full_scans = [scan for scan in summary['seq_scans'] if (scan['table_rows'] or 0) > FILTER_SEQSCAN_ROW_THRESHOLD]
+    summary['full_scan'] = bool(full_scans)
+    if full_scans:
+        tables = ", ".join(f"{scan['table']} (~{scan['table_rows']} baris)" for scan in full_scans)
+        message = f"Filter menyebabkan Seq Scan penuh pada {tables}."
+        if policy == 'reject':
+            raise FilterError(message + " Persempit filter atau gunakan kolom yang terindeks.")
+        logging.warning(message)
+    return summary
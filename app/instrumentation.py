@@ -0,0 +1,109 @@
+import logging
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+# 'auto' (default): aktif hanya jika logger import berada di level DEBUG.
+# 'on'/'off': paksa aktif/nonaktif tanpa melihat level log.
+IMPORT_INSTRUMENTATION = os.getenv("IMPORT_INSTRUMENTATION", "auto").lower()
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss_bytes() -> int:
+    """
+    Mengembalikan RSS proses saat ini dalam byte.
+    Membaca /proc/self/statm (Linux/Docker); jika tidak tersedia, jatuh ke ru_maxrss.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class SpanRecorder:
+    """
+    Mencatat span waktu (wall time dan delta memori) untuk tahap-tahap sebuah proses.
+    Setiap span adalah dict biasa sehingga bisa diisi atribut tambahan
+    (mis. rows_evaluated, hits) di dalam blok `with` dan langsung disimpan sebagai JSON.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, kind: str = "stage", **attrs):
+        record = {"name": name, "kind": kind, **attrs}
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - start, 6)
+            record["memory_delta_bytes"] = current_rss_bytes() - rss_before
+            self.spans.append(record)
+
+    def of_kind(self, kind: str):
+        return [span for span in self.spans if span["kind"] == kind]
+
+    def to_dict(self) -> dict:
+        return {
+            "total_seconds": round(time.perf_counter() - self._started, 6),
+            "stages": self.of_kind("stage"),
+            "rules": self.of_kind("rule"),
+        }
+
+class ImportInstrumentation(SpanRecorder):
+    """
+    Instrumentasi terstruktur untuk import CSV/XLSX: durasi per tahap
+    (read, parse, clean, dedupe, aggregate, insert, recount), jumlah baris, dan byte diproses.
+
+    Durasi per tahap selalu dicatat (hanya perf_counter) agar csv_summary_master_daily
+    punya rincian waktu untuk setiap import. Metrik lengkap (delta memori, counter)
+    di-gate oleh IMPORT_INSTRUMENTATION atau level log sehingga import di produksi
+    tidak membayar biaya pengukuran yang tidak dibutuhkan.
+    """
+
+    def __init__(self, logger: logging.Logger, enabled: bool | None = None):
+        super().__init__()
+        self.logger = logger
+        self.enabled = import_instrumentation_enabled(logger) if enabled is None else enabled
+        self.counters = {}
+        self.stage_durations = {}
+
+    @contextmanager
+    def stage(self, name: str, **attrs):
+        start = time.perf_counter()
+        try:
+            if not self.enabled:
+                yield {}
+            else:
+                with self.span(name, **attrs) as record:
+                    yield record
+        finally:
+            self.stage_durations[name] = round(time.perf_counter() - start, 6)
+
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self._started
+
+    def count(self, key: str, value):
+        if self.enabled:
+            self.counters[key] = int(value)
+
+    def to_dict(self) -> dict | None:
+        if not self.enabled:
+            return None
+        return {
+            "total_seconds": round(time.perf_counter() - self._started, 6),
+            "stages": {span["name"]: span["wall_seconds"] for span in self.spans},
+            "memory_delta_bytes": {span["name"]: span["memory_delta_bytes"] for span in self.spans},
+            "counters": dict(self.counters),
+        }
+
+def import_instrumentation_enabled(logger: logging.Logger) -> bool:
+    if IMPORT_INSTRUMENTATION in ("1", "true", "on"):
+        return True
+    if IMPORT_INSTRUMENTATION in ("0", "false", "off"):
+        return False
+    return logger.isEnabledFor(logging.DEBUG)
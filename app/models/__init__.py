@@ -3,6 +3,7 @@ from .all_models import (
     Base,
     SQLiteARRAY,
     CsvSummaryMasterDaily,
+    SummaryDistinctSketch,
     AnomalyTemplateMaster,
     TransactionAnomalyCriteria,
     SpecialAnomalyCriteria,
@@ -18,6 +19,8 @@ from .all_models import (
     AnomalyExecutionBatch,
     CsvImportLog,
     TabelMor,
+    TransactionRollupDaily,
+    AnomalyRollupDaily,
 )
 
 # Define what gets imported with a 'from app.models import *'
@@ -25,6 +28,7 @@ __all__ = [
     "Base",
     "SQLiteARRAY",
     "CsvSummaryMasterDaily",
+    "SummaryDistinctSketch",
     "AnomalyTemplateMaster",
     "TransactionAnomalyCriteria",
     "SpecialAnomalyCriteria",
@@ -40,4 +44,6 @@ __all__ = [
     "AnomalyExecutionBatch",
     "CsvImportLog",
     "TabelMor",
+    "TransactionRollupDaily",
+    "AnomalyRollupDaily",
 ]
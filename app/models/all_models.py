@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON, Float, ForeignKey, Numeric, PrimaryKeyConstraint, BigInteger # Import Numeric, PrimaryKeyConstraint, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON, Float, ForeignKey, Numeric, PrimaryKeyConstraint, BigInteger, Index, text, LargeBinary # Import Numeric, PrimaryKeyConstraint, BigInteger
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import TypeDecorator # Import TypeDecorator
 from ..db_base import Base # Import Base from app.db_base
@@ -23,6 +23,10 @@ class SQLiteARRAY(TypeDecorator):
 # --- CsvSummaryMasterDaily (moved from where it was a duplicate definition) ---
 class CsvSummaryMasterDaily(Base):
     __tablename__ = 'csv_summary_master_daily'
+    __table_args__ = (
+        # Keyset pagination listing summary berdasarkan import_datetime (lihat GET /v1/summary/daily)
+        Index('ix_csv_summary_master_daily_import_datetime', 'import_datetime', 'summary_id'),
+    )
     summary_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     import_datetime = Column(DateTime, nullable=False)
     import_duration = Column(Numeric(20, 3))
@@ -54,9 +58,23 @@ class CsvSummaryMasterDaily(Base):
     total_kota_kabupaten = Column(Numeric(20, 3))
     total_no_spbu = Column(Numeric(20, 3))
     numeric_totals = Column(JSON)
+    import_metrics = Column(JSON)
+    rows_per_second = Column(Numeric(20, 3))
+    stage_durations = Column(JSON)
+    # Statistik kolom dari baris tersimpan untuk perencanaan aturan anomali (lihat app/rule_planner.py)
+    column_stats = Column(JSON)
 
     logs = relationship("CsvImportLog", back_populates="summary")
 
+# Sketch HyperLogLog per kolom per summary (app/hll.py); digabung untuk distinct count lintas summary
+class SummaryDistinctSketch(Base):
+    __tablename__ = 'summary_distinct_sketches'
+    summary_id = Column(Integer, ForeignKey('csv_summary_master_daily.summary_id', ondelete="CASCADE"), primary_key=True)
+    column_name = Column(String(50), primary_key=True)
+    precision = Column(Integer, nullable=False)
+    registers = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 # --- Anomaly Models and Linker Tables ---
 class AnomalyTemplateMaster(Base):
     __tablename__ = 'anomaly_template_master'
@@ -152,6 +170,12 @@ class AnomalyResult(Base):
     __tablename__ = 'anomaly_results'
     __table_args__ = (
         PrimaryKeyConstraint('execution_id', 'transaction_id_asersi'),
+        # Partial index untuk ekspor source 'anomalies': hanya baris yang ter-flag per execution/summary
+        Index('ix_anomaly_results_execution_flagged', 'execution_id', 'summary_id', 'transaction_id_asersi',
+              postgresql_where=text('is_anomalous')),
+        # Keyset pagination API hasil: per execution (opsional hanya anomali) dan per summary
+        Index('ix_anomaly_results_execution_anomalous', 'execution_id', 'is_anomalous', 'transaction_id_asersi'),
+        Index('ix_anomaly_results_summary', 'summary_id', 'execution_id', 'transaction_id_asersi'),
     )
     execution_id = Column(String(50), ForeignKey('anomaly_executions.execution_id', ondelete="CASCADE"), nullable=False)
     transaction_id_asersi = Column(String(50), nullable=False)
@@ -171,6 +195,12 @@ class AnomalyResult(Base):
 
 class AnomalyExecution(Base):
     __tablename__ = 'anomaly_executions'
+    __table_args__ = (
+        # Paling banyak satu execution in-flight per fingerprint (template + isi kriteria + set summary),
+        # sehingga submission identik yang bersamaan tidak menjalankan pekerjaan ganda
+        Index('ux_anomaly_executions_inflight_fingerprint', 'submission_fingerprint', unique=True,
+              postgresql_where=text("status IN ('QUEUED', 'PENDING', 'RUNNING')")),
+    )
     execution_id = Column(String(50), primary_key=True)
     template_id = Column(Integer, ForeignKey('anomaly_template_master.template_id'), nullable=False)
     execution_timestamp = Column(DateTime(timezone=True), nullable=False, default=datetime.now)
@@ -179,6 +209,7 @@ class AnomalyExecution(Base):
     rules_applied = Column(SQLiteARRAY, nullable=False)
     rules_config = Column(JSON)
     total_batches_processed = Column(Integer, default=0)
+    submission_fingerprint = Column(String(64))
 
     results = relationship("AnomalyResult", back_populates="execution")
 
@@ -224,7 +255,7 @@ class CsvImportLog(Base):
     jumlah_roda_kendaraan = Column(String)
     kuota = Column(String)
     warna_plat = Column(String)
-    daily_summary_id = Column(BigInteger, ForeignKey('csv_summary_master_daily.summary_id'))
+    daily_summary_id = Column(BigInteger, ForeignKey('csv_summary_master_daily.summary_id'), index=True)
     import_attempt_count = Column(Integer, default=1)
     batch_original_duplicate_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -237,4 +268,33 @@ class TabelMor(Base):
     mor_id = Column(Integer, primary_key=True, index=True)
     mor = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# --- Rollup harian lintas summary (lihat app/rollup.py) ---
+# Grain: (tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk). Dimensi NULL disimpan sebagai ''
+# agar bisa menjadi bagian primary key dan target ON CONFLICT.
+class TransactionRollupDaily(Base):
+    __tablename__ = 'transaction_rollup_daily'
+    tanggal = Column(String(10), primary_key=True)
+    mor = Column(String, primary_key=True, default='')
+    provinsi = Column(String, primary_key=True, default='')
+    kota_kabupaten = Column(String, primary_key=True, default='')
+    no_spbu = Column(String, primary_key=True, default='')
+    produk = Column(String, primary_key=True, default='')
+    transaction_count = Column(BigInteger, nullable=False, default=0)
+    total_volume_liter = Column(Numeric(20, 3), nullable=False, default=0)
+    total_penjualan_rupiah = Column(Numeric(20, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnomalyRollupDaily(Base):
+    __tablename__ = 'anomaly_rollup_daily'
+    execution_id = Column(String(50), ForeignKey('anomaly_executions.execution_id', ondelete="CASCADE"), primary_key=True)
+    tanggal = Column(String(10), primary_key=True)
+    mor = Column(String, primary_key=True, default='')
+    provinsi = Column(String, primary_key=True, default='')
+    kota_kabupaten = Column(String, primary_key=True, default='')
+    no_spbu = Column(String, primary_key=True, default='')
+    produk = Column(String, primary_key=True, default='')
+    anomalous_transactions = Column(BigInteger, nullable=False, default=0)
+    anomalous_volume_liter = Column(Numeric(20, 3), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
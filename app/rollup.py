@@ -0,0 +1,110 @@
+import logging
+
+from sqlalchemy.orm import Session
+
+# Rollup harian lintas summary pada grain (tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk).
+# transaction_rollup_daily diperbarui secara inkremental di transaksi yang sama dengan bulk insert import;
+# anomaly_rollup_daily dihitung ulang per execution saat hasil analisis disimpan.
+ROLLUP_DIMENSIONS = ('tanggal', 'mor', 'provinsi', 'kota_kabupaten', 'no_spbu', 'produk')
+
+# Hanya baris yang benar-benar baru pada import ini (import_attempt_count = 1) yang ditambahkan:
+# transaksi yang sudah ada dan di-upsert ulang sudah terhitung dan nilainya tidak berubah.
+# ORDER BY menjaga urutan lock baris rollup tetap sama antar import yang berjalan bersamaan.
+APPLY_IMPORT_SQL = """
+    INSERT INTO transaction_rollup_daily (
+        tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk,
+        transaction_count, total_volume_liter, total_penjualan_rupiah, updated_at
+    )
+    SELECT
+        tanggal, COALESCE(mor, ''), COALESCE(provinsi, ''), COALESCE(kota_kabupaten, ''),
+        COALESCE(no_spbu, ''), COALESCE(produk, ''),
+        COUNT(*), COALESCE(SUM(volume_liter), 0), COALESCE(SUM(penjualan_rupiah), 0), now()
+    FROM csv_import_log
+    WHERE daily_summary_id = %(summary_id)s AND import_attempt_count = 1
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ORDER BY 1, 2, 3, 4, 5, 6
+    ON CONFLICT (tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk) DO UPDATE SET
+        transaction_count = transaction_rollup_daily.transaction_count + EXCLUDED.transaction_count,
+        total_volume_liter = transaction_rollup_daily.total_volume_liter + EXCLUDED.total_volume_liter,
+        total_penjualan_rupiah = transaction_rollup_daily.total_penjualan_rupiah + EXCLUDED.total_penjualan_rupiah,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Kontribusi transaksi yang akan dihapus (ID dengan pola LIKE tertentu, mis. data benchmark) dikurangi dari
+# rollup sebelum DELETE, di transaksi yang sama. Setiap transaksi terhitung tepat sekali saat pertama kali
+# masuk (lihat APPLY_IMPORT_SQL), jadi pengurangan ini mengembalikan rollup ke angka tanpa transaksi tersebut.
+REMOVE_TRANSACTIONS_SQL = """
+    WITH removed AS (
+        SELECT
+            tanggal, COALESCE(mor, '') AS mor, COALESCE(provinsi, '') AS provinsi,
+            COALESCE(kota_kabupaten, '') AS kota_kabupaten, COALESCE(no_spbu, '') AS no_spbu,
+            COALESCE(produk, '') AS produk, COUNT(*) AS transaction_count,
+            COALESCE(SUM(volume_liter), 0) AS total_volume_liter,
+            COALESCE(SUM(penjualan_rupiah), 0) AS total_penjualan_rupiah
+        FROM csv_import_log
+        WHERE transaction_id_asersi LIKE %(pattern)s
+        GROUP BY 1, 2, 3, 4, 5, 6
+        ORDER BY 1, 2, 3, 4, 5, 6
+    )
+    UPDATE transaction_rollup_daily t SET
+        transaction_count = t.transaction_count - removed.transaction_count,
+        total_volume_liter = t.total_volume_liter - removed.total_volume_liter,
+        total_penjualan_rupiah = t.total_penjualan_rupiah - removed.total_penjualan_rupiah,
+        updated_at = now()
+    FROM removed
+    WHERE t.tanggal = removed.tanggal AND t.mor = removed.mor AND t.provinsi = removed.provinsi
+      AND t.kota_kabupaten = removed.kota_kabupaten AND t.no_spbu = removed.no_spbu AND t.produk = removed.produk
+"""
+
+DELETE_EMPTY_ROLLUPS_SQL = "DELETE FROM transaction_rollup_daily WHERE transaction_count <= 0"
+
+DELETE_EXECUTION_SQL = "DELETE FROM anomaly_rollup_daily WHERE execution_id = %(execution_id)s"
+
+# Membaca baris ter-flag lewat partial index ix_anomaly_results_execution_flagged
+REFRESH_EXECUTION_SQL = """
+    INSERT INTO anomaly_rollup_daily (
+        execution_id, tanggal, mor, provinsi, kota_kabupaten, no_spbu, produk,
+        anomalous_transactions, anomalous_volume_liter, updated_at
+    )
+    SELECT
+        r.execution_id, l.tanggal, COALESCE(l.mor, ''), COALESCE(l.provinsi, ''), COALESCE(l.kota_kabupaten, ''),
+        COALESCE(l.no_spbu, ''), COALESCE(l.produk, ''),
+        COUNT(*), COALESCE(SUM(l.volume_liter), 0), now()
+    FROM anomaly_results r
+    JOIN csv_import_log l ON l.transaction_id_asersi = r.transaction_id_asersi
+    WHERE r.execution_id = %(execution_id)s AND r.is_anomalous
+    GROUP BY 1, 2, 3, 4, 5, 6, 7
+"""
+
+def apply_import(cursor, summary_id: int) -> int:
+    """
+    Menambahkan transaksi baru sebuah import ke transaction_rollup_daily memakai cursor psycopg2
+    milik bulk insert, sehingga rollup ikut ter-commit (atau ter-rollback) bersama import.
+    Mengembalikan jumlah baris rollup yang disentuh.
+    """
+    cursor.execute(APPLY_IMPORT_SQL, {'summary_id': summary_id})
+    logging.debug(f"Rollup import summary {summary_id}: {cursor.rowcount} baris rollup diperbarui.")
+    return cursor.rowcount
+
+def remove_transactions(cursor, transaction_id_pattern: str) -> int:
+    """
+    Mengurangi transaksi dengan transaction_id_asersi LIKE pattern dari transaction_rollup_daily.
+    Harus dipanggil dengan cursor psycopg2 yang sama, sebelum DELETE transaksinya dan sebelum commit.
+    Mengembalikan jumlah baris rollup yang dikurangi.
+    """
+    cursor.execute(REMOVE_TRANSACTIONS_SQL, {'pattern': transaction_id_pattern})
+    updated = cursor.rowcount
+    cursor.execute(DELETE_EMPTY_ROLLUPS_SQL)
+    logging.debug(f"Rollup: {updated} baris dikurangi untuk transaksi '{transaction_id_pattern}', {cursor.rowcount} baris kosong dihapus.")
+    return updated
+
+def refresh_execution_anomalies(db: Session, execution_id: str) -> int:
+    """
+    Menghitung ulang anomaly_rollup_daily untuk satu execution di dalam transaksi Session
+    (hasil analisis harus sudah di-flush). Analisis ulang execution yang sama menggantikan angkanya.
+    """
+    connection = db.connection()
+    connection.exec_driver_sql(DELETE_EXECUTION_SQL, {'execution_id': execution_id})
+    result = connection.exec_driver_sql(REFRESH_EXECUTION_SQL, {'execution_id': execution_id})
+    logging.debug(f"Rollup anomali execution {execution_id}: {result.rowcount} baris.")
+    return result.rowcount
@@ -0,0 +1,450 @@
+import ast
+import io
+import tokenize
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Bahasa ekspresi untuk SpecialAnomalyCriteria.violation_rule. Ekspresi di-parse sekali dengan `ast`
+# (sintaks Python; bentuk SQL sederhana seperti `=`, `<>`, AND/OR/NOT, IS [NOT] NULL juga diterima),
+# diperiksa terhadap whitelist, lalu dikompilasi menjadi operasi kolom pandas. Tidak ada eval:
+# node yang tidak dikenal ditolak, sehingga setiap ekspresi yang lolos validasi pasti tervektorisasi.
+
+MAX_EXPRESSION_LENGTH = 1000
+
+# Kolom DataFrame transaksi (lihat crud/analysis_crud._load_transactions) beserta tipenya
+COLUMN_TYPES = {
+    'transaction_id_asersi': 'text',
+    'tanggal': 'text',
+    'jam': 'text',
+    'mor': 'text',
+    'provinsi': 'text',
+    'kota_kabupaten': 'text',
+    'no_spbu': 'text',
+    'no_nozzle': 'text',
+    'no_dispenser': 'text',
+    'produk': 'text',
+    'volume_liter': 'numeric',
+    'penjualan_rupiah': 'numeric',
+    'operator': 'text',
+    'mode_transaksi': 'text',
+    'plat_nomor': 'text',
+    'nik': 'text',
+    'sektor_non_kendaraan': 'text',
+    'jumlah_roda_kendaraan': 'text',
+    'kuota': 'numeric',
+    'warna_plat': 'text',
+    'batch_original_duplicate_count': 'numeric',
+    'transaction_datetime': 'datetime',
+}
+
+# Fungsi per baris: (tipe argumen, tipe hasil, implementasi atas Series)
+SCALAR_FUNCTIONS = {
+    'lower': ('text', 'text', lambda s: s.str.lower()),
+    'upper': ('text', 'text', lambda s: s.str.upper()),
+    'strip': ('text', 'text', lambda s: s.str.strip()),
+    'length': ('text', 'numeric', lambda s: s.str.len().astype(float)),
+    'abs': ('numeric', 'numeric', lambda s: s.abs()),
+    'hour': ('datetime', 'numeric', lambda s: s.dt.hour.astype(float)),
+}
+
+# Fungsi window atas partisi plat_nomor yang diurutkan menurut waktu transaksi; argumennya harus nama kolom
+WINDOW_FUNCTIONS = {'prev': 1, 'next': 1, 'seconds_since_prev': 0, 'seconds_until_next': 0}
+
+# Agregat per grup atas seluruh transaksi yang dianalisis; argumennya harus nama kolom
+AGGREGATE_FUNCTIONS = {'count_by': 1, 'sum_by': 2}
+
+# Kata kunci SQL (huruf besar) dan NULL (huruf apa pun) yang diterjemahkan ke Python
+_SQL_KEYWORDS = {'AND': 'and', 'OR': 'or', 'NOT': 'not', 'IS': 'is', 'IN': 'in', 'NULL': 'None'}
+
+_COMPARISONS = {
+    ast.Eq: lambda left, right: left == right,
+    ast.NotEq: lambda left, right: left != right,
+    ast.Lt: lambda left, right: left < right,
+    ast.LtE: lambda left, right: left <= right,
+    ast.Gt: lambda left, right: left > right,
+    ast.GtE: lambda left, right: left >= right,
+}
+
+_ARITHMETIC = {
+    ast.Add: lambda left, right: left + right,
+    ast.Sub: lambda left, right: left - right,
+    ast.Mult: lambda left, right: left * right,
+    ast.Div: lambda left, right: left / right,
+}
+
+class ExpressionError(ValueError):
+    """violation_rule tidak valid atau tidak dapat dievaluasi sebagai operasi kolom."""
+
+class _Frame:
+    """Baris yang sedang dievaluasi: DataFrame terurut (plat_nomor, waktu) dan posisi kandidat."""
+
+    def __init__(self, df: pd.DataFrame, positions):
+        self.df = df
+        self.positions = np.arange(len(df)) if positions is None else np.asarray(positions)
+        self._subset = positions is not None
+        self._columns = {}
+
+    def take(self, series: pd.Series) -> pd.Series:
+        """Series seluruh DataFrame -> Series posisi kandidat dengan index 0..k-1."""
+        if not self._subset:
+            return series.reset_index(drop=True)
+        return series.iloc[self.positions].reset_index(drop=True)
+
+    def column(self, name: str) -> pd.Series:
+        if name not in self._columns:
+            self._columns[name] = self.take(_typed(self.df[name], COLUMN_TYPES[name]))
+        return self._columns[name]
+
+    def neighbour(self, offset: int):
+        """(posisi baris tetangga, mask plat sama) untuk offset -1 (sebelumnya) atau +1 (berikutnya)."""
+        other = self.positions + offset
+        valid = (other >= 0) & (other < len(self.df))
+        other = np.clip(other, 0, max(len(self.df) - 1, 0))
+        plates = self.df['plat_nomor'].to_numpy()
+        current = plates[self.positions]
+        same_plate = valid & (current == plates[other])
+        # NULL tidak pernah sama dengan NULL; cukup diperiksa pada baris yang lolos perbandingan
+        same_plate[same_plate] = pd.notna(current[same_plate])
+        return other, same_plate
+
+def _typed(series: pd.Series, column_type: str) -> pd.Series:
+    if column_type == 'numeric':
+        return pd.to_numeric(series, errors='coerce')
+    return series
+
+def _not_null(value):
+    return value.notna() if isinstance(value, pd.Series) else True
+
+# Kondisi dievaluasi dengan logika tiga nilai SQL sebagai pasangan (truth, known) Series bool:
+# known = False berarti UNKNOWN (melibatkan NULL), dan truth selalu False pada baris UNKNOWN.
+
+def _known(truth: pd.Series):
+    return truth, pd.Series(True, index=truth.index)
+
+def _not(operand):
+    truth, known = operand
+    return ~truth & known, known
+
+def _and(left, right):
+    (left_truth, left_known), (right_truth, right_known) = left, right
+    # FALSE jika salah satu FALSE, TRUE jika keduanya TRUE, selain itu UNKNOWN
+    known = (left_known & right_known) | (left_known & ~left_truth) | (right_known & ~right_truth)
+    return left_truth & right_truth, known
+
+def _or(left, right):
+    (left_truth, left_known), (right_truth, right_known) = left, right
+    # TRUE jika salah satu TRUE, FALSE jika keduanya FALSE, selain itu UNKNOWN
+    return left_truth | right_truth, (left_known & right_known) | left_truth | right_truth
+
+def _translate_sql(expression: str) -> str:
+    """Menerjemahkan token bergaya SQL (=, <>, AND, IS NULL, ...) ke sintaks Python; isi string tidak disentuh."""
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(expression).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError) as e:
+        raise ExpressionError(f"Ekspresi tidak dapat di-parse: {e}")
+    translated = []
+    for i, token in enumerate(tokens):
+        string = token.string
+        if token.type == tokenize.NAME and string.upper() in _SQL_KEYWORDS and (string.isupper() or string.upper() == 'NULL'):
+            string = _SQL_KEYWORDS[string.upper()]
+        elif token.type == tokenize.OP and string == '=':
+            string = '=='
+        elif token.type == tokenize.OP and string == '<' and i + 1 < len(tokens) and tokens[i + 1].string == '>' and tokens[i + 1].start == token.end:
+            string = '!='
+        elif token.type == tokenize.OP and string == '>' and i > 0 and tokens[i - 1].string == '<' and tokens[i - 1].end == token.start:
+            continue
+        translated.append((token.type, string))
+    return tokenize.untokenize(translated).strip()
+
+class _Compiler:
+    """Mengompilasi node AST menjadi (tipe, fungsi(frame) -> Series atau skalar, bergantung_pada_baris)."""
+
+    def __init__(self, value):
+        self.value = value
+        self.columns = set()
+        self.functions = set()
+
+    def compile(self, node):
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise ExpressionError(f"Sintaks '{ast.unparse(node)}' tidak didukung dalam violation_rule.")
+        return method(node)
+
+    def _compile_Constant(self, node):
+        value = node.value
+        if value is None:
+            return 'null', lambda frame: None, False
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return 'numeric', lambda frame: float(value), False
+        if isinstance(value, str):
+            return 'text', lambda frame: value, False
+        raise ExpressionError(f"Konstanta {value!r} tidak didukung.")
+
+    def _compile_Name(self, node):
+        if node.id == 'value':
+            # Nilai `value` milik kriteria (mis. ambang detik), numerik jika bisa
+            if self.value is None:
+                raise ExpressionError("Ekspresi memakai 'value' tetapi kriteria tidak memiliki value.")
+            try:
+                number = float(self.value)
+                return 'numeric', lambda frame: number, False
+            except (TypeError, ValueError):
+                text = str(self.value)
+                return 'text', lambda frame: text, False
+        column_type = COLUMN_TYPES.get(node.id)
+        if column_type is None:
+            raise ExpressionError(f"Kolom '{node.id}' tidak dikenal.")
+        self.columns.add(node.id)
+        return column_type, lambda frame: frame.column(node.id), True
+
+    def _compile_BoolOp(self, node):
+        operands = [self._boolean(value) for value in node.values]
+        combine = _and if isinstance(node.op, ast.And) else _or
+        def evaluate(frame):
+            result = operands[0](frame)
+            for operand in operands[1:]:
+                result = combine(result, operand(frame))
+            return result
+        return 'bool', evaluate, True
+
+    def _compile_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            operand = self._boolean(node.operand)
+            return 'bool', lambda frame: _not(operand(frame)), True
+        if isinstance(node.op, ast.USub):
+            operand_type, operand, per_row = self.compile(node.operand)
+            if operand_type != 'numeric':
+                raise ExpressionError(f"Operator '-' membutuhkan nilai numerik: '{ast.unparse(node)}'.")
+            return 'numeric', lambda frame: -operand(frame), per_row
+        raise ExpressionError(f"Operator pada '{ast.unparse(node)}' tidak didukung.")
+
+    def _compile_BinOp(self, node):
+        operation = _ARITHMETIC.get(type(node.op))
+        if operation is None:
+            raise ExpressionError(f"Operator aritmetika pada '{ast.unparse(node)}' tidak didukung.")
+        left_type, left, left_per_row = self.compile(node.left)
+        right_type, right, right_per_row = self.compile(node.right)
+        if left_type != 'numeric' or right_type != 'numeric':
+            raise ExpressionError(f"Aritmetika hanya untuk nilai numerik: '{ast.unparse(node)}'.")
+        return 'numeric', lambda frame: operation(left(frame), right(frame)), left_per_row or right_per_row
+
+    def _compile_Compare(self, node):
+        # a < b < c dievaluasi sebagai (a < b) and (b < c), seperti Python
+        parts = []
+        left_node = node.left
+        for op, right_node in zip(node.ops, node.comparators):
+            parts.append(self._comparison(left_node, op, right_node))
+            left_node = right_node
+        def evaluate(frame):
+            result = parts[0](frame)
+            for part in parts[1:]:
+                result = _and(result, part(frame))
+            return result
+        return 'bool', evaluate, True
+
+    def _comparison(self, left_node, op, right_node):
+        source = ast.unparse(ast.Compare(left=left_node, ops=[op], comparators=[right_node]))
+        left_type, left, left_per_row = self.compile(left_node)
+        if not left_per_row:
+            raise ExpressionError(f"Sisi kiri perbandingan '{source}' harus berasal dari kolom transaksi.")
+
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            if not (isinstance(right_node, ast.Constant) and right_node.value is None):
+                raise ExpressionError(f"'is' hanya boleh dibandingkan dengan NULL/None: '{source}'.")
+            if isinstance(op, ast.Is):
+                return lambda frame: _known(left(frame).isna())
+            return lambda frame: _known(left(frame).notna())
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            # IN ('a') bergaya SQL di-parse sebagai satu konstanta, bukan tuple
+            elements = [right_node] if isinstance(right_node, ast.Constant) else getattr(right_node, 'elts', None)
+            if not isinstance(right_node, (ast.Constant, ast.List, ast.Tuple, ast.Set)) or not elements:
+                raise ExpressionError(f"'in' membutuhkan daftar nilai konstan: '{source}'.")
+            values = []
+            for element in elements:
+                element_type, element_value, per_row = self.compile(element)
+                if per_row or element_type != left_type:
+                    raise ExpressionError(f"Nilai pada '{source}' harus konstanta bertipe {left_type}.")
+                values.append(element_value(None))
+            def membership(frame):
+                series = left(frame)
+                known = series.notna()
+                found = series.isin(values)
+                return (found if isinstance(op, ast.In) else ~found) & known, known
+            return membership
+
+        comparison = _COMPARISONS[type(op)]
+        right_type, right, _ = self.compile(right_node)
+        if right_type == 'null':
+            raise ExpressionError(f"Gunakan IS NULL / IS NOT NULL untuk membandingkan dengan NULL: '{source}'.")
+        if left_type == 'datetime' and right_type == 'text' and isinstance(right_node, ast.Constant):
+            try:
+                timestamp = pd.Timestamp(right_node.value)
+            except ValueError:
+                raise ExpressionError(f"'{right_node.value}' bukan tanggal/waktu yang valid.")
+            right_type, right = 'datetime', lambda frame: timestamp
+        if left_type != right_type or left_type in ('bool', 'null'):
+            raise ExpressionError(f"Tidak dapat membandingkan {left_type} dengan {right_type}: '{source}'.")
+
+        def evaluate(frame):
+            # Seperti SQL: perbandingan dengan NULL bernilai UNKNOWN, tidak pernah benar (termasuk !=)
+            left_value, right_value = left(frame), right(frame)
+            known = _not_null(left_value) & _not_null(right_value)
+            if left_type == 'text':
+                left_value = left_value.fillna('') if isinstance(left_value, pd.Series) else left_value
+                right_value = right_value.fillna('') if isinstance(right_value, pd.Series) else right_value
+            return comparison(left_value, right_value) & known, known
+        return evaluate
+
+    def _compile_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ExpressionError(f"Pemanggilan '{ast.unparse(node)}' tidak didukung.")
+        name = node.func.id
+        self.functions.add(name)
+
+        if name == 'is_missing':
+            argument_type, argument, per_row = self._single_argument(node)
+            if argument_type == 'text':
+                return 'bool', lambda frame: _known((lambda series: series.isna() | (series == ''))(argument(frame))), True
+            return 'bool', lambda frame: _known(argument(frame).isna()), True
+
+        if name in SCALAR_FUNCTIONS:
+            expected_type, result_type, implementation = SCALAR_FUNCTIONS[name]
+            argument_type, argument, per_row = self._single_argument(node)
+            if argument_type != expected_type:
+                raise ExpressionError(f"Fungsi {name}() membutuhkan argumen {expected_type}, bukan {argument_type}.")
+            return result_type, lambda frame: implementation(argument(frame)), True
+
+        if name in WINDOW_FUNCTIONS:
+            columns = self._column_arguments(node, WINDOW_FUNCTIONS[name])
+            self.columns |= {'plat_nomor', 'transaction_datetime'}
+            if name in ('prev', 'next'):
+                column = columns[0]
+                offset = -1 if name == 'prev' else 1
+                def neighbour_value(frame):
+                    other, same_plate = frame.neighbour(offset)
+                    values = _typed(frame.df[column], COLUMN_TYPES[column]).iloc[other].reset_index(drop=True)
+                    return values.where(same_plate)
+                return COLUMN_TYPES[column], neighbour_value, True
+            offset = -1 if name == 'seconds_since_prev' else 1
+            def seconds_between(frame):
+                other, same_plate = frame.neighbour(offset)
+                times = frame.df['transaction_datetime'].to_numpy()
+                seconds = (times[frame.positions] - times[other]) / np.timedelta64(1, 's')
+                return pd.Series(np.where(same_plate, np.abs(seconds), np.nan))
+            return 'numeric', seconds_between, True
+
+        if name in AGGREGATE_FUNCTIONS:
+            columns = self._column_arguments(node, AGGREGATE_FUNCTIONS[name])
+            if name == 'count_by':
+                by = columns[0]
+                return 'numeric', lambda frame: frame.take(frame.df.groupby(by)[by].transform('size').astype(float)), True
+            column, by = columns
+            if COLUMN_TYPES[column] != 'numeric':
+                raise ExpressionError(f"sum_by() membutuhkan kolom numerik, bukan {column}.")
+            return 'numeric', lambda frame: frame.take(
+                _typed(frame.df[column], 'numeric').groupby(frame.df[by]).transform('sum')
+            ), True
+
+        raise ExpressionError(f"Fungsi '{name}' tidak dikenal.")
+
+    def _single_argument(self, node):
+        if len(node.args) != 1:
+            raise ExpressionError(f"Fungsi {node.func.id}() membutuhkan tepat satu argumen.")
+        argument_type, argument, per_row = self.compile(node.args[0])
+        if not per_row:
+            raise ExpressionError(f"Argumen {node.func.id}() harus berasal dari kolom transaksi.")
+        return argument_type, argument, per_row
+
+    def _column_arguments(self, node, count: int) -> list:
+        """Argumen fungsi window/agregat harus nama kolom: ekspresi bersarang tidak dapat divektorisasi per partisi."""
+        if len(node.args) != count:
+            raise ExpressionError(f"Fungsi {node.func.id}() membutuhkan {count} argumen.")
+        columns = []
+        for argument in node.args:
+            if not isinstance(argument, ast.Name) or argument.id not in COLUMN_TYPES:
+                raise ExpressionError(f"Argumen {node.func.id}() harus nama kolom transaksi, bukan '{ast.unparse(argument)}'.")
+            self.columns.add(argument.id)
+            columns.append(argument.id)
+        return columns
+
+    def _boolean(self, node):
+        node_type, evaluate, per_row = self.compile(node)
+        if node_type != 'bool':
+            raise ExpressionError(f"'{ast.unparse(node)}' bukan kondisi (hasilnya {node_type}).")
+        return evaluate
+
+def _predicate(evaluate):
+    # Baris UNKNOWN tidak terpicu, sama seperti WHERE di SQL
+    return lambda df, positions: evaluate(_Frame(df, positions))[0].to_numpy(dtype=bool)
+
+def _conjuncts(tree):
+    """Memecah AND tingkat atas menjadi konjungsi yang bisa dievaluasi short-circuit."""
+    if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And):
+        for value in tree.values:
+            yield from _conjuncts(value)
+    else:
+        yield tree
+
+class CompiledExpression:
+    """
+    violation_rule yang sudah dikompilasi. `conjuncts` adalah predikat {name, kind, source, evaluate}
+    dengan evaluate(df, positions) -> array bool, siap diurutkan oleh app.rule_planner.
+    """
+
+    def __init__(self, expression: str, value):
+        if len(expression) > MAX_EXPRESSION_LENGTH:
+            raise ExpressionError(f"Ekspresi lebih dari {MAX_EXPRESSION_LENGTH} karakter.")
+        try:
+            tree = ast.parse(_translate_sql(expression), mode='eval').body
+        except SyntaxError as e:
+            raise ExpressionError(f"Ekspresi tidak dapat di-parse: {e.msg}.")
+        self.expression = expression
+        self.normalized = ast.unparse(tree)
+
+        columns, functions = set(), set()
+        self.conjuncts = []
+        for index, node in enumerate(_conjuncts(tree)):
+            compiler = _Compiler(value)
+            evaluate = compiler._boolean(node)
+            if not compiler.columns:
+                raise ExpressionError(f"Kondisi '{ast.unparse(node)}' tidak bergantung pada kolom transaksi.")
+            columns |= compiler.columns
+            functions |= compiler.functions
+            if compiler.functions & (set(WINDOW_FUNCTIONS) | set(AGGREGATE_FUNCTIONS)):
+                kind = 'window'
+            elif any(COLUMN_TYPES[column] == 'text' for column in compiler.columns):
+                kind = 'string'
+            else:
+                kind = 'numeric'
+            self.conjuncts.append({"name": f"expr_{index}", "kind": kind, "source": ast.unparse(node), "evaluate": _predicate(evaluate)})
+        self.columns = sorted(columns)
+        self.functions = sorted(functions)
+
+    def evaluate(self, df: pd.DataFrame, positions=None) -> np.ndarray:
+        """Mask bool untuk posisi yang diberikan (None = semua baris), tanpa short-circuit."""
+        result = np.ones(len(df) if positions is None else len(positions), dtype=bool)
+        for conjunct in self.conjuncts:
+            result &= conjunct["evaluate"](df, positions)
+        return result
+
+    def details(self, df: pd.DataFrame, positions) -> list:
+        """Nilai kolom yang dipakai ekspresi pada setiap posisi hit (untuk violation_details)."""
+        columns = [_json_values(df[column].iloc[positions]) for column in self.columns]
+        return [dict(zip(self.columns, row)) for row in zip(*columns)] if columns else [{} for _ in positions]
+
+def _json_values(series: pd.Series) -> list:
+    """Nilai Series sebagai list yang aman untuk JSON (NULL/NaN -> None, datetime -> ISO 8601), per kolom sekaligus."""
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.Series(np.datetime_as_string(series.to_numpy(), unit='s'))
+    values = series.to_numpy(dtype=object)
+    values[missing] = None
+    return values.tolist()
+
+@lru_cache(maxsize=256)
+def compile_expression(expression: str, value=None) -> CompiledExpression:
+    """Mengompilasi violation_rule (di-cache per proses untuk pasangan ekspresi + value yang sama)."""
+    return CompiledExpression(expression, value)
@@ -0,0 +1,172 @@
+import os
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models import AnomalyExecution, CsvSummaryMasterDaily
+
+# Jumlah execution COMPLETED terakhir yang profilnya dipakai untuk memperkirakan biaya dan selektivitas predikat
+RULE_HISTORY_EXECUTIONS = int(os.getenv("RULE_HISTORY_EXECUTIONS", "20"))
+
+# Perkiraan biaya per baris (detik) bila predikat belum punya riwayat: perbandingan numerik
+# murah, operasi string pada kolom object jauh lebih mahal
+DEFAULT_SECONDS_PER_ROW = {"numeric": 5e-9, "window": 2e-8, "string": 1.5e-7}
+
+# Statistik kolom per summary, dihitung dari baris yang benar-benar tersimpan di transaksi bulk insert
+# (seperti rollup.apply_import). Import berikutnya hanya bisa memindahkan baris keluar dari summary ini
+# (daily_summary_id = EXCLUDED) tanpa mengubah nilai kolomnya, sehingga angka di sini tetap batas atas:
+# hitungan 0 membuktikan aturan yang bergantung padanya tidak mungkin terpicu.
+# Kondisinya harus sama persis dengan predikat di crud/analysis_crud.py.
+COLUMN_STATS_SQL = """
+    UPDATE csv_summary_master_daily SET column_stats = json_build_object(
+        'rows', totals.rows,
+        'missing_plat_nomor', totals.missing_plat_nomor,
+        'missing_nik', totals.missing_nik,
+        'duplicate_rows', totals.duplicate_rows,
+        'repeated_plat_nomor', totals.repeated_plat_nomor,
+        'groups', groups.groups
+    )
+    FROM (
+        SELECT
+            COUNT(*) AS rows,
+            COUNT(*) FILTER (WHERE plat_nomor IS NULL OR plat_nomor = '') AS missing_plat_nomor,
+            COUNT(*) FILTER (WHERE nik IS NULL OR nik = '') AS missing_nik,
+            COUNT(*) FILTER (WHERE batch_original_duplicate_count > 0) AS duplicate_rows,
+            COUNT(plat_nomor) - COUNT(DISTINCT plat_nomor) AS repeated_plat_nomor
+        FROM csv_import_log
+        WHERE daily_summary_id = %(summary_id)s
+    ) totals, (
+        SELECT COALESCE(json_agg(json_build_object(
+            'warna_plat', warna_plat, 'jumlah_roda_kendaraan', jumlah_roda_kendaraan,
+            'rows', rows, 'max_volume_liter', max_volume_liter
+        )), '[]'::json) AS groups
+        FROM (
+            SELECT
+                lower(COALESCE(warna_plat, '')) AS warna_plat,
+                COALESCE(jumlah_roda_kendaraan, '') AS jumlah_roda_kendaraan,
+                COUNT(*) AS rows,
+                MAX(volume_liter) AS max_volume_liter
+            FROM csv_import_log
+            WHERE daily_summary_id = %(summary_id)s
+            GROUP BY 1, 2
+        ) grouped
+    ) groups
+    WHERE summary_id = %(summary_id)s
+"""
+
+def refresh_summary_column_stats(cursor, summary_id: int):
+    """Menghitung ulang column_stats sebuah summary memakai cursor psycopg2 milik bulk insert."""
+    cursor.execute(COLUMN_STATS_SQL, {'summary_id': summary_id})
+
+def load_summary_stats(db: Session, summary_ids: list) -> dict | None:
+    """
+    Menggabungkan column_stats beberapa summary. None jika ada summary tanpa statistik
+    (import sebelum kolom ini ada): tanpa statistik tidak ada aturan yang boleh dilewati.
+    """
+    rows = db.query(CsvSummaryMasterDaily.summary_id, CsvSummaryMasterDaily.column_stats).filter(
+        CsvSummaryMasterDaily.summary_id.in_(summary_ids)
+    ).all()
+    if not rows or len(rows) < len(set(summary_ids)) or any(stats is None for _, stats in rows):
+        return None
+
+    merged = {"rows": 0, "missing_plat_nomor": 0, "missing_nik": 0, "duplicate_rows": 0, "groups": {}}
+    for _, stats in rows:
+        for key in ("rows", "missing_plat_nomor", "missing_nik", "duplicate_rows"):
+            merged[key] += stats[key]
+        for group in stats["groups"]:
+            key = (group["warna_plat"], group["jumlah_roda_kendaraan"])
+            current = merged["groups"].setdefault(key, {"rows": 0, "max_volume_liter": None})
+            current["rows"] += group["rows"]
+            if group["max_volume_liter"] is not None:
+                current["max_volume_liter"] = max(current["max_volume_liter"] or float('-inf'), group["max_volume_liter"])
+    # Plat yang sama bisa muncul di summary lain, jadi pengulangan plat hanya terbukti untuk satu summary
+    merged["repeated_plat_nomor"] = rows[0][1]["repeated_plat_nomor"] if len(rows) == 1 else None
+    return merged
+
+def group_rows(stats: dict, plate_colors=None, wheels=None, min_volume_liter=None) -> int:
+    """Jumlah baris pada grup (warna_plat, jumlah_roda_kendaraan) yang cocok; dengan min_volume_liter, hanya grup yang volume maksimalnya melewati batas."""
+    total = 0
+    for (plate_color, wheel), group in stats["groups"].items():
+        if plate_colors is not None and plate_color not in plate_colors:
+            continue
+        if wheels is not None and wheel != wheels:
+            continue
+        if min_volume_liter is not None and (group["max_volume_liter"] is None or group["max_volume_liter"] <= min_volume_liter):
+            continue
+        total += group["rows"]
+    return total
+
+def load_rule_history(db: Session) -> dict:
+    """
+    Biaya dan selektivitas per predikat dari profil execution terakhir:
+    {(rule_key, nama_predikat): {"seconds_per_row": ..., "pass_rate": ...}}.
+    """
+    executions = db.query(AnomalyExecution.rules_config).filter(
+        AnomalyExecution.status == 'COMPLETED'
+    ).order_by(AnomalyExecution.execution_timestamp.desc()).limit(RULE_HISTORY_EXECUTIONS)
+
+    totals = {}
+    for (rules_config,) in executions:
+        profile = (rules_config or {}).get("profile") or {}
+        for rule in profile.get("rules", []):
+            for predicate in rule.get("predicates", []):
+                total = totals.setdefault((rule["name"], predicate["name"]), [0, 0, 0.0])
+                total[0] += predicate["rows_in"]
+                total[1] += predicate["rows_out"]
+                total[2] += predicate["seconds"]
+    return {
+        key: {"seconds_per_row": seconds / rows_in, "pass_rate": rows_out / rows_in}
+        for key, (rows_in, rows_out, seconds) in totals.items() if rows_in
+    }
+
+def plan_predicates(rule_key: str, predicates: list, history: dict, total_rows: int):
+    """
+    Mengurutkan predikat (konjungsi) sebuah aturan dan memperkirakan biaya per hit aturan tersebut.
+    Predikat dengan rank biaya / (1 - pass_rate) terkecil dievaluasi lebih dulu, sehingga predikat
+    murah dan selektif mempersempit baris sebelum predikat mahal dijalankan.
+    Setiap predikat adalah dict {name, kind, estimate, evaluate}; estimate = perkiraan pass rate
+    dari statistik kolom (None jika tidak diketahui). Mengembalikan (predikat_terurut, biaya_per_hit).
+    """
+    def cost_and_pass_rate(predicate):
+        known = history.get((rule_key, predicate["name"]), {})
+        seconds_per_row = known.get("seconds_per_row", DEFAULT_SECONDS_PER_ROW[predicate["kind"]])
+        pass_rate = predicate["estimate"] if predicate["estimate"] is not None else known.get("pass_rate", 0.5)
+        return seconds_per_row, pass_rate
+
+    def rank(predicate):
+        seconds_per_row, pass_rate = cost_and_pass_rate(predicate)
+        return seconds_per_row / max(1 - pass_rate, 1e-6)
+
+    ordered = sorted(predicates, key=rank)
+    expected_seconds, remaining = 0.0, float(total_rows)
+    for predicate in ordered:
+        seconds_per_row, pass_rate = cost_and_pass_rate(predicate)
+        expected_seconds += seconds_per_row * remaining
+        remaining *= pass_rate
+    return ordered, expected_seconds / max(remaining, 1.0)
+
+def evaluate_predicates(df, predicates: list):
+    """
+    Mengevaluasi konjungsi predikat secara short-circuit: setiap predikat hanya dijalankan pada
+    posisi baris yang lolos predikat sebelumnya (positions=None berarti semua baris).
+    Mengembalikan (posisi_baris_yang_lolos, catatan_per_predikat) untuk profil execution.
+    """
+    positions = None
+    records = []
+    for predicate in predicates:
+        rows_in = len(df) if positions is None else len(positions)
+        start = time.perf_counter()
+        passed = np.asarray(predicate["evaluate"](df, positions), dtype=bool)
+        positions = passed.nonzero()[0] if positions is None else positions[passed]
+        records.append({
+            "name": predicate["name"],
+            "rows_in": rows_in,
+            "rows_out": len(positions),
+            "seconds": round(time.perf_counter() - start, 6),
+        })
+        if not len(positions):
+            break
+    if positions is None:
+        positions = np.arange(len(df))
+    return positions, records
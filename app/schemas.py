@@ -1,6 +1,6 @@
 from __future__ import annotations # Enable Postponed Evaluation of Annotations
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # Anomaly Template Master
@@ -72,6 +72,17 @@ class SpecialAnomalyCriteria(SpecialAnomalyCriteriaBase):
     class Config:
         orm_mode = True
 
+class SpecialCriteriaExpression(BaseModel):
+    violation_rule: str
+    value: Optional[str] = None
+
+class SpecialCriteriaExpressionResult(BaseModel):
+    violation_rule: str
+    normalized: str
+    columns: List[str] = []
+    functions: List[str] = []
+    conjuncts: List[str] = []
+
 # Video AI Parameters
 class VideoAiParameterBase(BaseModel):
     parameter_key: str
@@ -118,8 +129,10 @@ class AccumulatedAnomalyCriteria(AccumulatedAnomalyCriteriaBase):
 
 class AnomalyAnalysisRequest(BaseModel):
     template_id: Optional[int] = None
+    template_ids: Optional[List[int]] = None # Beberapa template atas summary yang sama dalam satu pass data
     transaction_criteria_ids: Optional[List[int]] = None
     special_criteria_ids: Optional[List[int]] = None
+    accumulated_criteria_ids: Optional[List[int]] = None
     summary_ids: List[int]
     executed_by: str
 
@@ -204,10 +217,66 @@ class CsvSummaryMasterDaily(CsvSummaryMasterDailyBase):
     total_kota_kabupaten: Optional[float] = None
     total_no_spbu: Optional[float] = None
     numeric_totals: Optional[dict] = None
+    import_metrics: Optional[dict] = None
+    rows_per_second: Optional[float] = None
+    stage_durations: Optional[dict] = None
 
     class Config:
         orm_mode = True
 
+class ImportThroughputPoint(BaseModel):
+    summary_id: int
+    import_datetime: datetime
+    file_type: Optional[str] = None
+    total_records_read: Optional[int] = None
+    import_duration: Optional[float] = None
+    rows_per_second: Optional[float] = None
+    insert_rows_per_second: Optional[float] = None
+    stage_durations: Optional[dict] = None
+
+class ImportThroughputTrend(BaseModel):
+    imports_considered: int
+    recent_median_rows_per_second: Optional[float] = None
+    previous_median_rows_per_second: Optional[float] = None
+    change_percent: Optional[float] = None
+    slowing_down: bool = False
+    points: List[ImportThroughputPoint] = []
+
+# Distinct count gabungan dari sketch HyperLogLog (GET /v1/summary/distinct-counts)
+class DistinctCountEstimate(BaseModel):
+    estimate: int
+    relative_error: float
+    summaries_with_sketch: int
+
+class DistinctCountResult(BaseModel):
+    summary_ids: List[int]
+    missing_summary_ids: List[int] = []
+    columns: Dict[str, DistinctCountEstimate] = {}
+
+# Rollup harian (GET /v1/analytics/rollup)
+class RollupRow(BaseModel):
+    # Dimensi sesuai group_by; yang tidak dikelompokkan bernilai None
+    tanggal: Optional[str] = None
+    month: Optional[str] = None
+    mor: Optional[str] = None
+    provinsi: Optional[str] = None
+    kota_kabupaten: Optional[str] = None
+    no_spbu: Optional[str] = None
+    produk: Optional[str] = None
+    transaction_count: int
+    total_volume_liter: float
+    total_penjualan_rupiah: float
+    anomalous_transactions: Optional[int] = None
+    anomalous_volume_liter: Optional[float] = None
+
+class RollupResult(BaseModel):
+    group_by: List[str]
+    date_from: str
+    date_to: str
+    execution_ids: Optional[List[str]] = None
+    truncated: bool = False
+    rows: List[RollupRow] = []
+
 # Anomaly Result
 class AnomalyResultBase(BaseModel):
     execution_id: str
@@ -234,6 +303,16 @@ class AnomalyResult(AnomalyResultBase):
     class Config:
         orm_mode = True
 
+class AnomalyFlagCount(BaseModel):
+    flag: str
+    count: int
+
+class AnomalyFlagCountResult(BaseModel):
+    execution_id: Optional[str] = None
+    summary_id: Optional[int] = None
+    total_anomalous: int
+    flags: List[AnomalyFlagCount] = []
+
 # After all models are defined, rebuild the ones with forward references
 # to resolve the string-based type hints into actual types.
 AnomalyTemplateMaster.model_rebuild()
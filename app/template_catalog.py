@@ -0,0 +1,73 @@
+import logging
+import threading
+
+from sqlalchemy.orm import Session, selectinload
+
+from app import cache, schemas
+from app.models import AccumulatedAnomalyCriteria, AnomalyTemplateMaster, SpecialAnomalyCriteria, TransactionAnomalyCriteria, VideoAiParameter
+
+# Katalog template + kriteria yang sudah diserialisasi, disimpan per proses.
+# Valid selama versi namespace 'templates' di Redis (dibump oleh proses mana pun yang mengubah
+# template/kriteria) dan generasi lokal proses ini tidak berubah; generasi lokal menjamin
+# proses yang melakukan perubahan langsung melihatnya walaupun bump ke Redis gagal.
+_catalog_lock = threading.Lock()
+_catalog = None # (versi, katalog)
+_local_generation = 0
+
+def bump_version():
+    """Dipanggil setelah commit perubahan template atau kriteria."""
+    global _local_generation
+    with _catalog_lock:
+        _local_generation += 1
+    cache.bump_version(cache.TEMPLATES_NAMESPACE)
+
+def _dump(schema, rows) -> list:
+    return [schema.model_validate(row, from_attributes=True).model_dump(mode='json') for row in rows]
+
+def load_catalog(db: Session) -> dict:
+    """
+    Memuat semua template beserta kriteria tertautnya (selectinload: jumlah query tetap,
+    tidak bertambah per template) dan daftar kriteria yang tersedia.
+    """
+    templates = (
+        db.query(AnomalyTemplateMaster)
+        .options(
+            selectinload(AnomalyTemplateMaster.transaction_criteria),
+            selectinload(AnomalyTemplateMaster.special_criteria),
+            selectinload(AnomalyTemplateMaster.video_parameters),
+            selectinload(AnomalyTemplateMaster.accumulated_criteria),
+        )
+        .order_by(AnomalyTemplateMaster.role_name)
+        .all()
+    )
+    serialized = _dump(schemas.AnomalyTemplateMaster, templates)
+    return {
+        "templates": serialized,
+        "templates_by_id": {template["template_id"]: template for template in serialized},
+        "available_volume": _dump(schemas.TransactionAnomalyCriteria, db.query(TransactionAnomalyCriteria).order_by(TransactionAnomalyCriteria.criteria_id)),
+        "available_special": _dump(schemas.SpecialAnomalyCriteria, db.query(SpecialAnomalyCriteria).order_by(SpecialAnomalyCriteria.special_criteria_id)),
+        "available_video": _dump(schemas.VideoAiParameter, db.query(VideoAiParameter).order_by(VideoAiParameter.param_id)),
+        "available_accumulated": _dump(schemas.AccumulatedAnomalyCriteria, db.query(AccumulatedAnomalyCriteria).order_by(AccumulatedAnomalyCriteria.accumulated_criteria_id)),
+    }
+
+def get_catalog(db: Session) -> dict:
+    """
+    Katalog untuk versi saat ini; hanya menyentuh database jika versinya berubah.
+    Hasilnya dibagi antar request, jadi jangan diubah oleh pemanggil.
+    """
+    global _catalog
+    redis_version = cache.get_version(cache.TEMPLATES_NAMESPACE)
+    if redis_version is None:
+        # Tanpa Redis, perubahan dari proses lain tidak terlihat: jangan sajikan dari cache
+        return load_catalog(db)
+    with _catalog_lock:
+        version = (redis_version, _local_generation)
+        if _catalog is not None and _catalog[0] == version:
+            return _catalog[1]
+    # Versi dibaca sebelum memuat, sehingga perubahan yang di-commit di antaranya paling buruk
+    # disimpan di bawah versi lama dan dimuat ulang pada request berikutnya.
+    catalog = load_catalog(db)
+    with _catalog_lock:
+        _catalog = (version, catalog)
+    logging.info(f"Katalog template dimuat ulang: {len(catalog['templates'])} template.")
+    return catalog
@@ -0,0 +1,460 @@
+"""
+Benchmark suite untuk hot path import, analisis anomali, dan ekspor.
+
+Menjalankan `import_csv_to_db`, `bulk_insert_transactions`, `run_anomaly_analysis`
+dan `process_export_job` pada beberapa ukuran data terhadap PostgreSQL lokal
+(POSTGRES_HOST/POSTGRES_PORT/...) dan Redis lokal (REDIS_HOST/REDIS_PORT).
+Setiap kasus dijalankan di proses terpisah agar peak RSS dan jumlah query
+terukur per kasus, lalu hasilnya ditulis sebagai laporan JSON dan dibandingkan
+dengan baseline yang tersimpan.
+
+Contoh:
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000
+    python -m benchmarks.run_benchmarks --update-baseline
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_TOLERANCE = 0.15
+BENCH_TITLE_PREFIX = '[bench]'
+BENCH_ID_PREFIX = 'BENCH'
+BENCH_USER = 'benchmark'
+
+CASES = ['import_csv_to_db', 'bulk_insert_transactions', 'run_anomaly_analysis', 'process_export_job']
+
+# --- Penghitung Query ---
+
+QUERY_COUNTER = {'count': 0}
+
+
+def install_query_counter():
+    """
+    Mengganti psycopg2.connect agar setiap koneksi (psycopg2 langsung maupun
+    engine SQLAlchemy) memakai cursor yang menghitung eksekusi query.
+    """
+    import psycopg2
+    import psycopg2.extensions
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            QUERY_COUNTER['count'] += 1
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            QUERY_COUNTER['count'] += 1
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            QUERY_COUNTER['count'] += 1
+            return super().copy_expert(sql, file, size)
+
+    real_connect = psycopg2.connect
+
+    def counting_connect(*args, **kwargs):
+        kwargs.setdefault('cursor_factory', CountingCursor)
+        return real_connect(*args, **kwargs)
+
+    psycopg2.connect = counting_connect
+
+
+def peak_rss_bytes():
+    """Peak RSS proses saat ini (ru_maxrss dalam KB di Linux, byte di macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+
+# --- Generator Data Sintetis ---
+
+PRODUK = ['BIO_SOLAR', 'PERTALITE', 'PERTAMAX', 'DEXLITE']
+WARNA_PLAT = ['Hitam', 'Kuning', 'Putih', 'Merah']
+
+
+def generate_rows(size, run_id, seed=42):
+    """Menghasilkan baris transaksi tipe A (20 kolom) dengan plat yang berulang."""
+    rng = random.Random(seed)
+    base_time = datetime(2025, 1, 1, 6, 0, 0)
+    plates = [f"B {rng.randint(1000, 9999)} {rng.choice('ABCDEFGH')}{rng.choice('XYZ')}" for _ in range(max(size // 4, 1))]
+    rows = []
+    for i in range(size):
+        ts = base_time + timedelta(seconds=i * 7)
+        rows.append((
+            f"{BENCH_ID_PREFIX}-{run_id}-{i:09d}",
+            ts.strftime('%d/%m/%Y'),
+            ts.strftime('%H:%M:%S'),
+            str(rng.randint(1, 8)),
+            'DKI JAKARTA',
+            'JAKARTA SELATAN',
+            f"3412{rng.randint(100, 999)}",
+            str(rng.randint(1, 8)),
+            str(rng.randint(1, 4)),
+            rng.choice(PRODUK),
+            f"{rng.uniform(5, 250):.2f}".replace('.', ','),
+            str(rng.randint(50000, 2500000)),
+            f"OPR{rng.randint(1, 40):03d}",
+            rng.choice(['QR', 'MANUAL']),
+            rng.choice(plates) if rng.random() > 0.02 else '',
+            f"{rng.randint(10**15, 10**16 - 1)}" if rng.random() > 0.05 else '',
+            '',
+            rng.choice(['4', '6']),
+            str(rng.randint(60, 200)),
+            rng.choice(WARNA_PLAT),
+        ))
+    return rows
+
+
+def rows_to_csv_bytes(rows):
+    header = 'transaction_id_asersi;tanggal;jam;mor;provinsi;kota_kabupaten;no_spbu;no_nozzle;no_dispenser;produk;volume_liter;penjualan_rupiah;operator;mode_transaksi;plat_nomor;nik;sektor_non_kendaraan;jumlah_roda_kendaraan;kuota;warna_plat'
+    lines = [header] + [';'.join(row) for row in rows]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def rows_to_insert_tuples(rows):
+    """Mengubah baris CSV ke tuple yang diterima bulk_insert_transactions."""
+    tuples = []
+    for row in rows:
+        row = list(row)
+        row[1] = datetime.strptime(row[1], '%d/%m/%Y').strftime('%Y-%m-%d')
+        row[3] = int(row[3])
+        row[10] = float(row[10].replace(',', '.'))
+        row[11] = float(row[11])
+        row[18] = float(row[18])
+        tuples.append(tuple(value if value != '' else None for value in row))
+    return tuples
+
+
+# --- Persiapan dan Pembersihan Data ---
+
+def create_bench_summary(label):
+    from app.database import get_db_connection
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO csv_summary_master_daily (import_datetime, file_name, title, file_type) "
+                "VALUES (NOW(), %s, %s, 'A') RETURNING summary_id",
+                (f"{label}.csv", f"{BENCH_TITLE_PREFIX} {label}")
+            )
+            summary_id = cursor.fetchone()[0]
+        conn.commit()
+    return summary_id
+
+
+def seed_dataset(size, run_id):
+    """Mengimpor dataset berukuran `size` dan mengembalikan summary_id-nya."""
+    from app.database import bulk_insert_transactions
+    rows = generate_rows(size, f"{run_id}-seed")
+    summary_id = create_bench_summary(f"seed_{size}")
+    bulk_insert_transactions(rows_to_insert_tuples(rows), summary_id)
+    return summary_id
+
+
+def ensure_bench_template():
+    """Membuat template benchmark yang menautkan seluruh kriteria default."""
+    from app.database import SessionLocal, insert_transaction_anomaly_criteria, insert_special_anomaly_criteria
+    from app.models import AnomalyTemplateMaster, TransactionAnomalyCriteria, SpecialAnomalyCriteria
+
+    db = SessionLocal()
+    try:
+        insert_transaction_anomaly_criteria(db)
+        insert_special_anomaly_criteria(db)
+        template = db.query(AnomalyTemplateMaster).filter_by(role_name=f"{BENCH_TITLE_PREFIX} template").first()
+        if not template:
+            template = AnomalyTemplateMaster(
+                role_name=f"{BENCH_TITLE_PREFIX} template",
+                description="Template benchmark",
+                is_default=False,
+                created_by=BENCH_USER
+            )
+            db.add(template)
+        template.transaction_criteria = db.query(TransactionAnomalyCriteria).all()
+        template.special_criteria = db.query(SpecialAnomalyCriteria).all()
+        db.commit()
+        return template.template_id
+    finally:
+        db.close()
+
+
+def cleanup_bench_data():
+    """
+    Menghapus data benchmark. Import benchmark ikut menambah transaction_rollup_daily, jadi kontribusinya
+    dikurangi di transaksi yang sama sebelum transaksinya dihapus (anomaly_rollup_daily terhapus
+    bersama execution lewat ON DELETE CASCADE), lalu cache respons di-invalidasi.
+    """
+    from app import cache, rollup
+    from app.database import get_db_connection
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM anomaly_executions WHERE executed_by = %s", (BENCH_USER,))
+            rollup.remove_transactions(cursor, f"{BENCH_ID_PREFIX}-%")
+            cursor.execute("DELETE FROM csv_import_log WHERE transaction_id_asersi LIKE %s", (f"{BENCH_ID_PREFIX}-%",))
+            cursor.execute("DELETE FROM csv_summary_master_daily WHERE title LIKE %s", (f"{BENCH_TITLE_PREFIX}%",))
+        conn.commit()
+    cache.bump_version(cache.SUMMARIES_NAMESPACE)
+    cache.bump_version(cache.RESULTS_NAMESPACE)
+
+
+# --- Kasus Benchmark (dijalankan di proses anak) ---
+
+def bench_import_csv_to_db(size, run_id, context):
+    from starlette.datastructures import Headers, UploadFile
+    from routers.import_router import import_csv_to_db
+
+    payload = rows_to_csv_bytes(generate_rows(size, run_id))
+    upload = UploadFile(file=io.BytesIO(payload), filename=f"bench_{size}.csv", headers=Headers({'content-type': 'text/csv'}))
+
+    start = time.perf_counter()
+    response = asyncio.run(import_csv_to_db(file=upload, title=f"{BENCH_TITLE_PREFIX} import {size}", type_file='A'))
+    elapsed = time.perf_counter() - start
+    body = json.loads(response.body)
+    return elapsed, {'summary_id': body.get('summary_id'), 'bytes': len(payload)}
+
+
+def bench_bulk_insert_transactions(size, run_id, context):
+    from app.database import bulk_insert_transactions
+
+    data_tuples = rows_to_insert_tuples(generate_rows(size, run_id))
+    summary_id = create_bench_summary(f"bulk_{size}")
+    QUERY_COUNTER['count'] = 0
+
+    start = time.perf_counter()
+    bulk_insert_transactions(data_tuples, summary_id)
+    elapsed = time.perf_counter() - start
+    return elapsed, {'summary_id': summary_id}
+
+
+def bench_run_anomaly_analysis(size, run_id, context):
+    from app.database import SessionLocal
+    from app.models import AnomalyExecution
+    from crud.analysis_crud import run_anomaly_analysis
+
+    db = SessionLocal()
+    try:
+        execution = AnomalyExecution(
+            execution_id=f"bench-{uuid.uuid4()}",
+            template_id=context['template_id'],
+            execution_timestamp=datetime.now(),
+            executed_by=BENCH_USER,
+            status='QUEUED',
+            rules_applied=[],
+            rules_config={}
+        )
+        db.add(execution)
+        db.commit()
+        QUERY_COUNTER['count'] = 0
+
+        start = time.perf_counter()
+        run_anomaly_analysis(execution.execution_id, [context['summary_id']], context['template_id'], db)
+        elapsed = time.perf_counter() - start
+        return elapsed, {'execution_id': execution.execution_id}
+    finally:
+        db.close()
+
+
+def bench_process_export_job(size, run_id, context, export_format='csv'):
+    import export_worker
+
+    callbacks = []
+    export_worker.send_callback = lambda url, status, file_path=None, error_message=None: callbacks.append((status, file_path, error_message))
+    file_extension = 'zip' if export_format == 'csv' else export_format
+    job_data = {
+        'job_id': f"bench-{run_id}",
+        'summary_id': context['summary_id'],
+        'format': export_format,
+        'source': 'all',
+        'filters': None,
+        'file_name': f"bench_{run_id}_{size}.{file_extension}",
+        'log_title': f"{BENCH_TITLE_PREFIX} export",
+        'callback_url': 'http://localhost/benchmark-callback',
+    }
+    QUERY_COUNTER['count'] = 0
+
+    start = time.perf_counter()
+    export_worker.process_export_job(job_data)
+    elapsed = time.perf_counter() - start
+
+    status, file_path, error_message = callbacks[-1] if callbacks else ('UNKNOWN', None, None)
+    if status != 'COMPLETED':
+        raise RuntimeError(f"Ekspor benchmark gagal: {error_message}")
+    output_path = os.path.join(export_worker.LARAVEL_PUBLIC_STORAGE_PATH, file_path)
+    return elapsed, {'format': export_format, 'bytes': os.path.getsize(output_path)}
+
+
+CASE_FUNCTIONS = {
+    'import_csv_to_db': bench_import_csv_to_db,
+    'bulk_insert_transactions': bench_bulk_insert_transactions,
+    'run_anomaly_analysis': bench_run_anomaly_analysis,
+    'process_export_job': bench_process_export_job,
+}
+
+
+def _child_entrypoint(case, size, run_id, context, env, result_queue):
+    os.environ.update(env)
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger().setLevel(logging.ERROR)
+    try:
+        install_query_counter()
+        if case == 'setup':
+            result_queue.put({'ok': True, 'summary_id': seed_dataset(size, run_id), 'template_id': ensure_bench_template()})
+            return
+
+        rss_before = peak_rss_bytes()
+        QUERY_COUNTER['count'] = 0
+        elapsed, extra = CASE_FUNCTIONS[case](size, run_id, context)
+        result_queue.put({
+            'ok': True,
+            'seconds': round(elapsed, 4),
+            'rows_per_second': round(size / elapsed, 1) if elapsed > 0 else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'peak_rss_delta_bytes': peak_rss_bytes() - rss_before,
+            'query_count': QUERY_COUNTER['count'],
+            'extra': extra,
+        })
+    except BaseException as e:
+        result_queue.put({'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+
+def run_in_child(case, size, run_id, context, env, timeout):
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    process = ctx.Process(target=_child_entrypoint, args=(case, size, run_id, context, env, result_queue))
+    process.start()
+    try:
+        result = result_queue.get(timeout=timeout)
+    except Exception:
+        result = {'ok': False, 'error': f"Timeout setelah {timeout} detik"}
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+    return result
+
+
+# --- Baseline dan Laporan ---
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Membandingkan hasil dengan baseline per (case, size). Regresi dicatat bila
+    throughput turun, peak RSS naik, atau jumlah query bertambah melewati toleransi.
+    """
+    baseline_index = {(r['case'], r['size']): r for r in baseline.get('results', []) if r.get('ok')}
+    regressions = []
+    for result in results:
+        previous = baseline_index.get((result['case'], result['size']))
+        if not previous or not result.get('ok'):
+            continue
+        checks = [
+            ('rows_per_second', result['rows_per_second'] < previous['rows_per_second'] * (1 - tolerance)),
+            ('peak_rss_bytes', result['peak_rss_bytes'] > previous['peak_rss_bytes'] * (1 + tolerance)),
+            ('query_count', result['query_count'] > previous['query_count'] * (1 + tolerance)),
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append({
+                    'case': result['case'],
+                    'size': result['size'],
+                    'metric': metric,
+                    'baseline': previous[metric],
+                    'current': result[metric],
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hot path import, analisis, dan ekspor.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Jumlah baris per kasus.")
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--output', default='bench_report.json', help="Path laporan JSON.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Path baseline JSON untuk perbandingan.")
+    parser.add_argument('--update-baseline', action='store_true', help="Simpan hasil run ini sebagai baseline baru.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Toleransi regresi relatif (0.15 = 15%%).")
+    parser.add_argument('--timeout', type=int, default=1800, help="Batas waktu per kasus (detik).")
+    parser.add_argument('--keep-data', action='store_true', help="Jangan hapus data benchmark setelah selesai.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    export_dir = tempfile.mkdtemp(prefix='datavista_bench_')
+    env = {
+        'POSTGRES_HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'REDIS_HOST': os.getenv('REDIS_HOST', 'localhost'),
+        'LARAVEL_PUBLIC_STORAGE_PATH': export_dir,
+        # Benchmark mengukur render ekspor, bukan cache hit
+        'EXPORT_CACHE_ENABLED': 'false',
+    }
+    os.environ.update(env)
+    run_id = uuid.uuid4().hex[:8]
+
+    results = []
+    for size in args.sizes:
+        context = {}
+        if {'run_anomaly_analysis', 'process_export_job'} & set(args.cases):
+            setup = run_in_child('setup', size, run_id, {}, env, args.timeout)
+            if not setup['ok']:
+                logging.error(f"Setup dataset {size} baris gagal: {setup['error']}")
+                continue
+            context = {'summary_id': setup['summary_id'], 'template_id': setup['template_id']}
+
+        for case in args.cases:
+            logging.info(f"Menjalankan {case} dengan {size} baris...")
+            result = run_in_child(case, size, f"{run_id}-{case[:6]}-{size}", context, env, args.timeout)
+            result.update({'case': case, 'size': size})
+            results.append(result)
+            if result['ok']:
+                logging.info(f"{case}[{size}]: {result['rows_per_second']} baris/detik, peak RSS {result['peak_rss_bytes'] / 1e6:.1f} MB, {result['query_count']} query")
+            else:
+                logging.error(f"{case}[{size}] gagal: {result['error']}")
+
+    if not args.keep_data:
+        try:
+            cleanup_bench_data()
+        except Exception as e:
+            logging.warning(f"Gagal membersihkan data benchmark: {e}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'sizes': args.sizes,
+        'tolerance': args.tolerance,
+        'results': results,
+        'baseline': args.baseline if baseline else None,
+        'regressions': regressions,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Laporan benchmark ditulis ke {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'generated_at': report['generated_at'], 'results': results}, f, indent=2)
+        logging.info(f"Baseline diperbarui di {args.baseline}")
+
+    for regression in regressions:
+        logging.error(f"REGRESI {regression['case']}[{regression['size']}] {regression['metric']}: baseline {regression['baseline']} -> {regression['current']}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,7 +8,8 @@ if '/app/api_engine' not in sys.path:
     sys.path.insert(0, '/app/api_engine')
 
 from app.database import SessionLocal
-from app.models import CsvImportLog, CsvSummaryMasterDaily, AnomalyResult, AnomalyExecutionBatch, AnomalyExecution
+from app import cache
+from app.models import CsvImportLog, CsvSummaryMasterDaily, AnomalyResult, AnomalyExecutionBatch, AnomalyExecution, TransactionRollupDaily, AnomalyRollupDaily
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -24,6 +25,11 @@ def clean_data(db: Session):
     deleted_anomaly_execution_batches = db.query(AnomalyExecutionBatch).delete()
     logger.info(f"Deleted {deleted_anomaly_execution_batches} records from AnomalyExecutionBatch.")
 
+    # Delete rollup harian (diturunkan dari transaksi dan hasil analisis yang dihapus di bawah)
+    deleted_anomaly_rollups = db.query(AnomalyRollupDaily).delete()
+    deleted_transaction_rollups = db.query(TransactionRollupDaily).delete()
+    logger.info(f"Deleted {deleted_anomaly_rollups} anomaly rollup rows and {deleted_transaction_rollups} transaction rollup rows.")
+
     # Delete from AnomalyExecution
     deleted_anomaly_executions = db.query(AnomalyExecution).delete()
     logger.info(f"Deleted {deleted_anomaly_executions} records from AnomalyExecution.")
@@ -37,6 +43,8 @@ def clean_data(db: Session):
     logger.info(f"Deleted {deleted_summaries} records from CsvSummaryMasterDaily.")
 
     db.commit()
+    cache.bump_version(cache.SUMMARIES_NAMESPACE)
+    cache.bump_version(cache.RESULTS_NAMESPACE)
     logger.info("Data cleanup completed.")
 
 if __name__ == "__main__":
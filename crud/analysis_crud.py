@@ -1,8 +1,13 @@
-from sqlalchemy.orm import Session
-from rq import get_current_job
+from sqlalchemy.orm import Session, selectinload
+import numpy as np
 import pandas as pd # Keep pandas for potential future data manipulation, though not used for file reading here
 from app.models import AnomalyTemplateMaster, TransactionAnomalyCriteria, SpecialAnomalyCriteria, AccumulatedAnomalyCriteria, AnomalyResult, AnomalyExecution, AnomalyExecutionBatch, CsvSummaryMasterDaily, CsvImportLog, TabelMor
 from app.schemas import AnomalyAnalysisRequest
+from app import cache
+from app.instrumentation import SpanRecorder
+from app.rollup import refresh_execution_anomalies
+from app.rule_expression import ExpressionError, compile_expression
+from app.rule_planner import evaluate_predicates, group_rows, load_rule_history, load_summary_stats, plan_predicates
 from datetime import datetime
 import logging
 import uuid
@@ -10,222 +15,392 @@ from typing import Optional
 
 logger = logging.getLogger(__name__)
 
-def run_anomaly_analysis(execution_id: str, summary_ids: list, template_id: int, db: Session):
-    logger.info(f"Starting anomaly analysis for execution_id: {execution_id}, summary_ids: {summary_ids}")
-    job = get_current_job()
-
-    # Fetch the anomaly template and its associated criteria
-    template = db.query(AnomalyTemplateMaster).filter(
-        AnomalyTemplateMaster.template_id == template_id
-    ).first()
-
-    if not template:
-        logger.error(f"Anomaly template with ID {template_id} not found.")
-        return {"status": "failed", "execution_id": execution_id, "message": f"Template {template_id} not found"}
-
-    transaction_rules = template.transaction_criteria
-    accumulated_rules = template.accumulated_criteria
-    special_rules = template.special_criteria
-
-    logger.info(f"Loaded {len(transaction_rules)} transaction rules, {len(accumulated_rules)} accumulated rules, {len(special_rules)} special rules for template {template_id}.")
-
-    # Fetch data from CsvImportLog based on summary_ids
-    # For simplicity, we'll fetch all logs associated with the provided summary_ids
-    # In a real scenario, you might filter further based on template criteria
-    
-    # Ensure summary_ids is not empty
-    if not summary_ids:
-        logger.warning("No summary_ids provided for anomaly analysis. Skipping.")
-        return {"status": "skipped", "execution_id": execution_id, "message": "No summary_ids provided"}
+def _column(df: pd.DataFrame, column: str, positions) -> pd.Series:
+    """Kolom DataFrame, dibatasi ke posisi baris yang masih kandidat (None = semua baris)."""
+    series = df[column]
+    return series if positions is None else series.iloc[positions]
+
+def _positions(df: pd.DataFrame, positions) -> np.ndarray:
+    return np.arange(len(df)) if positions is None else positions
+
+def _predicate(name: str, kind: str, estimate, evaluate) -> dict:
+    """Satu konjungsi aturan; kind menentukan perkiraan biaya awal (lihat rule_planner.DEFAULT_SECONDS_PER_ROW)."""
+    return {"name": name, "kind": kind, "estimate": estimate, "evaluate": evaluate}
+
+def _stats_fraction(stats: Optional[dict], rows: int) -> Optional[float]:
+    if not stats or not stats["rows"]:
+        return None
+    return rows / stats["rows"]
+
+def _transaction_rule_plan(rule, stats: Optional[dict]):
+    """
+    Predikat dan pembentuk violation_details untuk satu TransactionAnomalyCriteria (SINGLE_VOLUME_EXCEED).
+    Mengembalikan (predikat, details_for, skip_reason); details_for(df, posisi_hit) mengembalikan
+    violation_details per posisi. skip_reason diisi jika konfigurasi tidak didukung atau statistik
+    summary membuktikan aturan tidak mungkin terpicu.
+    """
+    if rule.anomaly_type != "SINGLE_VOLUME_EXCEED" or not rule.plate_color or not rule.consumer_type:
+        return [], None, "unsupported_configuration"
+    plate_colors = [pc.lower() for pc in rule.plate_color]
+    wheels = rule.consumer_type.split(' ')[1] # e.g., "roda 4" -> "4"
+
+    if stats is not None and group_rows(stats, plate_colors, wheels, rule.min_volume_liter) == 0:
+        return [], None, f"no_rows_matching:warna_plat={plate_colors},roda={wheels},volume>{rule.min_volume_liter}"
+
+    predicates = [
+        _predicate("volume", "numeric", None, lambda df, positions: (
+            pd.to_numeric(_column(df, 'volume_liter', positions), errors='coerce').to_numpy() > rule.min_volume_liter
+        )),
+        _predicate("plate_color", "string", stats and _stats_fraction(stats, group_rows(stats, plate_colors=plate_colors)), lambda df, positions: (
+            _column(df, 'warna_plat', positions).fillna('').astype(str).str.lower().isin(plate_colors).to_numpy()
+        )),
+        _predicate("wheels", "string", stats and _stats_fraction(stats, group_rows(stats, wheels=wheels)), lambda df, positions: (
+            (_column(df, 'jumlah_roda_kendaraan', positions).fillna('').astype(str) == wheels).to_numpy()
+        )),
+    ]
+    def details_for(df, positions):
+        return [
+            {"threshold": rule.min_volume_liter, "actual_volume": float(volume), "plate_color": plate_color, "consumer_type": wheels}
+            for volume, plate_color, wheels in zip(
+                df['volume_liter'].to_numpy()[positions],
+                df['warna_plat'].to_numpy()[positions],
+                df['jumlah_roda_kendaraan'].to_numpy()[positions],
+            )
+        ]
+    return predicates, details_for, None
+
+# Kode kriteria khusus dengan implementasi tetap di bawah; kode lain dievaluasi dari violation_rule
+BUILTIN_SPECIAL_CRITERIA_CODES = ("MISSING_PLAT_NOMOR", "MISSING_NIK", "DUPLICATE_TRANSACTION", "RED_PLATE_VEHICLE", "TRANSACTION_INTERVAL_TOO_CLOSE")
+
+def _special_rule_plan(rule, stats: Optional[dict]):
+    """
+    Predikat dan pembentuk violation_details untuk satu SpecialAnomalyCriteria, dengan bentuk
+    kembalian yang sama seperti _transaction_rule_plan. Kode di luar BUILTIN_SPECIAL_CRITERIA_CODES
+    memakai violation_rule yang dikompilasi (app/rule_expression.py); konfigurasi yang tidak valid dilewati.
+    """
+    message = {"message": rule.description}
+
+    if rule.criteria_code in ("MISSING_PLAT_NOMOR", "MISSING_NIK"):
+        column = 'plat_nomor' if rule.criteria_code == "MISSING_PLAT_NOMOR" else 'nik'
+        missing = stats and stats[f"missing_{column}"]
+        if stats is not None and missing == 0:
+            return [], None, f"no_missing_{column}"
+        def is_missing(df, positions):
+            values = _column(df, column, positions)
+            return (values.isna() | (values == '')).to_numpy()
+        return [_predicate(f"missing_{column}", "string", _stats_fraction(stats, missing or 0), is_missing)], lambda df, positions: [dict(message) for _ in positions], None
+
+    elif rule.criteria_code == "DUPLICATE_TRANSACTION":
+        if stats is not None and stats["duplicate_rows"] == 0:
+            return [], None, "no_duplicate_rows"
+        return [_predicate("duplicate_count", "numeric", _stats_fraction(stats, stats["duplicate_rows"]) if stats else None, lambda df, positions: (
+            _column(df, 'batch_original_duplicate_count', positions).fillna(0).to_numpy() > 0
+        ))], lambda df, positions: [
+            {**message, "duplicate_count": int(count)} for count in df['batch_original_duplicate_count'].to_numpy()[positions]
+        ], None
+
+    elif rule.criteria_code == "RED_PLATE_VEHICLE":
+        red_rows = stats and group_rows(stats, plate_colors=['merah'])
+        if stats is not None and red_rows == 0:
+            return [], None, "no_red_plates"
+        return [_predicate("red_plate", "string", _stats_fraction(stats, red_rows or 0), lambda df, positions: (
+            (_column(df, 'warna_plat', positions).fillna('').astype(str).str.lower() == 'merah').to_numpy()
+        ))], lambda df, positions: [dict(message) for _ in positions], None
 
+    elif rule.criteria_code == "TRANSACTION_INTERVAL_TOO_CLOSE":
+        try:
+            interval_threshold_seconds = int(rule.value)
+        except (ValueError, TypeError):
+            logger.error(f"Invalid 'value' for TRANSACTION_INTERVAL_TOO_CLOSE rule: {rule.value}. Skipping.")
+            return [], None, "invalid_value"
+        # Data diurutkan per plat_nomor lalu waktu, sehingga interval tidak pernah negatif
+        if interval_threshold_seconds <= 0:
+            return [], None, "non_positive_threshold"
+        repeated = stats and stats["repeated_plat_nomor"]
+        if stats is not None and repeated == 0:
+            return [], None, "no_repeated_plat_nomor"
+
+        # Transaksi sebelumnya untuk plat yang sama adalah baris tepat di atasnya
+        def same_plate(df, positions):
+            positions = _positions(df, positions)
+            plates = df['plat_nomor'].to_numpy()
+            current, previous = plates[positions], plates[np.maximum(positions - 1, 0)]
+            return (positions > 0) & pd.notna(current) & (current == previous)
+
+        def interval_seconds(df, positions):
+            times = df['transaction_datetime'].to_numpy()
+            return (times[positions] - times[np.maximum(positions - 1, 0)]) / np.timedelta64(1, 's')
+
+        def interval_too_close(df, positions):
+            positions = _positions(df, positions)
+            return (positions > 0) & (interval_seconds(df, positions) < interval_threshold_seconds)
+
+        def details_for(df, positions):
+            return [
+                {**message, "interval_threshold_seconds": interval_threshold_seconds, "actual_interval_seconds": float(seconds), "previous_transaction_id": previous_id}
+                for seconds, previous_id in zip(interval_seconds(df, positions), df['transaction_id_asersi'].to_numpy()[positions - 1])
+            ]
+
+        return [
+            _predicate("same_plate", "window", _stats_fraction(stats, repeated) if repeated is not None else None, same_plate),
+            _predicate("interval", "numeric", None, interval_too_close),
+        ], details_for, None
+
+    try:
+        compiled = compile_expression(rule.violation_rule, rule.value)
+    except ExpressionError as e:
+        logger.error(f"Invalid violation_rule for special criteria {rule.criteria_code}: {e}. Skipping.")
+        return [], None, "invalid_violation_rule"
+    # Setiap konjungsi AND tingkat atas menjadi predikat tersendiri, diurutkan oleh rule_planner
+    return [_predicate(conjunct["name"], conjunct["kind"], None, conjunct["evaluate"]) for conjunct in compiled.conjuncts], lambda df, positions: [
+        {**message, "violation_rule": compiled.normalized, "values": values} for values in compiled.details(df, positions)
+    ], None
+
+def _load_transactions(db: Session, summary_ids: list, profiler: SpanRecorder) -> Optional[pd.DataFrame]:
+    """Mengambil transaksi summary dan membangun DataFrame terurut (plat_nomor, waktu); None jika kosong."""
     # Fetch relevant CsvImportLog entries
-    # Assuming CsvImportLog has a daily_summary_id column linking to CsvSummaryMasterDaily.summary_id
-    transactions_to_analyze = db.query(CsvImportLog).filter(
-        CsvImportLog.daily_summary_id.in_(summary_ids)
-    ).all()
+    with profiler.span("fetch") as span:
+        transactions_to_analyze = db.query(CsvImportLog).filter(
+            CsvImportLog.daily_summary_id.in_(summary_ids)
+        ).all()
+        span["rows"] = len(transactions_to_analyze)
 
     if not transactions_to_analyze:
-        logger.info(f"No transactions found for summary_ids: {summary_ids}. No anomalies to check.")
-        return {"status": "completed", "execution_id": execution_id, "summary_ids": summary_ids, "message": "No transactions to analyze"}
+        return None
 
     logger.info(f"Found {len(transactions_to_analyze)} transactions to analyze for summary_ids: {summary_ids}")
 
-    # --- Dynamic Anomaly Detection Logic will go here ---
-    # This section will be replaced with dynamic rule application based on the fetched template criteria.
-    # For now, it's a placeholder.
-    anomalies_found_count = 0
-    
-    # Prepare a dictionary for quick lookup of special rules by criteria_code
-    special_rules_dict = {rule.criteria_code: rule for rule in special_rules}
-    
-    # Convert transactions to a DataFrame for easier manipulation, especially for accumulated rules
-    # and interval checks. This also handles datetime conversions once.
-    df_transactions = pd.DataFrame([
-        {
-            "transaction_id_asersi": t.transaction_id_asersi,
-            "daily_summary_id": t.daily_summary_id,
-            "tanggal": t.tanggal,
-            "jam": t.jam,
-            "mor": t.mor,
-            "provinsi": t.provinsi,
-            "kota_kabupaten": t.kota_kabupaten,
-            "no_spbu": t.no_spbu,
-            "no_nozzle": t.no_nozzle,
-            "no_dispenser": t.no_dispenser,
-            "produk": t.produk,
-            "volume_liter": float(t.volume_liter) if t.volume_liter is not None else None,
-            "penjualan_rupiah": float(t.penjualan_rupiah) if t.penjualan_rupiah is not None else None,
-            "operator": t.operator,
-            "mode_transaksi": t.mode_transaksi,
-            "plat_nomor": t.plat_nomor,
-            "nik": t.nik,
-            "sektor_non_kendaraan": t.sektor_non_kendaraan,
-            "jumlah_roda_kendaraan": t.jumlah_roda_kendaraan,
-            "kuota": float(t.kuota) if t.kuota is not None else None,
-            "warna_plat": t.warna_plat,
-            "created_at": t.created_at,
-            "updated_at": t.updated_at
-        } for t in transactions_to_analyze
-    ])
-
-    # Convert 'tanggal' and 'jam' to datetime objects for proper sorting and interval calculation
-    df_transactions['transaction_datetime'] = pd.to_datetime(df_transactions['tanggal'] + ' ' + df_transactions['jam'])
-    df_transactions = df_transactions.sort_values(by=['plat_nomor', 'transaction_datetime']).reset_index(drop=True)
-
-    # Dictionary to store anomaly results for each transaction_id_asersi
-    transaction_anomaly_results = {}
-
-    for index, transaction in df_transactions.iterrows():
-        transaction_id_asersi = transaction['transaction_id_asersi']
-        summary_id = transaction['daily_summary_id']
-        
-        is_anomalous = False
-        anomaly_flags = []
-        violation_details = {}
-
-        # --- Apply Transaction Anomaly Rules ---
-        for rule in transaction_rules:
-            # Example: VOLUME_EXCEED_60L_R4_BW
-            if rule.anomaly_type == "SINGLE_VOLUME_EXCEED":
-                if transaction['volume_liter'] is not None and transaction['volume_liter'] > rule.min_volume_liter:
-                    if rule.plate_color and transaction['warna_plat'] and transaction['warna_plat'].lower() in [pc.lower() for pc in rule.plate_color]:
-                        if rule.consumer_type and transaction['jumlah_roda_kendaraan'] and str(transaction['jumlah_roda_kendaraan']) == rule.consumer_type.split(' ')[1]: # e.g., "roda 4" -> "4"
-                            is_anomalous = True
-                            anomaly_flags.append(rule.anomaly_type)
-                            violation_details[rule.anomaly_type] = {
-                                "threshold": rule.min_volume_liter,
-                                "actual_volume": float(transaction['volume_liter']),
-                                "plate_color": transaction['warna_plat'],
-                                "consumer_type": transaction['jumlah_roda_kendaraan']
-                            }
-                            logger.debug(f"Anomaly detected: {rule.anomaly_type} for transaction {transaction_id_asersi}")
-
-        # --- Apply Special Anomaly Rules ---
-        for rule in special_rules:
-            if rule.criteria_code == "MISSING_PLAT_NOMOR":
-                if not transaction['plat_nomor']:
-                    is_anomalous = True
-                    anomaly_flags.append(rule.criteria_code)
-                    violation_details[rule.criteria_code] = {"message": rule.description}
-                    logger.debug(f"Anomaly detected: {rule.criteria_code} for transaction {transaction_id_asersi}")
-            
-            elif rule.criteria_code == "MISSING_NIK":
-                if not transaction['nik']:
-                    is_anomalous = True
-                    anomaly_flags.append(rule.criteria_code)
-                    violation_details[rule.criteria_code] = {"message": rule.description}
-                    logger.debug(f"Anomaly detected: {rule.criteria_code} for transaction {transaction_id_asersi}")
-
-            elif rule.criteria_code == "DUPLICATE_TRANSACTION":
-                # This is handled during import, but we can re-check if needed
-                # For now, assume batch_original_duplicate_count is reliable
-                original_transaction = db.query(CsvImportLog).filter_by(transaction_id_asersi=transaction_id_asersi).first()
-                if original_transaction and original_transaction.batch_original_duplicate_count > 0:
-                    is_anomalous = True
-                    anomaly_flags.append(rule.criteria_code)
-                    violation_details[rule.criteria_code] = {"message": rule.description, "duplicate_count": original_transaction.batch_original_duplicate_count}
-                    logger.debug(f"Anomaly detected: {rule.criteria_code} for transaction {transaction_id_asersi}")
-
-            elif rule.criteria_code == "RED_PLATE_VEHICLE":
-                if transaction['warna_plat'] and transaction['warna_plat'].lower() == 'merah':
-                    is_anomalous = True
-                    anomaly_flags.append(rule.criteria_code)
-                    violation_details[rule.criteria_code] = {"message": rule.description}
-                    logger.debug(f"Anomaly detected: {rule.criteria_code} for transaction {transaction_id_asersi}")
-            
-            elif rule.criteria_code == "TRANSACTION_INTERVAL_TOO_CLOSE":
-                # This requires looking at previous transactions for the same plat_nomor
-                # We need to ensure 'value' is an integer (seconds)
-                try:
-                    interval_threshold_seconds = int(rule.value)
-                except (ValueError, TypeError):
-                    logger.error(f"Invalid 'value' for TRANSACTION_INTERVAL_TOO_CLOSE rule: {rule.value}. Skipping.")
+    # Convert transactions to a DataFrame so every rule can be evaluated as a vectorized
+    # column operation. This also handles datetime conversions once.
+    with profiler.span("build_dataframe") as span:
+        df_transactions = pd.DataFrame([
+            {
+                "transaction_id_asersi": t.transaction_id_asersi,
+                "daily_summary_id": t.daily_summary_id,
+                "tanggal": t.tanggal,
+                "jam": t.jam,
+                "mor": t.mor,
+                "provinsi": t.provinsi,
+                "kota_kabupaten": t.kota_kabupaten,
+                "no_spbu": t.no_spbu,
+                "no_nozzle": t.no_nozzle,
+                "no_dispenser": t.no_dispenser,
+                "produk": t.produk,
+                "volume_liter": float(t.volume_liter) if t.volume_liter is not None else None,
+                "penjualan_rupiah": float(t.penjualan_rupiah) if t.penjualan_rupiah is not None else None,
+                "operator": t.operator,
+                "mode_transaksi": t.mode_transaksi,
+                "plat_nomor": t.plat_nomor,
+                "nik": t.nik,
+                "sektor_non_kendaraan": t.sektor_non_kendaraan,
+                "jumlah_roda_kendaraan": t.jumlah_roda_kendaraan,
+                "kuota": float(t.kuota) if t.kuota is not None else None,
+                "warna_plat": t.warna_plat,
+                "batch_original_duplicate_count": t.batch_original_duplicate_count,
+                "created_at": t.created_at,
+                "updated_at": t.updated_at
+            } for t in transactions_to_analyze
+        ])
+        del transactions_to_analyze
+
+        # Convert 'tanggal' and 'jam' to datetime objects for proper sorting and interval calculation
+        df_transactions['transaction_datetime'] = pd.to_datetime(df_transactions['tanggal'] + ' ' + df_transactions['jam'])
+        df_transactions = df_transactions.sort_values(by=['plat_nomor', 'transaction_datetime']).reset_index(drop=True)
+        span["rows"] = len(df_transactions)
+
+    return df_transactions
+
+def _evaluate_rules(df_transactions: pd.DataFrame, transaction_rules, special_rules, stats: Optional[dict],
+                    history: dict, profiler: SpanRecorder) -> dict:
+    """
+    Mengevaluasi setiap aturan satu kali atas seluruh DataFrame, diurutkan dari perkiraan biaya per hit
+    terkecil. Predikat di dalam aturan dievaluasi short-circuit, dan aturan yang terbukti tidak mungkin
+    terpicu menurut statistik summary tidak dievaluasi sama sekali.
+    Mengembalikan {rule_key: (flag, {index_baris: violation_details})}; aturan yang dilewati bernilai None.
+    """
+    total_rows = len(df_transactions)
+    plans = [
+        (f"TC_{rule.criteria_id}", rule.anomaly_type, *_transaction_rule_plan(rule, stats)) for rule in transaction_rules
+    ] + [
+        (f"SC_{rule.special_criteria_id}", rule.criteria_code, *_special_rule_plan(rule, stats)) for rule in special_rules
+    ]
+    planned = []
+    for rule_key, flag, predicates, details_for, skip_reason in plans:
+        if skip_reason:
+            planned.append((0.0, rule_key, flag, predicates, details_for, skip_reason))
+        else:
+            ordered, cost_per_hit = plan_predicates(rule_key, predicates, history, total_rows)
+            planned.append((cost_per_hit, rule_key, flag, ordered, details_for, None))
+    planned.sort(key=lambda plan: plan[0])
+
+    rule_hits = {}
+    with profiler.span("evaluate_rules", rows=total_rows):
+        for cost_per_hit, rule_key, flag, predicates, details_for, skip_reason in planned:
+            with profiler.span(rule_key, kind="rule", code=flag, rows_evaluated=0 if skip_reason else total_rows) as span:
+                if skip_reason:
+                    rule_hits[rule_key] = None
+                    span["hits"] = 0
+                    span["skipped"] = True
+                    span["skip_reason"] = skip_reason
                     continue
+                span["estimated_seconds_per_hit"] = cost_per_hit
+                hit_positions, span["predicates"] = evaluate_predicates(df_transactions, predicates)
+                rule_hits[rule_key] = (flag, dict(zip(hit_positions.tolist(), details_for(df_transactions, hit_positions))))
+                span["hits"] = len(hit_positions)
+    return rule_hits
 
-                # Get previous transaction for the same plat_nomor
-                if index > 0 and transaction['plat_nomor'] == df_transactions.loc[index-1, 'plat_nomor']:
-                    prev_transaction_datetime = df_transactions.loc[index-1, 'transaction_datetime']
-                    current_transaction_datetime = transaction['transaction_datetime']
-                    
-                    time_diff_seconds = (current_transaction_datetime - prev_transaction_datetime).total_seconds()
-
-                    if time_diff_seconds < interval_threshold_seconds:
-                        is_anomalous = True
-                        anomaly_flags.append(rule.criteria_code)
-                        violation_details[rule.criteria_code] = {
-                            "message": rule.description,
-                            "interval_threshold_seconds": interval_threshold_seconds,
-                            "actual_interval_seconds": time_diff_seconds,
-                            "previous_transaction_id": df_transactions.loc[index-1, 'transaction_id_asersi']
-                        }
-                        logger.debug(f"Anomaly detected: {rule.criteria_code} for transaction {transaction_id_asersi}")
-
-        # Store results for current transaction
-        if is_anomalous:
-            anomalies_found_count += 1
-            transaction_anomaly_results[transaction_id_asersi] = {
-                "summary_id": summary_id,
-                "is_anomalous": True,
-                "anomaly_flags": anomaly_flags,
-                "violation_details": violation_details,
-                "anomaly_datetime": datetime.now()
-            }
+def _template_rule_keys(template) -> list:
+    """Kunci aturan template dalam urutan evaluasi (aturan transaksi lalu aturan khusus)."""
+    return (
+        [f"TC_{rule.criteria_id}" for rule in template.transaction_criteria]
+        + [f"SC_{rule.special_criteria_id}" for rule in template.special_criteria]
+    )
+
+def _template_flags(rule_keys: list, rule_hits: dict, total_rows: int):
+    """Menyusun anomaly_flags dan violation_details per baris untuk satu template dari hasil aturan bersama."""
+    anomaly_flags = [[] for _ in range(total_rows)]
+    violation_details = [{} for _ in range(total_rows)]
+    for rule_key in rule_keys:
+        hit = rule_hits.get(rule_key)
+        if hit is None:
+            continue
+        flag, details_by_index = hit
+        for i, details in details_by_index.items():
+            anomaly_flags[i].append(flag)
+            violation_details[i][flag] = details
+    return anomaly_flags, violation_details
+
+def _save_results(db: Session, execution_id: str, template_id: int, df_transactions: pd.DataFrame,
+                  anomaly_flags: list, violation_details: list, profiler: SpanRecorder) -> int:
+    """Upsert hasil satu execution dan menghitung ulang rollup anomalinya; mengembalikan jumlah transaksi anomali."""
+    anomaly_datetime = datetime.now()
+    anomalies_found_count = 0
+    with profiler.span("save_results", rows=len(df_transactions), execution_id=execution_id):
+        existing_results = {
+            result.transaction_id_asersi: result
+            for result in db.query(AnomalyResult).filter(AnomalyResult.execution_id == execution_id).all()
+        }
+        transaction_ids = df_transactions['transaction_id_asersi'].tolist()
+        summary_id_values = df_transactions['daily_summary_id'].tolist()
+
+        for i, transaction_id_asersi in enumerate(transaction_ids):
+            is_anomalous = bool(anomaly_flags[i])
+            if is_anomalous:
+                anomalies_found_count += 1
+
+            existing_result = existing_results.get(transaction_id_asersi)
+            if not existing_result:
+                db.add(AnomalyResult(
+                    execution_id=execution_id,
+                    summary_id=int(summary_id_values[i]),
+                    transaction_id_asersi=transaction_id_asersi,
+                    template_id=template_id, # Store template_id
+                    is_anomalous=is_anomalous,
+                    anomaly_flags=anomaly_flags[i],
+                    violation_details=violation_details[i],
+                    anomaly_datetime=anomaly_datetime
+                ))
+            else:
+                existing_result.is_anomalous = is_anomalous
+                existing_result.anomaly_flags = anomaly_flags[i]
+                existing_result.violation_details = violation_details[i]
+                existing_result.anomaly_datetime = anomaly_datetime
+                existing_result.template_id = template_id # Update template_id
+
+        db.flush()
+
+    with profiler.span("refresh_rollup", execution_id=execution_id):
+        refresh_execution_anomalies(db, execution_id)
+    return anomalies_found_count
+
+def run_anomaly_analysis(execution_id: str, summary_ids: list, template_id: int, db: Session):
+    return run_multi_template_analysis([(execution_id, template_id)], summary_ids, db)[0]
+
+def run_multi_template_analysis(executions: list, summary_ids: list, db: Session) -> list:
+    """
+    Menjalankan beberapa execution [(execution_id, template_id), ...] atas summary yang sama dalam satu
+    pass data: transaksi diambil dan diurutkan sekali, gabungan aturan semua template dievaluasi sekali
+    (kriteria yang dipakai beberapa template tidak dievaluasi ulang), lalu hasil ditulis per execution
+    sesuai aturan template masing-masing. Mengembalikan hasil per execution dengan urutan yang sama.
+    """
+    logger.info(f"Starting anomaly analysis for executions: {executions}, summary_ids: {summary_ids}")
+    profiler = SpanRecorder()
+
+    # Fetch the anomaly templates and their associated criteria
+    with profiler.span("load_template"):
+        template_ids = list(dict.fromkeys(template_id for _, template_id in executions))
+        templates = {
+            template.template_id: template
+            for template in db.query(AnomalyTemplateMaster).options(
+                selectinload(AnomalyTemplateMaster.transaction_criteria),
+                selectinload(AnomalyTemplateMaster.special_criteria),
+                selectinload(AnomalyTemplateMaster.accumulated_criteria),
+            ).filter(AnomalyTemplateMaster.template_id.in_(template_ids))
+        }
+
+    results = {}
+    runnable = []
+    for execution_id, template_id in executions:
+        template = templates.get(template_id)
+        if not template:
+            logger.error(f"Anomaly template with ID {template_id} not found.")
+            results[execution_id] = {"status": "failed", "execution_id": execution_id, "message": f"Template {template_id} not found"}
         else:
-            # If no anomalies, ensure it's marked as not anomalous
-            transaction_anomaly_results[transaction_id_asersi] = {
-                "summary_id": summary_id,
-                "is_anomalous": False,
-                "anomaly_flags": [],
-                "violation_details": {},
-                "anomaly_datetime": datetime.now()
+            runnable.append((execution_id, template))
+
+    # Gabungan aturan semua template, unik per kriteria (urutan kemunculan pertama dipertahankan)
+    transaction_rules = list({rule.criteria_id: rule for _, t in runnable for rule in t.transaction_criteria}.values())
+    special_rules = list({rule.special_criteria_id: rule for _, t in runnable for rule in t.special_criteria}.values())
+    accumulated_rules = list({rule.accumulated_criteria_id: rule for _, t in runnable for rule in t.accumulated_criteria}.values())
+
+    logger.info(f"Loaded {len(transaction_rules)} transaction rules, {len(accumulated_rules)} accumulated rules, {len(special_rules)} special rules for templates {[t.template_id for _, t in runnable]}.")
+
+    if runnable and not summary_ids:
+        # Ensure summary_ids is not empty
+        logger.warning("No summary_ids provided for anomaly analysis. Skipping.")
+        for execution_id, _ in runnable:
+            results[execution_id] = {"status": "skipped", "execution_id": execution_id, "message": "No summary_ids provided"}
+        runnable = []
+
+    df_transactions = _load_transactions(db, summary_ids, profiler) if runnable else None
+    if runnable and df_transactions is None:
+        logger.info(f"No transactions found for summary_ids: {summary_ids}. No anomalies to check.")
+        for execution_id, _ in runnable:
+            results[execution_id] = {"status": "completed", "execution_id": execution_id, "summary_ids": summary_ids, "message": "No transactions to analyze"}
+        runnable = []
+
+    if runnable:
+        total_rows = len(df_transactions)
+        with profiler.span("plan_rules"):
+            summary_stats = load_summary_stats(db, summary_ids)
+            rule_history = load_rule_history(db)
+        rule_hits = _evaluate_rules(df_transactions, transaction_rules, special_rules, summary_stats, rule_history, profiler)
+
+        # --- Save Anomaly Results to Database, per execution ---
+        template_rules = [(execution_id, template.template_id, _template_rule_keys(template)) for execution_id, template in runnable]
+        for execution_id, template_id, rule_keys in template_rules:
+            anomaly_flags, violation_details = _template_flags(rule_keys, rule_hits, total_rows)
+            anomalies_found_count = _save_results(db, execution_id, template_id, df_transactions, anomaly_flags, violation_details, profiler)
+            # Hasil sudah di-flush: lepaskan objek ORM agar memori tidak bertambah per template
+            db.expunge_all()
+            logger.info(f"Evaluated {total_rows} transactions for execution_id {execution_id}: {anomalies_found_count} anomalous.")
+            results[execution_id] = {
+                "status": "completed",
+                "execution_id": execution_id,
+                "summary_ids": summary_ids,
+                "transactions_analyzed": total_rows,
+                "anomalies_found": anomalies_found_count
             }
 
-    # --- Save Anomaly Results to Database ---
-    for transaction_id_asersi, result_data in transaction_anomaly_results.items():
-        existing_result = db.query(AnomalyResult).filter(
-            AnomalyResult.execution_id == execution_id,
-            AnomalyResult.transaction_id_asersi == transaction_id_asersi
-        ).first()
-
-        if not existing_result:
-            actual_anomaly = AnomalyResult(
-                execution_id=execution_id,
-                summary_id=result_data['summary_id'],
-                transaction_id_asersi=transaction_id_asersi,
-                template_id=template_id, # Store template_id
-                is_anomalous=result_data['is_anomalous'],
-                anomaly_flags=result_data['anomaly_flags'],
-                violation_details=result_data['violation_details'],
-                anomaly_datetime=result_data['anomaly_datetime']
-            )
-            db.add(actual_anomaly)
-            logger.info(f"Stored anomaly result for transaction_id_asersi {transaction_id_asersi}")
-        else:
-            existing_result.is_anomalous = result_data['is_anomalous']
-            existing_result.anomaly_flags = result_data['anomaly_flags']
-            existing_result.violation_details = result_data['violation_details']
-            existing_result.anomaly_datetime = result_data['anomaly_datetime']
-            existing_result.template_id = template_id # Update template_id
-            logger.info(f"Updated existing anomaly result for transaction_id_asersi {transaction_id_asersi}")
-    
-    db.commit()
+        # Store the per-stage / per-rule profile on the executions so it can be inspected via the API
+        profile = profiler.to_dict()
+        execution_ids = [execution_id for execution_id, _, _ in template_rules]
+        for execution in db.query(AnomalyExecution).filter(AnomalyExecution.execution_id.in_(execution_ids)):
+            rules_config = dict(execution.rules_config or {})
+            rules_config["profile"] = profile
+            execution.rules_config = rules_config
+
+        db.commit()
+        cache.bump_version(cache.RESULTS_NAMESPACE)
+
+    return [results[execution_id] for execution_id, _ in executions]
@@ -1,6 +1,9 @@
 from __future__ import annotations # Enable Postponed Evaluation of Annotations
+from sqlalchemy import cast, func, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from app import cache, template_catalog
 from app.models import AnomalyTemplateMaster, SpecialAnomalyCriteria, TransactionAnomalyCriteria, AccumulatedAnomalyCriteria, VideoAiParameter, AnomalyResult, AnomalyExecution, AnomalyExecutionBatch, CsvSummaryMasterDaily, CsvImportLog, TabelMor
 from app.schemas import (
     AnomalyTemplateMasterCreate, SpecialAnomalyCriteriaCreate, SpecialAnomalyCriteriaUpdate,
@@ -9,6 +12,10 @@ from app.schemas import (
     AnomalyResultCreate, AnomalyResultUpdate
 )
 
+def _templates_changed():
+    # Template list/detail memuat kriteria yang tertaut, jadi perubahan kriteria juga membatalkan katalog template
+    template_catalog.bump_version()
+
 def get_templates(db: Session):
     return db.query(AnomalyTemplateMaster).order_by(AnomalyTemplateMaster.role_name).all()
 
@@ -19,6 +26,7 @@ def create_template(db: Session, template: AnomalyTemplateMasterCreate):
     db_template = AnomalyTemplateMaster(**template.dict())
     db.add(db_template)
     db.commit()
+    _templates_changed()
     db.refresh(db_template)
     return db_template
 
@@ -33,12 +41,14 @@ def update_template_links(db: Session, template_id: int, volume_ids: List[int],
     template.accumulated_criteria = db.query(AccumulatedAnomalyCriteria).filter(AccumulatedAnomalyCriteria.accumulated_criteria_id.in_(accumulated_ids)).all()
     
     db.commit()
+    _templates_changed()
     return template
 
 def set_active_template(db: Session, template_id: int):
     db.query(AnomalyTemplateMaster).update({"is_default": False})
     db.query(AnomalyTemplateMaster).filter(AnomalyTemplateMaster.template_id == template_id).update({"is_default": True})
     db.commit()
+    _templates_changed()
 
 def duplicate_template(db: Session, template_id: int):
     original = get_template(db, template_id)
@@ -60,6 +70,7 @@ def duplicate_template(db: Session, template_id: int):
     clone.video_parameters = original.video_parameters
     clone.accumulated_criteria = original.accumulated_criteria
     db.commit()
+    _templates_changed()
     return clone
 
 def delete_template(db: Session, template_id: int):
@@ -67,6 +78,7 @@ def delete_template(db: Session, template_id: int):
     if template:
         db.delete(template)
         db.commit()
+        _templates_changed()
         return template
 
 # CRUD for SpecialAnomalyCriteria
@@ -80,6 +92,7 @@ def create_special_criteria(db: Session, criteria: SpecialAnomalyCriteriaCreate)
     db_criteria = SpecialAnomalyCriteria(**criteria.dict())
     db.add(db_criteria)
     db.commit()
+    _templates_changed()
     db.refresh(db_criteria)
     return db_criteria
 
@@ -89,6 +102,7 @@ def update_special_criteria(db: Session, special_criteria_id: int, criteria: Spe
         for key, value in criteria.dict(exclude_unset=True).items():
             setattr(db_criteria, key, value)
         db.commit()
+        _templates_changed()
         db.refresh(db_criteria)
     return db_criteria
 
@@ -97,6 +111,7 @@ def delete_special_criteria(db: Session, special_criteria_id: int):
     if db_criteria:
         db.delete(db_criteria)
         db.commit()
+        _templates_changed()
     return db_criteria
 
 # CRUD for TransactionAnomalyCriteria
@@ -110,6 +125,7 @@ def create_transaction_criteria(db: Session, criteria: TransactionAnomalyCriteri
     db_criteria = TransactionAnomalyCriteria(**criteria.dict())
     db.add(db_criteria)
     db.commit()
+    _templates_changed()
     db.refresh(db_criteria)
     return db_criteria
 
@@ -119,6 +135,7 @@ def update_transaction_criteria(db: Session, criteria_id: int, criteria: Transac
         for key, value in criteria.dict(exclude_unset=True).items():
             setattr(db_criteria, key, value)
         db.commit()
+        _templates_changed()
         db.refresh(db_criteria)
     return db_criteria
 
@@ -127,6 +144,7 @@ def delete_transaction_criteria(db: Session, criteria_id: int):
     if db_criteria:
         db.delete(db_criteria)
         db.commit()
+        _templates_changed()
     return db_criteria
 
 # CRUD for AccumulatedAnomalyCriteria
@@ -140,6 +158,7 @@ def create_accumulated_criteria(db: Session, criteria: AccumulatedAnomalyCriteri
     db_criteria = AccumulatedAnomalyCriteria(**criteria.dict())
     db.add(db_criteria)
     db.commit()
+    _templates_changed()
     db.refresh(db_criteria)
     return db_criteria
 
@@ -149,6 +168,7 @@ def update_accumulated_criteria(db: Session, accumulated_criteria_id: int, crite
         for key, value in criteria.dict(exclude_unset=True).items():
             setattr(db_criteria, key, value)
         db.commit()
+        _templates_changed()
         db.refresh(db_criteria)
     return db_criteria
 
@@ -157,6 +177,7 @@ def delete_accumulated_criteria(db: Session, accumulated_criteria_id: int):
     if db_criteria:
         db.delete(db_criteria)
         db.commit()
+        _templates_changed()
     return db_criteria
 
 # CRUD for AnomalyResult
@@ -164,12 +185,69 @@ def create_anomaly_result(db: Session, result_data: AnomalyResultCreate) -> Anom
     db_result = AnomalyResult(**result_data.dict())
     db.add(db_result)
     db.commit()
+    cache.bump_version(cache.RESULTS_NAMESPACE)
     db.refresh(db_result)
     return db_result
 
 def get_anomaly_results_by_summary_id(db: Session, summary_id: int) -> List[AnomalyResult]:
     return db.query(AnomalyResult).filter(AnomalyResult.summary_id == summary_id).all()
 
+def _anomaly_result_conditions(execution_id: Optional[str], summary_id: Optional[int], flag: Optional[str], anomalous_only: bool) -> list:
+    conditions = []
+    if execution_id is not None:
+        conditions.append(AnomalyResult.execution_id == execution_id)
+    if summary_id is not None:
+        conditions.append(AnomalyResult.summary_id == summary_id)
+    if anomalous_only or flag:
+        # Bentuk '= true' (bukan IS TRUE) agar bisa memakai index dan partial index is_anomalous
+        conditions.append(AnomalyResult.is_anomalous == True)
+    if flag:
+        # anomaly_flags disimpan sebagai teks JSON (SQLiteARRAY)
+        conditions.append(cast(AnomalyResult.anomaly_flags, JSONB).has_key(flag))
+    return conditions
+
+def get_anomaly_results_page(
+    db: Session, execution_id: Optional[str], summary_id: Optional[int], flag: Optional[str],
+    anomalous_only: bool, limit: int, after: Optional[tuple] = None
+) -> tuple[list, Optional[tuple]]:
+    """
+    Satu halaman hasil anomali berurutan (execution_id, transaction_id_asersi), memakai keyset
+    `after` = posisi baris terakhir halaman sebelumnya. Mengembalikan (rows, posisi berikutnya atau None).
+    Dilayani index ix_anomaly_results_execution_anomalous / ix_anomaly_results_summary,
+    sehingga biaya per halaman tidak bergantung pada ukuran execution.
+    """
+    query = db.query(*(AnomalyResult.__table__.columns)).filter(
+        *_anomaly_result_conditions(execution_id, summary_id, flag, anomalous_only)
+    )
+    if after is not None and execution_id is not None:
+        # execution_id sudah tetap: pembanding satu kolom agar index scan langsung mulai dari posisi cursor
+        # (perbandingan ROW(execution_id, transaction_id_asersi) menyapu ulang semua entry sebelum cursor)
+        query = query.filter(AnomalyResult.transaction_id_asersi > after[1])
+    elif after is not None:
+        query = query.filter(tuple_(AnomalyResult.execution_id, AnomalyResult.transaction_id_asersi) > after)
+    rows = query.order_by(AnomalyResult.execution_id, AnomalyResult.transaction_id_asersi).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1].execution_id, rows[-1].transaction_id_asersi)
+    return rows, None
+
+def count_anomaly_flags(db: Session, execution_id: Optional[str], summary_id: Optional[int]) -> tuple[int, list]:
+    """Jumlah transaksi anomali dan jumlah per flag (satu transaksi bisa memiliki beberapa flag)."""
+    conditions = _anomaly_result_conditions(execution_id, summary_id, None, True)
+    total = db.query(func.count()).select_from(AnomalyResult).filter(*conditions).scalar()
+    flags = (
+        db.query(func.jsonb_array_elements_text(cast(AnomalyResult.anomaly_flags, JSONB)).label('flag'))
+        .filter(*conditions)
+        .subquery()
+    )
+    counts = (
+        db.query(flags.c.flag, func.count().label('count'))
+        .group_by(flags.c.flag)
+        .order_by(func.count().desc(), flags.c.flag)
+        .all()
+    )
+    return total, counts
+
 def get_anomaly_result_by_transaction_id(db: Session, transaction_id_asersi: str) -> Optional[AnomalyResult]:
     return db.query(AnomalyResult).filter(AnomalyResult.transaction_id_asersi == transaction_id_asersi).first()
 
@@ -179,5 +257,6 @@ def update_anomaly_result(db: Session, transaction_id_asersi: str, result_data:
         for key, value in result_data.dict(exclude_unset=True).items():
             setattr(db_result, key, value)
         db.commit()
+        cache.bump_version(cache.RESULTS_NAMESPACE)
         db.refresh(db_result)
     return db_result
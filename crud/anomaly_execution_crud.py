@@ -1,10 +1,22 @@
 from __future__ import annotations # Enable Postponed Evaluation of Annotations
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.models import AnomalyTemplateMaster, TransactionAnomalyCriteria, SpecialAnomalyCriteria, AccumulatedAnomalyCriteria, VideoAiParameter, AnomalyResult, AnomalyExecution, AnomalyExecutionBatch, CsvSummaryMasterDaily, CsvImportLog, TabelMor
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import os
 import uuid
 
+# Status execution yang masih akan/sedang berjalan; fingerprint unik di antara status ini
+INFLIGHT_STATUSES = ("QUEUED", "PENDING", "RUNNING")
+ANALYSIS_JOB_TIMEOUT = int(os.getenv("ANALYSIS_JOB_TIMEOUT", "3600"))
+# Execution in-flight yang lebih tua dari ini dianggap macet (worker mati tanpa sempat menandai FAILED)
+EXECUTION_STALE_AFTER = timedelta(seconds=2 * ANALYSIS_JOB_TIMEOUT)
+
 def create_anomaly_execution(
     db: Session,
     template_id: int, # Added template_id
@@ -66,6 +78,92 @@ def create_anomaly_execution_batch(
     db.refresh(db_batch)
     return db_batch
 
+def submission_fingerprint(template_snapshot: dict, summary_ids: List[int]) -> str:
+    """
+    Fingerprint submission: template beserta isi kriteria tertautnya (snapshot dari katalog template,
+    jadi perubahan kriteria menghasilkan fingerprint baru) dan set summary yang dianalisis.
+    """
+    payload = json.dumps({"template": template_snapshot, "summary_ids": sorted(set(summary_ids))}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_inflight_execution_by_fingerprint(db: Session, fingerprint: str) -> Optional[AnomalyExecution]:
+    """Execution in-flight dengan fingerprint ini; execution yang macet ditandai FAILED dan diabaikan."""
+    row = db.query(
+        AnomalyExecution,
+        (AnomalyExecution.execution_timestamp < func.now() - EXECUTION_STALE_AFTER).label("stale")
+    ).filter(
+        AnomalyExecution.submission_fingerprint == fingerprint,
+        AnomalyExecution.status.in_(INFLIGHT_STATUSES)
+    ).first()
+    if row is None:
+        return None
+    execution, stale = row
+    if stale:
+        logging.warning(f"Execution {execution.execution_id} masih {execution.status} setelah {EXECUTION_STALE_AFTER}; ditandai FAILED.")
+        execution.status = "FAILED"
+        db.flush()
+        return None
+    return execution
+
+def submit_anomaly_execution(
+    db: Session,
+    template_id: int,
+    executed_by: str,
+    rules_applied: List[str],
+    summary_ids: List[int],
+    fingerprint: str,
+    rules_config: Optional[dict] = None
+) -> tuple[str, str, bool]:
+    """
+    Membuat execution (status PENDING) beserta semua batch-nya dalam satu transaksi, dengan batch
+    di-insert sekaligus. Jika execution identik (fingerprint sama) masih in-flight, execution itu
+    yang dikembalikan. Mengembalikan (execution_id, status, dibuat_baru).
+    """
+    existing = get_inflight_execution_by_fingerprint(db, fingerprint)
+    if existing:
+        return existing.execution_id, existing.status, False
+
+    execution_id = str(uuid.uuid4())
+    execution = AnomalyExecution(
+        execution_id=execution_id,
+        template_id=template_id,
+        execution_timestamp=datetime.now(),
+        executed_by=executed_by,
+        status="PENDING",
+        rules_applied=rules_applied,
+        rules_config=rules_config,
+        total_batches_processed=len(summary_ids),
+        submission_fingerprint=fingerprint
+    )
+    db.add(execution)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Submission identik lain menang duluan (unique index ux_anomaly_executions_inflight_fingerprint)
+        db.rollback()
+        existing = get_inflight_execution_by_fingerprint(db, fingerprint)
+        if existing:
+            return existing.execution_id, existing.status, False
+        raise
+
+    if summary_ids:
+        db.execute(insert(AnomalyExecutionBatch), [
+            {"execution_id": execution_id, "summary_id": summary_id, "batch_status": "QUEUED", "anomalies_found": 0}
+            for summary_id in summary_ids
+        ])
+    db.commit()
+    return execution_id, "PENDING", True
+
+def finish_anomaly_execution(db: Session, execution_id: str, status: str):
+    """Menetapkan status akhir (COMPLETED/FAILED) execution dan semua batch-nya dalam satu commit."""
+    db.query(AnomalyExecution).filter(AnomalyExecution.execution_id == execution_id).update(
+        {"status": status}, synchronize_session=False
+    )
+    db.query(AnomalyExecutionBatch).filter(AnomalyExecutionBatch.execution_id == execution_id).update(
+        {"batch_status": status}, synchronize_session=False
+    )
+    db.commit()
+
 def get_anomaly_execution_batches_by_execution_id(db: Session, execution_id: str) -> List[AnomalyExecutionBatch]:
     """
     Retrieves a list of AnomalyExecutionBatch records for a given execution_id.
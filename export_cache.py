@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from psycopg2 import sql
+
+# --- Konfigurasi ---
+# Cache hasil ekspor: file yang sama (summary, source, filter, format, dan versi data yang sama)
+# tidak dirender ulang. File cache disimpan content-addressed di EXPORT_CACHE_DIR dan di-hardlink ke
+# exports/<file_name> yang diminta setiap job, sehingga callback tetap memakai nama file milik job itu.
+EXPORT_CACHE_ENABLED = os.getenv('EXPORT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'on')
+EXPORT_CACHE_DIR = 'exports/cache'
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_MB', '5120')) * 1024 * 1024
+EXPORT_CACHE_MAX_AGE_SECONDS = int(os.getenv('EXPORT_CACHE_MAX_AGE_HOURS', '24')) * 3600
+
+def canonical_filters(filters):
+    """
+    Normalisasi filter agar permintaan yang setara menghasilkan key yang sama:
+    grup (AND) dan kondisi di dalam grup (OR) bersifat komutatif sehingga diurutkan.
+    """
+    groups = []
+    for group in filters or []:
+        conditions = sorted(
+            (json.dumps(condition, sort_keys=True, default=str) for condition in group.get('conditions', [])),
+        )
+        if conditions:
+            groups.append(conditions)
+    return sorted(groups)
+
+def summary_data_version(cursor, summary_id):
+    """
+    Penanda perubahan data sebuah summary. Berubah ketika baris summary diperbarui
+    (mis. recount) atau ketika transaksi ditambah, dipindah ke summary lain, atau di-upsert ulang
+    (import_attempt_count naik setiap ON CONFLICT).
+    """
+    cursor.execute(sql.SQL("""
+        SELECT
+            (SELECT md5(s::text) FROM csv_summary_master_daily s WHERE s.summary_id = %s),
+            COUNT(*), MAX(id), SUM(import_attempt_count), SUM(batch_original_duplicate_count)
+        FROM csv_import_log
+        WHERE daily_summary_id = %s
+    """), (summary_id, summary_id))
+    return [str(value) if value is not None else None for value in cursor.fetchone()]
+
+def execution_data_version(cursor, execution_id):
+    """
+    Penanda perubahan hasil analisis sebuah execution. Analisis ulang memperbarui baris
+    anomaly_results yang sama (updated_at/anomaly_datetime berubah) dan status execution.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT
+            (SELECT md5(e::text) FROM anomaly_executions e WHERE e.execution_id = %s),
+            COUNT(*), MAX(updated_at), MAX(anomaly_datetime)
+        FROM anomaly_results
+        WHERE execution_id = %s AND is_anomalous
+    """), (execution_id, execution_id))
+    return [str(value) if value is not None else None for value in cursor.fetchone()]
+
+def cache_key(cursor, job_data, summary_ids, compression=None):
+    """Hash SHA-256 dari permintaan ekspor yang sudah dinormalisasi dan versi data setiap summary-nya."""
+    payload = {
+        'summary_ids': list(summary_ids),
+        'source': job_data['source'],
+        'filters': canonical_filters(job_data.get('filters')) if job_data['source'] in ('filtered', 'anomalies') else [],
+        'format': job_data['format'],
+        'compression': list(compression) if compression and job_data['format'] == 'csv' else None,
+        'data_version': [summary_data_version(cursor, summary_id) for summary_id in summary_ids],
+    }
+    if job_data['source'] == 'anomalies':
+        payload['execution_id'] = job_data['execution_id']
+        payload['execution_version'] = execution_data_version(cursor, job_data['execution_id'])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+def cache_relative_path(key, extension):
+    return f"{EXPORT_CACHE_DIR}/{key}.{extension}"
+
+def entry_base_name(key):
+    """
+    Nama dasar entry di dalam arsip yang di-cache (profile_<nama>.csv, data_<nama>.csv, ...).
+    Diturunkan dari key, bukan dari file_name job yang pertama mengisi cache, karena arsip yang
+    sama diberikan ke semua job dengan permintaan identik.
+    """
+    return f"export_{key[:12]}"
+
+def publish(storage_root, cached_relative_path, relative_path):
+    """
+    Menautkan file cache ke path yang diminta job lewat hardlink (tanpa menyalin data; salinan
+    dipakai jika hardlink tidak didukung). File lama di path tujuan diganti secara atomik.
+    """
+    source = os.path.join(storage_root, cached_relative_path)
+    target = os.path.join(storage_root, relative_path)
+    temp_path = f"{target}.{uuid.uuid4().hex}.part"
+    try:
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return relative_path
+
+def lookup(storage_root, key, extension):
+    """
+    Mengembalikan path relatif file cache jika ada (dan memperbarui mtime-nya untuk eviksi LRU),
+    atau None jika belum ada / sudah kedaluwarsa.
+    """
+    relative_path = cache_relative_path(key, extension)
+    full_path = os.path.join(storage_root, relative_path)
+    try:
+        if time.time() - os.path.getmtime(full_path) > EXPORT_CACHE_MAX_AGE_SECONDS:
+            return None
+        os.utime(full_path)
+    except OSError:
+        return None
+    return relative_path
+
+def evict(storage_root):
+    """
+    Menghapus file cache yang lebih tua dari EXPORT_CACHE_MAX_AGE_SECONDS, lalu file yang paling
+    lama tidak dipakai sampai total ukuran cache di bawah EXPORT_CACHE_MAX_BYTES.
+    """
+    cache_dir = os.path.join(storage_root, EXPORT_CACHE_DIR)
+    now = time.time()
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                # File .part adalah ekspor yang sedang ditulis
+                if not entry.is_file() or entry.name.endswith('.part'):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if now - mtime <= EXPORT_CACHE_MAX_AGE_SECONDS and total_bytes <= EXPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+    if removed:
+        logging.info(f"Cache ekspor: {removed} file dihapus, sisa {total_bytes} byte.")
@@ -2,20 +2,90 @@ import logging
 import json
 import time
 import os
-import pandas as pd
 import psycopg2
 from psycopg2 import sql
 import redis
 import requests
 import zipfile
+import tarfile
+import zlib
+import datetime
+import decimal
 import io
+import tempfile
+import uuid
+import shutil
+from collections import deque
+from functools import partial
+import signal
+import socket
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+from psycopg2 import pool as pg_pool
+from openpyxl import Workbook
+import export_cache
+from app.filter_compiler import apply_filters, check_filter_plan, explain_plan
 
 # --- Konfigurasi ---
 # Pastikan variabel-variabel ini sesuai dengan lingkungan Anda
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 EXPORT_QUEUE = 'export-queue'
-LARAVEL_STORAGE_PATH = '/home/bphmigas/datavista_app/storage/app/public/exports'
+# List 'in-flight' per worker: job dipindah atomik dari EXPORT_QUEUE ke sini dan baru dihapus setelah selesai,
+# sehingga job milik worker yang crash bisa dikembalikan ke antrian saat worker lain start.
+EXPORT_PROCESSING_PREFIX = 'export-queue:processing:'
+EXPORT_HEARTBEAT_PREFIX = 'export-worker:heartbeat:'
+# Job yang gagal (child process mati, worker crash) dicoba ulang paling banyak EXPORT_MAX_ATTEMPTS kali
+# (dihitung per job_id di hash EXPORT_ATTEMPTS_KEY), lalu dipindah ke dead-letter list dengan callback FAILED
+EXPORT_MAX_ATTEMPTS = int(os.getenv('EXPORT_MAX_ATTEMPTS', '3'))
+EXPORT_ATTEMPTS_KEY = 'export-queue:attempts'
+EXPORT_DEAD_LETTER_QUEUE = 'export-queue:dead'
+# Key yang wajib ada sebelum job boleh dijalankan (dipakai sebelum job bisa dilaporkan FAILED)
+REQUIRED_JOB_KEYS = ('job_id', 'callback_url')
+EXPORT_HEARTBEAT_TTL = int(os.getenv('EXPORT_HEARTBEAT_TTL', '30'))
+EXPORT_WORKER_ID = os.getenv('EXPORT_WORKER_ID', f"{socket.gethostname()}:{os.getpid()}")
+# Jumlah job ekspor yang diproses bersamaan dan mode eksekusinya ('thread' atau 'process')
+EXPORT_WORKER_CONCURRENCY = int(os.getenv('EXPORT_WORKER_CONCURRENCY', '4'))
+EXPORT_WORKER_MODE = os.getenv('EXPORT_WORKER_MODE', 'thread').lower()
+# Batas memori total worker (proses utama + child process); 0 = tanpa batas.
+# Selama RSS di atas batas, worker tidak mengambil job baru sampai job yang berjalan selesai.
+EXPORT_MEMORY_BUDGET_MB = int(os.getenv('EXPORT_MEMORY_BUDGET_MB', '0'))
+LARAVEL_PUBLIC_STORAGE_PATH = os.getenv('LARAVEL_PUBLIC_STORAGE_PATH', '/home/bphmigas/datavista_app/storage/app/public')
+LARAVEL_STORAGE_PATH = os.path.join(LARAVEL_PUBLIC_STORAGE_PATH, 'exports')
+# Ukuran buffer yang dipakai COPY TO STDOUT saat menulis ke entry ZIP
+COPY_BUFFER_SIZE = 1024 * 1024
+# OID tipe numerik PostgreSQL (float4, float8, numeric) yang ditulis dengan desimal koma
+NUMERIC_TYPE_OIDS = {700, 701, 1700}
+# Batas baris per sheet Excel (1.048.576 termasuk header); sisanya pindah ke sheet data_2, data_3, dst.
+XLSX_MAX_DATA_ROWS_PER_SHEET = 1048575
+# Jumlah baris yang diambil per round-trip dari server-side cursor
+XLSX_FETCH_SIZE = 10000
+# Jumlah baris per row group Parquet (satu batch fetch dari server-side cursor)
+PARQUET_ROW_GROUP_SIZE = int(os.getenv('PARQUET_ROW_GROUP_SIZE', '100000'))
+PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd')
+# Jumlah query per-summary yang dijalankan paralel pada ekspor multi-summary (masing-masing satu koneksi)
+EXPORT_SHARD_CONCURRENCY = int(os.getenv('EXPORT_SHARD_CONCURRENCY', '4'))
+# Progres job ekspor dipublikasikan ke Redis hash export:progress:<job_id> paling sering tiap interval ini
+EXPORT_PROGRESS_PREFIX = 'export:progress:'
+EXPORT_PROGRESS_INTERVAL = float(os.getenv('EXPORT_PROGRESS_INTERVAL', '2'))
+EXPORT_PROGRESS_TTL = int(os.getenv('EXPORT_PROGRESS_TTL_HOURS', '24')) * 3600
+# Riwayat throughput job yang selesai (dibatasi EXPORT_THROUGHPUT_HISTORY entri terbaru)
+EXPORT_THROUGHPUT_KEY = 'export:throughput'
+EXPORT_THROUGHPUT_HISTORY = 1000
+# Format yang hasilnya dibungkus dalam ZIP (profile + data)
+ZIP_FORMATS = {'csv', 'parquet'}
+# Kompresi arsip CSV yang bisa dipilih per permintaan: 'deflate'/'store' menghasilkan ZIP,
+# 'gzip'/'zstd' menghasilkan tar yang dikompresi per blok secara paralel (seperti pigz / zstd -T).
+# Untuk konsumen di LAN pilih 'store' atau level rendah, untuk konsumen remote level tinggi.
+COMPRESSION_EXTENSIONS = {'deflate': 'zip', 'store': 'zip', 'gzip': 'tar.gz', 'zstd': 'tar.zst'}
+COMPRESSION_LEVELS = {'deflate': (0, 9), 'store': (0, 0), 'gzip': (1, 9), 'zstd': (1, 22)}
+EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'deflate').lower()
+EXPORT_COMPRESSION_LEVEL = int(os.environ['EXPORT_COMPRESSION_LEVEL']) if os.getenv('EXPORT_COMPRESSION_LEVEL') else None
+# Thread pool kompresi bersama untuk semua job di proses ini; 1 = kompresi di thread job sendiri
+EXPORT_COMPRESSION_THREADS = int(os.getenv('EXPORT_COMPRESSION_THREADS', str(min(4, os.cpu_count() or 1))))
+# Ukuran blok yang dikompresi mandiri; blok yang sedang dikompresi per job dibatasi 2x jumlah thread
+EXPORT_COMPRESSION_BLOCK_SIZE = int(os.getenv('EXPORT_COMPRESSION_BLOCK_MB', '4')) * 1024 * 1024
 
 # Impor konfigurasi database dari file yang sudah ada
 try:
@@ -29,15 +99,133 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # --- Fungsi Helper ---
 
+# Pool koneksi milik proses ini (diisi oleh init_db_pool); None = koneksi langsung per job
+_db_pool = None
+
+def init_db_pool(max_connections, min_connections=1):
+    """
+    Membuat pool koneksi psycopg2 untuk proses ini. Setiap job meminjam satu koneksi sendiri.
+    Sebanyak min_connections koneksi tetap terbuka untuk dipakai ulang; sisanya dibuka sesuai kebutuhan.
+    """
+    global _db_pool
+    _db_pool = pg_pool.ThreadedConnectionPool(min_connections, max_connections, **POSTGRES_CONFIG)
+
 def get_db_connection():
-    """Membuat koneksi database psycopg2."""
+    """Mengambil koneksi database psycopg2 (dari pool jika sudah diinisialisasi)."""
     try:
+        if _db_pool is not None:
+            return _db_pool.getconn()
         conn = psycopg2.connect(**POSTGRES_CONFIG)
         return conn
     except psycopg2.Error as e:
         logging.error(f"Gagal terhubung ke database: {e}")
         return None
 
+def release_db_connection(conn):
+    """Mengembalikan koneksi ke pool (transaksi yang masih terbuka di-rollback oleh pool) atau menutupnya."""
+    if _db_pool is not None:
+        _db_pool.putconn(conn, close=bool(conn.closed))
+    else:
+        conn.close()
+
+_progress_redis = None
+
+def get_progress_redis():
+    """Klien Redis untuk publikasi progres (dibuat sekali per proses; aman dipakai bersama antar thread)."""
+    global _progress_redis
+    if _progress_redis is None:
+        _progress_redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True,
+                                      socket_connect_timeout=2, socket_timeout=2)
+    return _progress_redis
+
+class ExportProgress:
+    """
+    Progres satu job ekspor di Redis hash export:progress:<job_id>: baris dan byte yang sudah ditulis,
+    estimasi total baris, dan throughput. Dipanggil dari beberapa thread shard sehingga dijaga lock.
+    Kegagalan Redis hanya dicatat; ekspor tetap berjalan.
+    """
+
+    def __init__(self, job_id, redis_client=None):
+        self.job_id = job_id
+        self.key = f"{EXPORT_PROGRESS_PREFIX}{job_id}"
+        self.redis = redis_client
+        self.rows_written = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_publish = 0.0
+
+    def publish(self, **fields):
+        if self.redis is None:
+            return
+        fields['updated_at'] = datetime.datetime.now().isoformat()
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, mapping={k: '' if v is None else v for k, v in fields.items()})
+            pipe.expire(self.key, EXPORT_PROGRESS_TTL)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            # Jangan memperlambat ekspor dengan mencoba lagi setiap batch
+            logging.warning(f"[{self.job_id}] Gagal mempublikasikan progres ekspor, progres dinonaktifkan: {e}")
+            self.redis = None
+
+    def start(self, export_format, estimated_total_rows):
+        self.publish(
+            status='RUNNING', format=export_format, started_at=datetime.datetime.now().isoformat(),
+            estimated_total_rows=estimated_total_rows, rows_written=0, bytes_written=0,
+        )
+
+    def add(self, rows=0, nbytes=0):
+        with self._lock:
+            self.rows_written += rows
+            self.bytes_written += nbytes
+            now = time.monotonic()
+            if now - self._last_publish < EXPORT_PROGRESS_INTERVAL:
+                return
+            self._last_publish = now
+            rows_written, bytes_written = self.rows_written, self.bytes_written
+        self.publish(rows_written=rows_written, bytes_written=bytes_written, elapsed_seconds=round(now - self._started, 3))
+
+    def complete(self, rows_written, file_path, file_size_bytes, cache_hit=False):
+        elapsed = time.monotonic() - self._started
+        throughput = {
+            'rows_written': rows_written,
+            'bytes_written': max(self.bytes_written, file_size_bytes),
+            'file_size_bytes': file_size_bytes,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(rows_written / elapsed, 3) if elapsed > 0 else None,
+            'bytes_per_second': round(file_size_bytes / elapsed, 3) if elapsed > 0 else None,
+        }
+        self.publish(status='COMPLETED', file_path=file_path, cache_hit=int(cache_hit),
+                     finished_at=datetime.datetime.now().isoformat(), **throughput)
+        if self.redis is not None and not cache_hit:
+            try:
+                self.redis.lpush(EXPORT_THROUGHPUT_KEY, json.dumps({'job_id': self.job_id, **throughput}))
+                self.redis.ltrim(EXPORT_THROUGHPUT_KEY, 0, EXPORT_THROUGHPUT_HISTORY - 1)
+            except redis.exceptions.RedisError as e:
+                logging.warning(f"[{self.job_id}] Gagal mencatat throughput ekspor: {e}")
+
+    def fail(self, error_message):
+        self.publish(status='FAILED', error_message=error_message, rows_written=self.rows_written,
+                     finished_at=datetime.datetime.now().isoformat(),
+                     elapsed_seconds=round(time.monotonic() - self._started, 3))
+
+class ProgressStream:
+    """Membungkus stream tujuan COPY: meneruskan data sambil menghitung byte dan baris (baris header dilewati)."""
+
+    def __init__(self, stream, progress, header=True):
+        self.stream = stream
+        self.progress = progress
+        self._skip_newlines = 1 if header else 0
+
+    def write(self, data):
+        written = self.stream.write(data)
+        rows = data.count(b'\n' if isinstance(data, bytes) else '\n')
+        skipped = min(rows, self._skip_newlines)
+        self._skip_newlines -= skipped
+        self.progress.add(rows=rows - skipped, nbytes=len(data))
+        return written
+
 def send_callback(url, status, file_path=None, error_message=None):
     """Mengirim status kembali ke Laravel."""
     payload = {
@@ -53,39 +241,617 @@ def send_callback(url, status, file_path=None, error_message=None):
         logging.error(f"Gagal mengirim callback ke {url}: {e}")
 
 def build_query(base_query, filters):
-    """Membangun klausa WHERE secara dinamis dari filter."""
-    where_clauses = []
-    params = []
-    
-    if not filters:
-        return base_query, params
-
-    for group in filters:
-        group_clauses = []
-        for condition in group.get('conditions', []):
-            field = condition.get('field')
-            operator = condition.get('operator')
-            value = condition.get('value')
-
-            if field and operator and value is not None:
-                # Tambahkan validasi sederhana untuk nama kolom
-                if field in ['tanggal', 'jam', 'mor', 'provinsi', 'kota_kabupaten', 'no_spbu', 'no_nozzle', 'no_dispenser', 'produk', 'volume_liter', 'penjualan_rupiah', 'operator', 'mode_transaksi', 'plat_nomor', 'nik', 'sektor_non_kendaraan', 'jumlah_roda_kendaraan', 'kuota', 'warna_plat']:
-                    if 'LIKE' in operator:
-                        group_clauses.append(sql.SQL("{} {} %s").format(sql.Identifier(field), sql.SQL(operator)))
-                        params.append(f"%{value}%")
-                    else:
-                        group_clauses.append(sql.SQL("{} {} %s").format(sql.Identifier(field), sql.SQL(operator)))
-                        params.append(value)
-        
-        if group_clauses:
-            # Gabungkan kondisi dalam satu grup dengan 'OR'
-            where_clauses.append(sql.SQL("({})").format(sql.SQL(" OR ").join(group_clauses)))
+    """Membangun klausa WHERE secara dinamis dari filter (lihat app.filter_compiler)."""
+    return apply_filters(base_query, filters)
 
-    if where_clauses:
-        # Gabungkan grup dengan 'AND'
-        base_query += sql.SQL(" AND ") + sql.SQL(" AND ").join(where_clauses)
-        
-    return base_query, params
+def inline_query(cursor, query, params):
+    """Menggabungkan query dan parameternya menjadi satu string SQL (untuk COPY yang tidak menerima parameter)."""
+    return cursor.mogrify(query, params).decode('utf-8')
+
+def build_csv_copy_sql(cursor, query, params, header=True):
+    """
+    Membungkus query menjadi COPY (SELECT ...) TO STDOUT dengan format yang sama seperti
+    ekspor pandas sebelumnya: separator ';', header, dan kolom numerik memakai desimal ','.
+    """
+    source = sql.SQL(inline_query(cursor, query, params))
+    cursor.execute(sql.SQL("SELECT * FROM ({}) AS export_source LIMIT 0").format(source))
+
+    select_list = []
+    for column in cursor.description:
+        identifier = sql.Identifier(column.name)
+        if column.type_code in NUMERIC_TYPE_OIDS:
+            select_list.append(sql.SQL("replace({}::text, '.', ',') AS {}").format(identifier, identifier))
+        else:
+            select_list.append(identifier)
+
+    return sql.SQL("COPY (SELECT {} FROM ({}) AS export_source) TO STDOUT WITH (FORMAT csv, HEADER {}, DELIMITER ';')").format(
+        sql.SQL(', ').join(select_list), source, sql.SQL('true' if header else 'false')
+    )
+
+def copy_query_to_stream(cursor, query, params, stream, header=True, progress=None):
+    """Menjalankan COPY TO STDOUT dan menulis hasilnya langsung ke `stream` tanpa menampung di memori."""
+    copy_sql = build_csv_copy_sql(cursor, query, params, header=header)
+    if progress is not None:
+        stream = ProgressStream(stream, progress, header=header)
+    cursor.copy_expert(copy_sql.as_string(cursor), stream, size=COPY_BUFFER_SIZE)
+    return cursor.rowcount
+
+def partial_path_for(full_path):
+    """Path sementara unik per penulis: job identik yang berjalan bersamaan tidak saling menimpa."""
+    return f"{full_path}.{uuid.uuid4().hex}.part"
+
+def run_shard(snapshot_id, render, index, query, params, work_dir):
+    """
+    Menjalankan satu shard (query satu summary) di koneksi pool sendiri. Shard mengimpor
+    snapshot transaksi utama sehingga semua shard membaca data yang konsisten.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Tidak dapat membuat koneksi database untuk shard ekspor.")
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ')
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+        return render(conn, index, query, params, work_dir)
+    finally:
+        if not conn.closed:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT')
+        release_db_connection(conn)
+
+def render_shards_in_order(conn, shards, render, work_dir):
+    """
+    Merender shard secara paralel (EXPORT_SHARD_CONCURRENCY koneksi) dan menghasilkan hasilnya
+    sesuai urutan shard. Hanya sejumlah jendela shard yang dikerjakan sekaligus sehingga
+    file sementara di disk tetap terbatas.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot_id = cursor.fetchone()[0]
+
+    with ThreadPoolExecutor(max_workers=EXPORT_SHARD_CONCURRENCY, thread_name_prefix='export-shard') as executor:
+        pending = deque()
+        remaining = iter(enumerate(shards))
+
+        def submit_next():
+            for index, (query, params) in remaining:
+                pending.append(executor.submit(run_shard, snapshot_id, render, index, query, params, work_dir))
+                return
+
+        for _ in range(EXPORT_SHARD_CONCURRENCY):
+            submit_next()
+        try:
+            while pending:
+                result = pending.popleft().result()
+                submit_next()
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+_compression_executor = None
+_compression_executor_lock = threading.Lock()
+
+def get_compression_executor():
+    """Thread pool kompresi milik proses ini (dibuat saat pertama dipakai), atau None jika EXPORT_COMPRESSION_THREADS <= 1."""
+    global _compression_executor
+    if EXPORT_COMPRESSION_THREADS <= 1:
+        return None
+    with _compression_executor_lock:
+        if _compression_executor is None:
+            _compression_executor = ThreadPoolExecutor(max_workers=EXPORT_COMPRESSION_THREADS, thread_name_prefix='export-compress')
+        return _compression_executor
+
+def compress_block(method, level, block):
+    """
+    Mengompresi satu blok menjadi member gzip / frame zstd yang berdiri sendiri.
+    zlib dan codec Arrow melepas GIL sehingga blok-blok dikompresi paralel di thread pool.
+    """
+    if method == 'gzip':
+        compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+        return compressor.compress(block) + compressor.flush()
+    if method == 'zstd':
+        import pyarrow as pa
+        return pa.Codec('zstd', compression_level=3 if level is None else level).compress(block, asbytes=True)
+    raise ValueError(f"Metode kompresi stream tidak didukung: {method}")
+
+class BlockCompressWriter:
+    """
+    File-like untuk bagian arsip tar: data dipotong per EXPORT_COMPRESSION_BLOCK_SIZE, setiap blok
+    dikompresi di thread pool, lalu ditulis ke `raw` sesuai urutan. Gabungan member gzip atau
+    frame zstd tetap dibaca sebagai satu stream oleh gzip/zstd biasa.
+    """
+
+    def __init__(self, raw, method, level=None, executor=None):
+        self.raw = raw
+        self.compress = partial(compress_block, method, level)
+        self.executor = executor
+        self.max_pending = max(1, EXPORT_COMPRESSION_THREADS) * 2
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.bytes_in = 0 # ukuran data sebelum kompresi
+
+    def write(self, data):
+        self.buffer += data
+        self.bytes_in += len(data)
+        while len(self.buffer) >= EXPORT_COMPRESSION_BLOCK_SIZE:
+            block = bytes(self.buffer[:EXPORT_COMPRESSION_BLOCK_SIZE])
+            del self.buffer[:EXPORT_COMPRESSION_BLOCK_SIZE]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block):
+        if self.executor is None:
+            self.raw.write(self.compress(block))
+            return
+        self.pending.append(self.executor.submit(self.compress, block))
+        # Batasi blok yang menunggu agar memori per job tetap konstan
+        while len(self.pending) >= self.max_pending:
+            self.raw.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.raw.write(self.pending.popleft().result())
+
+def resolve_compression(job_data):
+    """Metode dan level kompresi job (default dari EXPORT_COMPRESSION/EXPORT_COMPRESSION_LEVEL), sudah divalidasi."""
+    method = (job_data.get('compression') or EXPORT_COMPRESSION).lower()
+    level = job_data.get('compression_level')
+    if level is None and not job_data.get('compression'):
+        level = EXPORT_COMPRESSION_LEVEL
+    if method not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Metode kompresi tidak didukung: {method}")
+    if level is not None:
+        low, high = COMPRESSION_LEVELS[method]
+        if not low <= int(level) <= high:
+            raise ValueError(f"Level kompresi {method} harus antara {low} dan {high}.")
+        level = int(level)
+    return method, level
+
+def render_csv_shard(conn, index, query, params, work_dir, progress=None):
+    """Menulis CSV satu shard ke file sementara; header hanya pada shard pertama."""
+    path = os.path.join(work_dir, f"shard-{index:05d}.csv")
+    with conn.cursor() as cursor, open(path, 'wb') as f:
+        rows = copy_query_to_stream(cursor, query, params, f, header=(index == 0), progress=progress)
+    return path, rows
+
+def copy_data_shards(conn, data_shards, stream, temp_root, progress=None):
+    """
+    Menulis CSV data ke `stream`: satu shard langsung lewat COPY, multi-summary dirender paralel
+    ke file sementara di bawah `temp_root` lalu disambung sesuai urutan. Mengembalikan jumlah baris.
+    """
+    if len(data_shards) == 1:
+        with conn.cursor() as cursor:
+            return copy_query_to_stream(cursor, *data_shards[0], stream, progress=progress)
+    rows_written = 0
+    with tempfile.TemporaryDirectory(dir=temp_root) as work_dir:
+        for shard_path, shard_rows in render_shards_in_order(conn, data_shards, partial(render_csv_shard, progress=progress), work_dir):
+            with open(shard_path, 'rb') as f:
+                shutil.copyfileobj(f, stream, COPY_BUFFER_SIZE)
+            os.remove(shard_path)
+            rows_written += shard_rows
+    return rows_written
+
+def write_csv_zip(conn, full_path, base_name, profile_query, profile_params, data_shards, progress=None,
+                  compression='deflate', compression_level=None):
+    """
+    Menulis profile dan data sebagai dua entry CSV di dalam ZIP langsung di disk.
+    Data di-stream dari PostgreSQL ke entry ZIP sehingga memori tetap konstan berapa pun ukurannya.
+    Untuk multi-summary, setiap shard dirender paralel lalu disambung ke entry data sesuai urutan.
+    File ditulis ke path sementara lalu di-rename agar Laravel tidak pernah melihat ZIP setengah jadi.
+    """
+    partial_path = partial_path_for(full_path)
+    rows_written = 0
+    cursor = conn.cursor()
+    zip_compression = zipfile.ZIP_STORED if compression == 'store' else zipfile.ZIP_DEFLATED
+    try:
+        with zipfile.ZipFile(partial_path, 'w', zip_compression, compresslevel=compression_level) as zip_file:
+            with zip_file.open(f"profile_{base_name}.csv", 'w', force_zip64=True) as entry:
+                copy_query_to_stream(cursor, profile_query, profile_params, entry)
+            with zip_file.open(f"data_{base_name}.csv", 'w', force_zip64=True) as entry:
+                rows_written = copy_data_shards(conn, data_shards, entry, os.path.dirname(full_path), progress=progress)
+        os.replace(partial_path, full_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return rows_written
+
+def tar_header(name, size):
+    """Header tar (PAX jika ukuran melebihi batas ustar) untuk entry file biasa."""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644
+    info.mtime = int(time.time())
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+def tar_padding(size):
+    return b'\0' * (-size % tarfile.BLOCKSIZE)
+
+def write_compressed(raw, data, method, level=None, executor=None):
+    writer = BlockCompressWriter(raw, method, level, executor)
+    writer.write(data)
+    writer.close()
+
+def write_csv_tar(conn, full_path, base_name, profile_query, profile_params, data_shards, progress=None,
+                  compression='zstd', compression_level=None):
+    """
+    Menulis profile dan data CSV sebagai tar.gz / tar.zst yang dikompresi paralel per blok.
+    Header tar membutuhkan ukuran entry, padahal ukuran data baru diketahui setelah COPY selesai.
+    Karena gabungan member gzip / frame zstd dibaca sebagai satu stream, isi entry data langsung
+    dikompresi ke file sementara sambil dihitung ukuran aslinya, lalu arsip disusun dari bagian
+    terkompresi: header + profile, header data, isi data (disalin apa adanya), dan penutup tar.
+    CSV tanpa kompresi tidak pernah ditulis ke disk; ruang sementara yang dibutuhkan seukuran data terkompresi.
+    """
+    partial_path = partial_path_for(full_path)
+    executor = get_compression_executor()
+    try:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(full_path)) as work_dir:
+            profile = io.BytesIO()
+            with conn.cursor() as cursor:
+                copy_query_to_stream(cursor, profile_query, profile_params, profile)
+            profile = profile.getvalue()
+            body_path = os.path.join(work_dir, 'data.csv.part')
+            with open(body_path, 'wb') as raw:
+                body = BlockCompressWriter(raw, compression, compression_level, executor)
+                rows_written = copy_data_shards(conn, data_shards, body, work_dir, progress=progress)
+                body.close()
+
+            head = (tar_header(f"profile_{base_name}.csv", len(profile)) + profile + tar_padding(len(profile))
+                    + tar_header(f"data_{base_name}.csv", body.bytes_in))
+            tail = tar_padding(body.bytes_in) + b'\0' * (2 * tarfile.BLOCKSIZE)
+            # Arsip tar berakhir pada kelipatan RECORDSIZE, seperti yang ditulis tarfile
+            tail += b'\0' * (-(len(head) + body.bytes_in + len(tail)) % tarfile.RECORDSIZE)
+            with open(partial_path, 'wb') as raw:
+                write_compressed(raw, head, compression, compression_level, executor)
+                with open(body_path, 'rb') as f:
+                    shutil.copyfileobj(f, raw, COPY_BUFFER_SIZE)
+                write_compressed(raw, tail, compression, compression_level, executor)
+        os.replace(partial_path, full_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return rows_written
+
+def to_excel_value(value):
+    """Mengubah nilai dari psycopg2 menjadi tipe yang bisa ditulis openpyxl."""
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        # Excel tidak mengenal timezone
+        return value.replace(tzinfo=None)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+def write_query_rows(workbook, conn, cursor_name, shards, sheet_name, max_rows_per_sheet=XLSX_MAX_DATA_ROWS_PER_SHEET, progress=None):
+    """
+    Menulis hasil satu atau beberapa query (shard, berurutan) ke workbook write-only dari server-side cursor.
+    Ketika sheet penuh, baris berikutnya ditulis ke sheet baru dengan akhiran _2, _3, dst.
+    Mengembalikan jumlah baris data yang ditulis.
+    """
+    rows_written = 0
+    header = None
+    sheet = None
+    sheet_index = 0
+    sheet_rows = 0
+    for shard_index, (query, params) in enumerate(shards):
+        with conn.cursor(name=f"{cursor_name}_{shard_index}") as cursor:
+            cursor.itersize = XLSX_FETCH_SIZE
+            cursor.execute(query, params)
+
+            while True:
+                rows = cursor.fetchmany(XLSX_FETCH_SIZE)
+                if header is None:
+                    # description baru tersedia setelah fetch pertama pada named cursor
+                    header = [column.name for column in cursor.description]
+                    sheet = workbook.create_sheet(sheet_name)
+                    sheet.append(header)
+                    sheet_index = 1
+                if not rows:
+                    break
+                for row in rows:
+                    if sheet_rows >= max_rows_per_sheet:
+                        sheet_index += 1
+                        sheet = workbook.create_sheet(f"{sheet_name}_{sheet_index}")
+                        sheet.append(header)
+                        sheet_rows = 0
+                    sheet.append([to_excel_value(value) for value in row])
+                    sheet_rows += 1
+                rows_written += len(rows)
+                if progress is not None:
+                    progress.add(rows=len(rows))
+    return rows_written
+
+def write_xlsx(conn, full_path, profile_query, profile_params, data_shards, progress=None):
+    """
+    Menulis ekspor XLSX dengan openpyxl mode write-only sehingga memori tetap terbatas.
+    Sheet 'profile' berisi ringkasan, data di sheet 'data' (dan 'data_2', 'data_3', ... jika melebihi batas Excel).
+    """
+    partial_path = partial_path_for(full_path)
+    try:
+        workbook = Workbook(write_only=True)
+        write_query_rows(workbook, conn, 'export_profile', [(profile_query, profile_params)], 'profile')
+        rows_written = write_query_rows(workbook, conn, 'export_data', data_shards, 'data', progress=progress)
+        workbook.save(partial_path)
+        os.replace(partial_path, full_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return rows_written
+
+def export_file_extension(export_format, compression='deflate'):
+    if export_format == 'csv':
+        return COMPRESSION_EXTENSIONS[compression]
+    return 'zip' if export_format in ZIP_FORMATS else export_format
+
+def arrow_type_for_column(pa, column):
+    """Memetakan tipe kolom PostgreSQL (OID dari cursor.description) ke tipe Arrow."""
+    type_code = column.type_code
+    if type_code == 16:
+        return pa.bool_()
+    if type_code == 21:
+        return pa.int16()
+    if type_code == 23:
+        return pa.int32()
+    if type_code == 20:
+        return pa.int64()
+    if type_code in (700, 701):
+        return pa.float64()
+    if type_code == 1700:
+        # numeric(p, s) tetap desimal presisi; numeric tanpa batas jatuh ke float64
+        if column.precision and column.scale is not None and column.precision <= 38:
+            return pa.decimal128(column.precision, column.scale)
+        return pa.float64()
+    if type_code == 1082:
+        return pa.date32()
+    if type_code == 1114:
+        return pa.timestamp('us')
+    if type_code == 1184:
+        return pa.timestamp('us', tz='UTC')
+    return pa.string()
+
+def to_arrow_value(value, floating=False):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    # numeric tanpa presisi dipetakan ke float64, tetapi psycopg2 tetap mengembalikan Decimal
+    if floating and isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+def write_query_parquet(conn, cursor_name, query, params, path, progress=None):
+    """
+    Menulis hasil query ke file Parquet dari server-side cursor, satu row group per batch fetch,
+    sehingga memori dibatasi oleh PARQUET_ROW_GROUP_SIZE. Kolom teks di-dictionary-encode.
+    Mengembalikan jumlah baris yang ditulis.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows_written = 0
+    writer = None
+    with conn.cursor(name=cursor_name) as cursor:
+        cursor.itersize = PARQUET_ROW_GROUP_SIZE
+        cursor.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(PARQUET_ROW_GROUP_SIZE)
+                if writer is None:
+                    # description baru tersedia setelah fetch pertama pada named cursor
+                    schema = pa.schema([pa.field(column.name, arrow_type_for_column(pa, column)) for column in cursor.description])
+                    dictionary_columns = [field.name for field in schema if pa.types.is_string(field.type)]
+                    writer = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION, use_dictionary=dictionary_columns)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array([to_arrow_value(value, pa.types.is_floating(field.type)) for value in values], type=field.type)
+                     for values, field in zip(columns, schema)],
+                    schema=schema,
+                )
+                writer.write_batch(batch, row_group_size=PARQUET_ROW_GROUP_SIZE)
+                rows_written += len(rows)
+                if progress is not None:
+                    progress.add(rows=len(rows), nbytes=batch.nbytes)
+        finally:
+            if writer is not None:
+                writer.close()
+    return rows_written
+
+def render_parquet_shard(conn, index, query, params, work_dir, progress=None):
+    path = os.path.join(work_dir, f"part-{index:05d}.parquet")
+    return path, write_query_parquet(conn, f"export_data_{index}", query, params, path, progress=progress)
+
+def write_parquet_zip(conn, full_path, base_name, profile_query, profile_params, data_shards, progress=None):
+    """
+    Menulis profile dan data sebagai file Parquet di dalam ZIP.
+    Multi-summary ditulis sebagai dataset: data_<nama>/part-00000.parquet, ... (satu file per summary, berurutan).
+    Parquet sudah terkompresi per kolom sehingga entry ZIP disimpan tanpa kompresi ulang.
+    """
+    partial_path = partial_path_for(full_path)
+    rows_written = 0
+    try:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(full_path)) as work_dir:
+            profile_path = os.path.join(work_dir, 'profile.parquet')
+            write_query_parquet(conn, 'export_profile', profile_query, profile_params, profile_path)
+            with zipfile.ZipFile(partial_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+                zip_file.write(profile_path, f"profile_{base_name}.parquet")
+                if len(data_shards) == 1:
+                    data_path = os.path.join(work_dir, 'data.parquet')
+                    rows_written = write_query_parquet(conn, 'export_data', *data_shards[0], data_path, progress=progress)
+                    zip_file.write(data_path, f"data_{base_name}.parquet")
+                else:
+                    for shard_path, shard_rows in render_shards_in_order(conn, data_shards, partial(render_parquet_shard, progress=progress), work_dir):
+                        zip_file.write(shard_path, f"data_{base_name}/{os.path.basename(shard_path)}")
+                        os.remove(shard_path)
+                        rows_written += shard_rows
+        os.replace(partial_path, full_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return rows_written
+
+def resolve_summary_ids(cursor, job_data):
+    """
+    Menentukan summary yang diekspor: daftar 'summary_ids' (urutan dipertahankan),
+    rentang tanggal import 'date_from'/'date_to', atau satu 'summary_id'.
+    Untuk source 'anomalies', summary diambil dari batch execution 'execution_id'.
+    """
+    if job_data['source'] == 'anomalies':
+        execution_id = job_data.get('execution_id')
+        cursor.execute("SELECT 1 FROM anomaly_executions WHERE execution_id = %s", (execution_id,))
+        if cursor.fetchone() is None:
+            raise ValueError(f"Execution tidak ditemukan: {execution_id}")
+        cursor.execute("""
+            SELECT summary_id FROM anomaly_execution_batches WHERE execution_id = %(execution_id)s
+            UNION
+            SELECT DISTINCT summary_id FROM anomaly_results WHERE execution_id = %(execution_id)s AND is_anomalous
+            ORDER BY 1
+        """, {'execution_id': execution_id})
+        summary_ids = [row[0] for row in cursor.fetchall()]
+        if not summary_ids:
+            raise ValueError(f"Execution {execution_id} tidak memiliki summary yang dianalisis.")
+        return summary_ids
+    if job_data.get('summary_ids'):
+        summary_ids = list(dict.fromkeys(int(summary_id) for summary_id in job_data['summary_ids']))
+        cursor.execute("SELECT summary_id FROM csv_summary_master_daily WHERE summary_id = ANY(%s)", (summary_ids,))
+        missing = set(summary_ids) - {row[0] for row in cursor.fetchall()}
+        if missing:
+            raise ValueError(f"Summary tidak ditemukan: {sorted(missing)}")
+        return summary_ids
+    if job_data.get('date_from') or job_data.get('date_to'):
+        cursor.execute("""
+            SELECT summary_id FROM csv_summary_master_daily
+            WHERE (%(date_from)s::date IS NULL OR import_datetime >= %(date_from)s::date)
+              AND (%(date_to)s::date IS NULL OR import_datetime < %(date_to)s::date + 1)
+            ORDER BY import_datetime, summary_id
+        """, {'date_from': job_data.get('date_from'), 'date_to': job_data.get('date_to')})
+        summary_ids = [row[0] for row in cursor.fetchall()]
+        if not summary_ids:
+            raise ValueError("Tidak ada summary pada rentang tanggal yang diminta.")
+        return summary_ids
+    return [job_data['summary_id']]
+
+def build_profile_query(summary_ids):
+    """
+    Profile satu summary adalah barisnya di csv_summary_master_daily. Untuk multi-summary
+    dibuat satu baris agregat: kolom yang bisa dijumlahkan di-SUM, sisanya diringkas.
+    SUM numeric menghasilkan numeric tanpa presisi, jadi di-cast kembali ke skala kolomnya
+    agar Parquet tetap menulisnya sebagai desimal.
+    """
+    if len(summary_ids) == 1:
+        return sql.SQL("SELECT * FROM csv_summary_master_daily WHERE summary_id = %s"), [summary_ids[0]]
+    # Urutan summary di profile sama dengan urutan shard data
+    return sql.SQL("""
+        SELECT
+            array_to_string(array_agg(summary_id ORDER BY array_position(%(summary_ids)s, summary_id)), ',') AS summary_ids,
+            COUNT(*) AS total_summaries,
+            MIN(import_datetime) AS first_import_datetime,
+            MAX(import_datetime) AS last_import_datetime,
+            string_agg(DISTINCT file_type, ',') AS file_type,
+            SUM(import_duration)::numeric(38, 3) AS import_duration,
+            SUM(total_records_inserted) AS total_records_inserted,
+            SUM(total_records_read) AS total_records_read,
+            SUM(total_volume)::numeric(38, 3) AS total_volume,
+            SUM(total_volume_liter)::numeric(38, 3) AS total_volume_liter,
+            SUM(total_kuota)::numeric(38, 1) AS total_kuota,
+            string_agg(file_name, ', ' ORDER BY array_position(%(summary_ids)s, summary_id)) AS file_names
+        FROM csv_summary_master_daily
+        WHERE summary_id = ANY(%(summary_ids)s)
+    """), {'summary_ids': list(summary_ids)}
+
+def build_anomaly_profile_query(execution_id):
+    """Profile ekspor anomali: execution, template, summary yang dianalisis, dan jumlah transaksi ter-flag."""
+    return sql.SQL("""
+        SELECT
+            e.execution_id, e.template_id, t.role_name AS template_name, e.execution_timestamp,
+            e.executed_by, e.status, e.rules_applied,
+            (SELECT array_to_string(array_agg(b.summary_id ORDER BY b.summary_id), ',')
+             FROM anomaly_execution_batches b WHERE b.execution_id = e.execution_id) AS summary_ids,
+            (SELECT COUNT(*) FROM anomaly_results r
+             WHERE r.execution_id = e.execution_id AND r.is_anomalous) AS total_anomalous_transactions
+        FROM anomaly_executions e
+        LEFT JOIN anomaly_template_master t ON t.template_id = e.template_id
+        WHERE e.execution_id = %s
+    """), [execution_id]
+
+def build_anomaly_data_query(per_summary=True):
+    """
+    Transaksi ter-flag satu execution/summary beserta flag dan violation_details-nya.
+    Dibaca dari partial index ix_anomaly_results_execution_flagged (hanya baris is_anomalous)
+    lalu di-join per baris ke csv_import_log lewat indeks unik transaction_id_asersi,
+    sehingga csv_import_log tidak pernah di-scan penuh.
+    Tanpa `per_summary` (unduhan langsung) query mencakup semua summary execution tersebut.
+    """
+    summary_condition = sql.SQL("AND r.summary_id = %s ") if per_summary else sql.SQL("")
+    return sql.SQL("""
+        SELECT l.*, r.template_id AS anomaly_template_id, r.anomaly_flags, r.violation_details, r.anomaly_datetime
+        FROM anomaly_results r
+        JOIN csv_import_log l ON l.transaction_id_asersi = r.transaction_id_asersi
+        WHERE r.execution_id = %s {}AND r.is_anomalous
+    """).format(summary_condition)
+
+def build_summary_data_query():
+    """Transaksi satu summary, dibaca lewat indeks daily_summary_id."""
+    return sql.SQL("SELECT * FROM csv_import_log WHERE daily_summary_id = %s")
+
+def build_data_shards(summary_ids, job_data):
+    """Satu query data (csv_import_log) per summary, dengan filter yang sama untuk setiap shard."""
+    if job_data['source'] == 'anomalies':
+        data_query, filter_params = build_query(build_anomaly_data_query(), job_data.get('filters'))
+        data_query += sql.SQL(" ORDER BY r.transaction_id_asersi")
+        return [(data_query, [job_data['execution_id'], summary_id] + filter_params) for summary_id in summary_ids]
+
+    if job_data['source'] == 'filtered':
+        data_query, filter_params = build_query(build_summary_data_query(), job_data.get('filters'))
+    else: # 'all'
+        data_query, filter_params = build_summary_data_query(), []
+    return [(data_query, [summary_id] + filter_params) for summary_id in summary_ids]
+
+def check_data_shard_plans(cursor, data_shards):
+    """
+    Peringatkan/tolak filter yang membuat Seq Scan penuh pada csv_import_log (lihat check_filter_plan).
+    Setiap shard diperiksa: planner memilih rencana menurut estimasi baris daily_summary_id masing-masing,
+    jadi summary besar bisa di-Seq Scan walaupun summary kecil memakai indeks. Hanya EXPLAIN, tanpa ANALYZE.
+    Mengembalikan ringkasan EXPLAIN per shard (None jika policy = 'off') untuk estimate_total_rows.
+    """
+    return [check_filter_plan(cursor, query, params) for query, params in data_shards]
+
+def estimate_total_rows(cursor, summary_ids, data_shards, job_data, shard_plans=None):
+    """
+    Estimasi jumlah baris data untuk progres, tanpa menjalankan query ekspor (hanya EXPLAIN).
+    Basisnya total_records_inserted setiap summary, atau estimasi planner jika belum tercatat.
+    Untuk filter, basis dikalikan selektivitas filter per shard menurut planner: statistik tabel
+    bisa tertinggal setelah import, tetapi rasio baris ber-filter/tanpa filter tetap masuk akal.
+    Ekspor anomali memakai estimasi planner per shard atas partial index baris ter-flag.
+    shard_plans adalah ringkasan EXPLAIN yang sudah dihitung check_data_shard_plans, jika ada.
+    """
+    shard_plans = shard_plans or [None] * len(data_shards)
+
+    def planned_rows(query, params, plan=None):
+        return (plan or explain_plan(cursor, query, params))['estimated_rows'] or 0
+
+    if job_data['source'] == 'anomalies':
+        return int(sum(planned_rows(query, params, plan) for (query, params), plan in zip(data_shards, shard_plans)))
+
+    cursor.execute("""
+        SELECT summary_id, total_records_inserted FROM csv_summary_master_daily WHERE summary_id = ANY(%s)
+    """, (list(summary_ids),))
+    recorded_rows = dict(cursor.fetchall())
+    total = 0.0
+    # Urutan shard sama dengan urutan summary_ids (lihat build_data_shards)
+    for summary_id, (query, params), plan in zip(summary_ids, data_shards, shard_plans):
+        rows = recorded_rows.get(summary_id)
+        if rows is not None and job_data['source'] != 'filtered':
+            total += rows
+            continue
+        unfiltered_rows = planned_rows(build_summary_data_query(), [summary_id])
+        if rows is None:
+            rows = unfiltered_rows
+        if job_data['source'] == 'filtered' and unfiltered_rows:
+            rows *= min(planned_rows(query, params, plan) / unfiltered_rows, 1.0)
+        total += rows
+    return int(round(total))
 
 # --- Fungsi Pemrosesan Utama ---
 
@@ -95,6 +861,7 @@ def process_export_job(job_data):
     callback_url = job_data['callback_url']
     logging.info(f"Memulai pekerjaan ekspor {job_id}...")
 
+    progress = ExportProgress(job_id, get_progress_redis())
     conn = None
     try:
         conn = get_db_connection()
@@ -103,66 +870,173 @@ def process_export_job(job_data):
         
         cursor = conn.cursor()
 
-        # 1. Ambil data Profile (dari csv_summary_master_daily)
-        summary_query = sql.SQL("SELECT * FROM csv_summary_master_daily WHERE summary_id = %s")
-        df_profile = pd.read_sql_query(summary_query.as_string(cursor), conn, params=[job_data['summary_id']])
-        
-        # 2. Ambil data Data (dari csv_import_log)
-        base_data_query = sql.SQL("SELECT * FROM csv_import_log WHERE daily_summary_id = %s")
-        base_params = [job_data['summary_id']]
-
-        if job_data['source'] == 'filtered':
-            final_data_query, filter_params = build_query(base_data_query, job_data.get('filters'))
-            params = base_params + filter_params
-        else: # 'all'
-            final_data_query = base_data_query
-            params = base_params
-        
-        df_data = pd.read_sql_query(final_data_query.as_string(cursor), conn, params=params)
-        
-        logging.info(f"[{job_id}] Data berhasil diambil. Profile: 1 baris, Data: {len(df_data)} baris.")
+        # 1. Query Profile (dari csv_summary_master_daily)
+        summary_ids = resolve_summary_ids(cursor, job_data)
+        if job_data['source'] == 'anomalies':
+            summary_query, summary_params = build_anomaly_profile_query(job_data['execution_id'])
+        else:
+            summary_query, summary_params = build_profile_query(summary_ids)
 
-        # 3. Buat file ekspor
-        os.makedirs(LARAVEL_STORAGE_PATH, exist_ok=True)
-        relative_path = f"exports/{job_data['file_name']}"
-        full_path = os.path.join('/home/bphmigas/datavista_app/storage/app/public/', relative_path)
+        # 2. Query Data (dari csv_import_log), satu shard per summary
+        data_shards = build_data_shards(summary_ids, job_data)
+        shard_plans = check_data_shard_plans(cursor, data_shards) if job_data['source'] == 'filtered' else None
 
+        # 3. Buat file ekspor (atau pakai hasil ekspor identik yang sudah ada di cache)
+        os.makedirs(LARAVEL_STORAGE_PATH, exist_ok=True)
+        requested_path = f"exports/{job_data['file_name']}"
+        relative_path = requested_path
+        cached_base_name = None
+        compression, compression_level = resolve_compression(job_data)
+        if export_cache.EXPORT_CACHE_ENABLED:
+            extension = export_file_extension(job_data['format'], compression)
+            key = export_cache.cache_key(cursor, job_data, summary_ids, compression=(compression, compression_level))
+            cached_path = export_cache.lookup(LARAVEL_PUBLIC_STORAGE_PATH, key, extension)
+            if cached_path:
+                logging.info(f"[{job_id}] Cache hit, memakai file ekspor yang sudah ada: {cached_path}")
+                export_cache.publish(LARAVEL_PUBLIC_STORAGE_PATH, cached_path, requested_path)
+                progress.complete(0, requested_path, os.path.getsize(os.path.join(LARAVEL_PUBLIC_STORAGE_PATH, requested_path)), cache_hit=True)
+                send_callback(callback_url, 'COMPLETED', file_path=requested_path)
+                return
+            relative_path = export_cache.cache_relative_path(key, extension)
+            cached_base_name = export_cache.entry_base_name(key)
+            os.makedirs(os.path.join(LARAVEL_PUBLIC_STORAGE_PATH, export_cache.EXPORT_CACHE_DIR), exist_ok=True)
+        full_path = os.path.join(LARAVEL_PUBLIC_STORAGE_PATH, relative_path)
+        progress.start(job_data['format'], estimate_total_rows(cursor, summary_ids, data_shards, job_data, shard_plans))
 
         if job_data['format'] == 'xlsx':
-            with pd.ExcelWriter(full_path, engine='openpyxl') as writer:
-                df_profile.to_excel(writer, sheet_name='profile', index=False)
-                df_data.to_excel(writer, sheet_name='data', index=False)
-            logging.info(f"[{job_id}] File Excel berhasil dibuat di {full_path}")
+            rows_written = write_xlsx(conn, full_path, summary_query, summary_params, data_shards, progress=progress)
+            logging.info(f"[{job_id}] File Excel berhasil dibuat di {full_path}. Data: {rows_written} baris.")
 
         elif job_data['format'] == 'csv':
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                # Buat nama file CSV dinamis
-                base_name = os.path.splitext(job_data['file_name'])[0]
-                profile_csv_name = f"profile_{base_name}.csv"
-                data_csv_name = f"data_{base_name}.csv"
-
-                zip_file.writestr(profile_csv_name, df_profile.to_csv(index=False, sep=';', decimal=','))
-                zip_file.writestr(data_csv_name, df_data.to_csv(index=False, sep=';', decimal=','))
-            
-            with open(full_path, 'wb') as f:
-                f.write(zip_buffer.getvalue())
-            logging.info(f"[{job_id}] File ZIP (CSV) berhasil dibuat di {full_path}")
-
-        # 4. Kirim callback sukses
+            # Buat nama file CSV dinamis
+            base_name = cached_base_name or job_data['file_name'].split('.', 1)[0]
+            write_archive = write_csv_tar if compression in ('gzip', 'zstd') else write_csv_zip
+            rows_written = write_archive(conn, full_path, base_name, summary_query, summary_params, data_shards, progress=progress,
+                                         compression=compression, compression_level=compression_level)
+            logging.info(f"[{job_id}] Arsip CSV ({compression}) berhasil dibuat di {full_path}. Data: {rows_written} baris.")
+
+        elif job_data['format'] == 'parquet':
+            base_name = cached_base_name or os.path.splitext(job_data['file_name'])[0]
+            rows_written = write_parquet_zip(conn, full_path, base_name, summary_query, summary_params, data_shards, progress=progress)
+            logging.info(f"[{job_id}] File ZIP (Parquet) berhasil dibuat di {full_path}. Data: {rows_written} baris.")
+
+        else:
+            raise ValueError(f"Format ekspor tidak didukung: {job_data['format']}")
+
+        # 4. Catat throughput dan kirim callback sukses (file cache ditautkan ke nama file yang diminta)
+        if relative_path != requested_path:
+            relative_path = export_cache.publish(LARAVEL_PUBLIC_STORAGE_PATH, relative_path, requested_path)
+        progress.complete(rows_written, relative_path, os.path.getsize(full_path))
         send_callback(callback_url, 'COMPLETED', file_path=relative_path)
+        if export_cache.EXPORT_CACHE_ENABLED:
+            export_cache.evict(LARAVEL_PUBLIC_STORAGE_PATH)
 
     except Exception as e:
         logging.error(f"Pekerjaan ekspor {job_id} gagal: {e}", exc_info=True)
+        progress.fail(str(e))
         send_callback(callback_url, 'FAILED', error_message=str(e))
     finally:
         if conn:
-            conn.close()
+            release_db_connection(conn)
 
 # --- Main Loop Worker ---
 
+def process_rss_bytes(pid):
+    """RSS sebuah proses dalam byte dari /proc/<pid>/statm (0 jika tidak terbaca)."""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def worker_rss_bytes():
+    """Total RSS proses worker beserta child process-nya (mode 'process')."""
+    return process_rss_bytes(os.getpid()) + sum(process_rss_bytes(child.pid) for child in multiprocessing.active_children())
+
+def memory_budget_exceeded():
+    if EXPORT_MEMORY_BUDGET_MB <= 0:
+        return False
+    return worker_rss_bytes() > EXPORT_MEMORY_BUDGET_MB * 1024 * 1024
+
+def init_process_worker():
+    """Initializer child process: shutdown dikoordinasikan proses utama, dan setiap child punya pool sendiri."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    init_db_pool(1 + EXPORT_SHARD_CONCURRENCY)
+
+def create_executor():
+    if EXPORT_WORKER_MODE == 'process':
+        return ProcessPoolExecutor(
+            max_workers=EXPORT_WORKER_CONCURRENCY,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_process_worker,
+        )
+    # Setiap job memakai satu koneksi utama ditambah koneksi shard
+    init_db_pool(EXPORT_WORKER_CONCURRENCY * (1 + EXPORT_SHARD_CONCURRENCY), min_connections=EXPORT_WORKER_CONCURRENCY)
+    return ThreadPoolExecutor(max_workers=EXPORT_WORKER_CONCURRENCY, thread_name_prefix='export')
+
+def parse_job(job_json):
+    """Data job dari JSON antrian, atau None jika JSON tidak valid atau key wajib tidak ada."""
+    try:
+        job_data = json.loads(job_json)
+    except json.JSONDecodeError as e:
+        logging.error(f"Gagal mem-parsing data pekerjaan (JSON tidak valid): {e}")
+        return None
+    missing = [key for key in REQUIRED_JOB_KEYS if not isinstance(job_data, dict) or not job_data.get(key)]
+    if missing:
+        logging.error(f"Data pekerjaan tidak lengkap, dibuang (tanpa {', '.join(missing)}): {job_json[:200]}")
+        return None
+    return job_data
+
+def retry_or_dead_letter(r, job_json, reason):
+    """
+    Mengembalikan job yang gagal ke belakang antrian (job lain tetap berjalan lebih dulu), atau
+    setelah EXPORT_MAX_ATTEMPTS percobaan memindahkannya ke EXPORT_DEAD_LETTER_QUEUE dan mengirim callback FAILED.
+    """
+    job_data = parse_job(job_json)
+    if job_data is None:
+        return
+    job_id = job_data['job_id']
+    attempts = r.hincrby(EXPORT_ATTEMPTS_KEY, job_id, 1)
+    if attempts < EXPORT_MAX_ATTEMPTS:
+        logging.error(f"Pekerjaan {job_id} gagal (percobaan {attempts}/{EXPORT_MAX_ATTEMPTS}), dikembalikan ke antrian: {reason}")
+        r.lpush(EXPORT_QUEUE, job_json)
+        return
+    error_message = f"Pekerjaan gagal setelah {attempts} percobaan: {reason}"
+    logging.error(f"Pekerjaan {job_id} dipindah ke '{EXPORT_DEAD_LETTER_QUEUE}'. {error_message}")
+    r.lpush(EXPORT_DEAD_LETTER_QUEUE, job_json)
+    r.hdel(EXPORT_ATTEMPTS_KEY, job_id)
+    ExportProgress(job_id, get_progress_redis()).fail(error_message)
+    send_callback(job_data['callback_url'], 'FAILED', error_message=error_message)
+
+def requeue_orphaned_jobs(r, own_processing_key):
+    """
+    Mengembalikan job dari list processing milik worker yang sudah mati (heartbeat kedaluwarsa)
+    ke antrian agar diproses ulang. Worker yang crash di tengah job dihitung sebagai satu percobaan gagal.
+    Job dipindah atomik ke list processing worker ini dulu, sehingga tidak hilang jika worker ini ikut mati.
+    """
+    for processing_key in r.scan_iter(match=f"{EXPORT_PROCESSING_PREFIX}*"):
+        worker_id = processing_key[len(EXPORT_PROCESSING_PREFIX):]
+        if worker_id != EXPORT_WORKER_ID and r.exists(f"{EXPORT_HEARTBEAT_PREFIX}{worker_id}"):
+            continue
+        if processing_key == own_processing_key:
+            orphaned = r.lrange(own_processing_key, 0, -1)
+        else:
+            orphaned = []
+            while (job_json := r.lmove(processing_key, own_processing_key, 'RIGHT', 'LEFT')) is not None:
+                orphaned.append(job_json)
+        for job_json in orphaned:
+            retry_or_dead_letter(r, job_json, f"worker '{worker_id}' berhenti di tengah pekerjaan")
+            r.lrem(own_processing_key, 1, job_json)
+        if orphaned:
+            logging.warning(f"{len(orphaned)} pekerjaan milik worker '{worker_id}' dikembalikan ke antrian.")
+
 def main():
-    """Loop utama worker untuk mendengarkan antrian Redis."""
+    """
+    Loop utama worker: mengambil job dari antrian Redis dan menjalankannya di pool
+    thread/proses sebanyak EXPORT_WORKER_CONCURRENCY sehingga job kecil tidak menunggu job besar.
+    SIGTERM/SIGINT menghentikan pengambilan job baru dan menunggu job yang sedang berjalan selesai.
+    """
     try:
         r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
         r.ping()
@@ -171,21 +1045,76 @@ def main():
         logging.error(f"Gagal terhubung ke Redis di {REDIS_HOST}:{REDIS_PORT}. Error: {e}")
         return
 
-    while True:
+    processing_key = f"{EXPORT_PROCESSING_PREFIX}{EXPORT_WORKER_ID}"
+    heartbeat_key = f"{EXPORT_HEARTBEAT_PREFIX}{EXPORT_WORKER_ID}"
+    stop_event = threading.Event()
+
+    def request_shutdown(signum, frame):
+        logging.info("Sinyal berhenti diterima, menyelesaikan pekerjaan yang sedang berjalan...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    r.set(heartbeat_key, EXPORT_WORKER_MODE, ex=EXPORT_HEARTBEAT_TTL)
+    requeue_orphaned_jobs(r, processing_key)
+
+    executor = create_executor()
+    logging.info(f"Worker ekspor '{EXPORT_WORKER_ID}' berjalan: {EXPORT_WORKER_CONCURRENCY} slot ({EXPORT_WORKER_MODE}).")
+    in_flight = {}  # future -> (job_json, job_id)
+
+    def reap_finished_jobs():
+        """Menghapus job yang selesai dari list processing. Mengembalikan True jika pool rusak."""
+        broken = False
+        for future in [f for f in in_flight if f.done()]:
+            job_json, job_id = in_flight.pop(future)
+            error = future.exception()
+            if error is not None:
+                # Child process mati di tengah job (mis. OOM): coba lagi di belakang antrian atau dead-letter
+                retry_or_dead_letter(r, job_json, repr(error))
+                broken = broken or isinstance(error, BrokenExecutor)
+            else:
+                r.hdel(EXPORT_ATTEMPTS_KEY, job_id)
+            r.lrem(processing_key, 1, job_json)
+        return broken
+
+    try:
+        while not stop_event.is_set():
+            try:
+                r.set(heartbeat_key, EXPORT_WORKER_MODE, ex=EXPORT_HEARTBEAT_TTL)
+                if reap_finished_jobs():
+                    # ProcessPoolExecutor tidak bisa dipakai lagi setelah child mati; buat pool baru
+                    executor.shutdown(wait=True)
+                    executor = create_executor()
+
+                if len(in_flight) >= EXPORT_WORKER_CONCURRENCY or (in_flight and memory_budget_exceeded()):
+                    time.sleep(0.5)
+                    continue
+
+                # Pindah atomik ke list processing; timeout agar heartbeat & sinyal tetap diperiksa
+                job_json = r.blmove(EXPORT_QUEUE, processing_key, 1, 'RIGHT', 'LEFT')
+                if job_json is None:
+                    continue
+                logging.info("Pekerjaan baru diterima!")
+                job_data = parse_job(job_json)
+                if job_data is None:
+                    r.lrem(processing_key, 1, job_json)
+                    continue
+                in_flight[executor.submit(process_export_job, job_data)] = (job_json, job_data['job_id'])
+            except redis.exceptions.ConnectionError as e:
+                logging.error(f"Koneksi Redis terputus, mencoba menghubungkan kembali... Error: {e}")
+                time.sleep(5)
+            except Exception as e:
+                logging.error(f"Terjadi error tak terduga di loop utama: {e}", exc_info=True)
+                time.sleep(5) # Beri jeda sebelum mencoba lagi
+    finally:
+        executor.shutdown(wait=True)
         try:
-            # blpop adalah blocking pop, akan menunggu hingga ada item di antrian
-            _, job_json = r.blpop(EXPORT_QUEUE)
-            logging.info("Pekerjaan baru diterima!")
-            job_data = json.loads(job_json)
-            process_export_job(job_data)
+            reap_finished_jobs()
+            r.delete(heartbeat_key)
         except redis.exceptions.ConnectionError as e:
-            logging.error(f"Koneksi Redis terputus, mencoba menghubungkan kembali... Error: {e}")
-            time.sleep(5)
-        except json.JSONDecodeError as e:
-            logging.error(f"Gagal mem-parsing data pekerjaan (JSON tidak valid): {e}")
-        except Exception as e:
-            logging.error(f"Terjadi error tak terduga di loop utama: {e}", exc_info=True)
-            time.sleep(5) # Beri jeda sebelum mencoba lagi
+            logging.error(f"Gagal membersihkan status worker di Redis: {e}")
+        logging.info("Worker ekspor berhenti.")
 
 if __name__ == "__main__":
     main()
@@ -10,6 +10,7 @@ load_dotenv()
 from db_config import POSTGRES_CONFIG, REDIS_CONFIG
 import psycopg2
 import redis 
+from app import cache
 
 # Import Router (Absolut - Sudah LULUS troubleshooting path)
 from routers.import_router import router as import_router
@@ -17,6 +18,7 @@ from routers.video_router import router as video_router
 from routers.anomaly_router import router as anomaly_router
 from routers.export_router import router as export_router
 from routers.summary_router import router as summary_router
+from routers.analytics_router import router as analytics_router
 
 # Import database functions
 from app.database import init_db
@@ -48,6 +50,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 
@@ -94,6 +97,17 @@ async def check_database_status():
         }
     )
 
+@app.get("/health/cache", tags=["Health Check"])
+def get_cache_metrics(reset: bool = False):
+    """Hit/miss cache respons per namespace (summaries, results) dan perkiraan waktu database yang dihemat."""
+    try:
+        metrics = cache.get_metrics()
+        if reset:
+            cache.reset_metrics()
+    except redis.exceptions.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Redis cache tidak tersedia: {e}")
+    return {"ttl_seconds": cache.RESPONSE_CACHE_TTL, "namespaces": metrics}
+
 
 # --- 4. INTEGRASI ROUTERS UTAMA ---
 
@@ -102,3 +116,4 @@ app.include_router(video_router)
 app.include_router(anomaly_router) # Dikomentari sementara
 app.include_router(export_router)
 app.include_router(summary_router)
+app.include_router(analytics_router)
@@ -0,0 +1,107 @@
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, func, select, true
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app.database import get_db
+from app.models import TransactionRollupDaily, AnomalyRollupDaily
+from app.schemas import RollupResult, RollupRow
+
+router = APIRouter(prefix="/v1/analytics", tags=["Analytics"])
+
+# Dimensi yang bisa dikelompokkan; 'month' diturunkan dari tanggal (YYYY-MM)
+ROLLUP_GROUP_DIMENSIONS = ('tanggal', 'month', 'mor', 'provinsi', 'kota_kabupaten', 'no_spbu', 'produk')
+ROLLUP_FILTER_DIMENSIONS = ('mor', 'provinsi', 'kota_kabupaten', 'no_spbu', 'produk')
+ROLLUP_MAX_ROWS = 100000
+
+def dimension_column(table, dimension: str):
+    if dimension == 'month':
+        return func.substr(table.tanggal, 1, 7)
+    return getattr(table, dimension)
+
+def rollup_conditions(table, date_from: date, date_to: date, filters: dict):
+    # tanggal disimpan sebagai teks YYYY-MM-DD sehingga perbandingan leksikografis = urutan tanggal
+    conditions = [table.tanggal >= date_from.isoformat(), table.tanggal <= date_to.isoformat()]
+    for dimension, values in filters.items():
+        if values:
+            conditions.append(getattr(table, dimension).in_(values))
+    return conditions
+
+@router.get("/rollup", response_model=RollupResult)
+def get_rollup(
+    date_from: date,
+    date_to: date,
+    group_by: str = Query('tanggal', description="Dimensi dipisah koma: tanggal, month, mor, provinsi, kota_kabupaten, no_spbu, produk. Kosong = total."),
+    mor: Optional[List[str]] = Query(None),
+    provinsi: Optional[List[str]] = Query(None),
+    kota_kabupaten: Optional[List[str]] = Query(None),
+    no_spbu: Optional[List[str]] = Query(None),
+    produk: Optional[List[str]] = Query(None),
+    execution_id: Optional[List[str]] = Query(None, description="Sertakan jumlah anomali dari execution ini (dijumlahkan jika lebih dari satu)"),
+    limit: int = Query(10000, ge=1, le=ROLLUP_MAX_ROWS),
+    db: Session = Depends(get_db)
+):
+    """
+    Agregat volume, penjualan, dan jumlah transaksi dari transaction_rollup_daily
+    (grain harian per MOR/provinsi/kota/SPBU/produk), dikelompokkan ulang sesuai group_by.
+    Jumlah anomali diambil dari anomaly_rollup_daily untuk execution yang diminta.
+    """
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to harus sama dengan atau setelah date_from.")
+    dimensions = list(dict.fromkeys(d.strip() for d in group_by.split(',') if d.strip()))
+    unknown = [d for d in dimensions if d not in ROLLUP_GROUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Dimensi tidak dikenal: {', '.join(unknown)}")
+    filters = {'mor': mor, 'provinsi': provinsi, 'kota_kabupaten': kota_kabupaten, 'no_spbu': no_spbu, 'produk': produk}
+
+    T = TransactionRollupDaily
+    transactions = select(
+        *(dimension_column(T, d).label(d) for d in dimensions),
+        func.sum(T.transaction_count).label('transaction_count'),
+        func.sum(T.total_volume_liter).label('total_volume_liter'),
+        func.sum(T.total_penjualan_rupiah).label('total_penjualan_rupiah'),
+    ).where(*rollup_conditions(T, date_from, date_to, filters))
+    if dimensions:
+        transactions = transactions.group_by(*(dimension_column(T, d) for d in dimensions))
+    transactions = transactions.subquery('transactions')
+
+    columns = [transactions.c[d] for d in dimensions] + [
+        transactions.c.transaction_count, transactions.c.total_volume_liter, transactions.c.total_penjualan_rupiah,
+    ]
+    query = select(*columns).select_from(transactions)
+
+    if execution_id:
+        A = AnomalyRollupDaily
+        anomalies = select(
+            *(dimension_column(A, d).label(d) for d in dimensions),
+            func.sum(A.anomalous_transactions).label('anomalous_transactions'),
+            func.sum(A.anomalous_volume_liter).label('anomalous_volume_liter'),
+        ).where(A.execution_id.in_(execution_id), *rollup_conditions(A, date_from, date_to, filters))
+        if dimensions:
+            anomalies = anomalies.group_by(*(dimension_column(A, d) for d in dimensions))
+        anomalies = anomalies.subquery('anomalies')
+        join_condition = and_(*(transactions.c[d] == anomalies.c[d] for d in dimensions)) if dimensions else true()
+        query = select(
+            *columns,
+            func.coalesce(anomalies.c.anomalous_transactions, 0).label('anomalous_transactions'),
+            func.coalesce(anomalies.c.anomalous_volume_liter, 0).label('anomalous_volume_liter'),
+        ).select_from(transactions.outerjoin(anomalies, join_condition))
+
+    rows = db.execute(query.order_by(*(transactions.c[d] for d in dimensions)).limit(limit + 1)).mappings().all()
+
+    result = RollupResult(
+        group_by=dimensions,
+        date_from=date_from.isoformat(),
+        date_to=date_to.isoformat(),
+        execution_ids=execution_id,
+        truncated=len(rows) > limit,
+    )
+    for row in rows[:limit]:
+        if row['transaction_count'] is None: # Total tanpa group_by pada rentang kosong
+            continue
+        values = dict(row)
+        for dimension in dimensions:
+            # Dimensi kosong disimpan sebagai '' di rollup (lihat TransactionRollupDaily)
+            values[dimension] = values[dimension] or None
+        result.rows.append(RollupRow(**values))
+    return result
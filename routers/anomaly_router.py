@@ -1,10 +1,14 @@
 from __future__ import annotations # Enable Postponed Evaluation of Annotations
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Optional
 from rq import Queue # Import Queue
 from redis import Redis
+from redis.exceptions import RedisError
 
+from app import cache, models, template_catalog
 from app.database import get_db
 from app.models import AnomalyTemplateMaster, TransactionAnomalyCriteria, SpecialAnomalyCriteria, VideoAiParameter, AccumulatedAnomalyCriteria, AnomalyResult, AnomalyExecution, AnomalyExecutionBatch, CsvSummaryMasterDaily, CsvImportLog, TabelMor
 from app.schemas import (
@@ -12,8 +16,10 @@ from app.schemas import (
     TransactionAnomalyCriteria, TransactionAnomalyCriteriaCreate, TransactionAnomalyCriteriaUpdate,
     SpecialAnomalyCriteria, SpecialAnomalyCriteriaCreate, SpecialAnomalyCriteriaUpdate,
     VideoAiParameter, AccumulatedAnomalyCriteria, CsvSummaryMasterDaily, AccumulatedAnomalyCriteriaCreate, AccumulatedAnomalyCriteriaUpdate,
-    AnomalyResult # Import AnomalyResult schema
+    AnomalyResult, # Import AnomalyResult schema
+    AnomalyFlagCountResult, SpecialCriteriaExpression, SpecialCriteriaExpressionResult
 )
+from app.rule_expression import ExpressionError, compile_expression
 from crud import anomaly_crud, analysis_crud, anomaly_execution_crud
 
 router = APIRouter(
@@ -21,21 +27,92 @@ router = APIRouter(
     tags=["Anomaly Configuration"],
 )
 
+# Ukuran halaman API hasil anomali (keyset pagination)
+RESULTS_PAGE_SIZE = 100
+RESULTS_MAX_PAGE_SIZE = 1000
+
 # Redis Queue Connection
 redis_conn = Redis.from_url('redis://redis_broker:6379')
 q = Queue(connection=redis_conn)
 
+def get_template_snapshot(db: Session, template_id: int) -> dict:
+    """Snapshot template + kriteria tertaut dari katalog (tanpa lazy load per relasi)."""
+    template_snapshot = template_catalog.get_catalog(db)["templates_by_id"].get(template_id)
+    if not template_snapshot:
+        raise HTTPException(status_code=404, detail=f"Template with id {template_id} not found.")
+    return template_snapshot
+
+def submit_for_template(db: Session, template_id: int, summary_ids: List[int], executed_by: str):
+    """Mendaftarkan execution untuk satu template; mengembalikan (execution_id, status, dibuat_baru)."""
+    template_snapshot = get_template_snapshot(db, template_id)
+
+    # Extract rules from the template
+    rules_applied = []
+    rules_config = {} # This would be more complex to build from criteria, for now keep it simple
+    rules_applied.extend([f"TC_{c['criteria_id']}" for c in template_snapshot["transaction_criteria"] or []])
+    rules_applied.extend([f"SC_{c['special_criteria_id']}" for c in template_snapshot["special_criteria"] or []])
+    rules_applied.extend([f"AC_{c['accumulated_criteria_id']}" for c in template_snapshot["accumulated_criteria"] or []])
+
+    return anomaly_execution_crud.submit_anomaly_execution(
+        db=db,
+        template_id=template_id,
+        executed_by=executed_by,
+        rules_applied=rules_applied,
+        summary_ids=summary_ids,
+        fingerprint=anomaly_execution_crud.submission_fingerprint(template_snapshot, summary_ids),
+        rules_config=rules_config
+    )
+
+def start_multi_template_analysis(request: AnomalyAnalysisRequest, db: Session):
+    """
+    Satu execution per template (masing-masing dengan deduplikasi in-flight), dijalankan oleh satu job
+    yang mengambil data sekali dan mengevaluasi gabungan aturan semua template sekali.
+    """
+    template_ids = list(dict.fromkeys(request.template_ids))
+    summary_ids = list(dict.fromkeys(request.summary_ids))
+    # Validasi semua template sebelum ada execution yang dibuat
+    for template_id in template_ids:
+        get_template_snapshot(db, template_id)
+
+    submissions = []
+    for template_id in template_ids:
+        execution_id, status, created = submit_for_template(db, template_id, summary_ids, request.executed_by)
+        submissions.append({"template_id": template_id, "execution_id": execution_id, "status": status, "deduplicated": not created})
+
+    new_executions = [[s["execution_id"], s["template_id"]] for s in submissions if not s["deduplicated"]]
+    job_id = None
+    if new_executions:
+        try:
+            job = q.enqueue(
+                'rq_worker_entrypoint.execute_multi_template_analysis_job',
+                new_executions,
+                summary_ids,
+                job_timeout=anomaly_execution_crud.ANALYSIS_JOB_TIMEOUT
+            )
+        except RedisError as e:
+            for execution_id, _ in new_executions:
+                anomaly_execution_crud.finish_anomaly_execution(db, execution_id, "FAILED")
+            raise HTTPException(status_code=503, detail=f"Job analisis tidak dapat diantrikan: {e}")
+        job_id = job.id
+
+    return {"job_id": job_id, "executions": submissions}
+
 @router.post("/analyze", status_code=202)
 def start_analysis(request: AnomalyAnalysisRequest, db: Session = Depends(get_db)):
-    template_to_use = None
-    if request.template_id:
-        template_to_use = anomaly_crud.get_template(db, request.template_id)
-        if not template_to_use:
-            raise HTTPException(status_code=404, detail=f"Template with id {request.template_id} not found.")
+    """
+    Mendaftarkan execution beserta semua batch dalam satu transaksi lalu mengantrikan job.
+    Submission identik (template dan isi kriteria sama, set summary sama) yang masih in-flight
+    tidak dijalankan ulang: execution yang sudah ada dikembalikan dengan deduplicated=true.
+    Dengan template_ids, setiap template mendapat execution sendiri dalam satu job bersama.
+    """
+    if request.template_ids:
+        return start_multi_template_analysis(request, db)
+    elif request.template_id:
+        template_id = request.template_id
     elif request.transaction_criteria_ids or request.special_criteria_ids or request.accumulated_criteria_ids:
         # Create or get an ad-hoc template
         ad_hoc_template_name = "Ad-Hoc Analysis Template"
-        template_to_use = db.query(AnomalyTemplateMaster).filter_by(role_name=ad_hoc_template_name).first()
+        template_to_use = db.query(models.AnomalyTemplateMaster).filter_by(role_name=ad_hoc_template_name).first()
         if not template_to_use:
             template_to_use = anomaly_crud.create_template(db, AnomalyTemplateMasterCreate(
                 role_name=ad_hoc_template_name,
@@ -43,69 +120,42 @@ def start_analysis(request: AnomalyAnalysisRequest, db: Session = Depends(get_db
                 is_default=False,
                 created_by=request.executed_by
             ))
-        
-        # Link the provided criteria to the ad-hoc template
+        template_id = template_to_use.template_id
+
+        # Link the provided criteria to the ad-hoc template (membump versi katalog template)
         anomaly_crud.update_template_links(
             db,
-            template_to_use.template_id,
+            template_id,
             request.transaction_criteria_ids if request.transaction_criteria_ids else [],
             request.special_criteria_ids if request.special_criteria_ids else [],
             [], # No video criteria for now
             request.accumulated_criteria_ids if request.accumulated_criteria_ids else []
         )
-        # Refresh the template to load the newly linked criteria
-        db.refresh(template_to_use)
     else:
         raise HTTPException(status_code=422, detail="Either template_id or individual criteria IDs must be provided.")
 
-    # Extract rules from the template
-    rules_applied = []
-    rules_config = {} # This would be more complex to build from criteria, for now keep it simple
-
-    # Collect IDs of linked criteria
-    if template_to_use.transaction_criteria:
-        rules_applied.extend([f"TC_{c.criteria_id}" for c in template_to_use.transaction_criteria])
-
-    if template_to_use.special_criteria:
-        rules_applied.extend([f"SC_{c.special_criteria_id}" for c in template_to_use.special_criteria])
-
-    if template_to_use.accumulated_criteria:
-        rules_applied.extend([f"AC_{c.accumulated_criteria_id}" for c in template_to_use.accumulated_criteria])
-
-    # 1. Create AnomalyExecution record
-    execution = anomaly_execution_crud.create_anomaly_execution(
-        db=db,
-        template_id=template_to_use.template_id, # Use the template_id from the resolved template
-        executed_by=request.executed_by,
-        rules_applied=rules_applied,
-        rules_config=rules_config, # For now, this will be empty or manually constructed
-        status="QUEUED",
-        total_batches_processed=len(request.summary_ids)
-    )
-
-    # 2. Create AnomalyExecutionBatch records
-    for summary_id in request.summary_ids:
-        anomaly_execution_crud.create_anomaly_execution_batch(
-            db=db,
-            execution_id=execution.execution_id,
-            summary_id=summary_id,
-            batch_status="QUEUED"
+    summary_ids = list(dict.fromkeys(request.summary_ids))
+
+    # 1. AnomalyExecution + semua AnomalyExecutionBatch dalam satu transaksi
+    execution_id, status, created = submit_for_template(db, template_id, summary_ids, request.executed_by)
+    if not created:
+        return {"execution_id": execution_id, "job_id": execution_id, "status": status, "deduplicated": True}
+
+    # 2. Enqueue the analysis job (job_id = execution_id)
+    try:
+        job = q.enqueue(
+            'rq_worker_entrypoint.execute_anomaly_analysis_job', # Use the wrapper function string
+            execution_id,
+            summary_ids,
+            template_id,
+            job_id=execution_id,
+            job_timeout=anomaly_execution_crud.ANALYSIS_JOB_TIMEOUT
         )
+    except RedisError as e:
+        anomaly_execution_crud.finish_anomaly_execution(db, execution_id, "FAILED")
+        raise HTTPException(status_code=503, detail=f"Job analisis tidak dapat diantrikan: {e}")
 
-    # 3. Enqueue the analysis job
-    # Pass execution_id and summary_ids to the worker
-    job = q.enqueue(
-        'rq_worker_entrypoint.execute_anomaly_analysis_job', # Use the wrapper function string
-        execution.execution_id, # Pass execution_id
-        request.summary_ids,    # Pass summary_ids
-        template_to_use.template_id, # Pass template_id
-        job_timeout=3600
-    )
-
-    # Update execution status to PENDING (or RUNNING) if job enqueued successfully
-    anomaly_execution_crud.update_anomaly_execution_status(db, execution.execution_id, "PENDING")
-
-    return {"execution_id": execution.execution_id, "job_id": job.id}
+    return {"execution_id": execution_id, "job_id": job.id, "status": status, "deduplicated": False}
 
 
 
@@ -113,21 +163,23 @@ def start_analysis(request: AnomalyAnalysisRequest, db: Session = Depends(get_db
 
 @router.get("/templates", response_model=List[AnomalyTemplateMaster])
 def get_templates(db: Session = Depends(get_db)):
-    return anomaly_crud.get_templates(db)
+    catalog = template_catalog.get_catalog(db)
+    return Response(content=cache.json_body(catalog["templates"]), media_type='application/json')
 
 @router.get("/templates/{template_id}")
 def get_template_details(template_id: int, db: Session = Depends(get_db)):
-    template = anomaly_crud.get_template(db, template_id)
+    catalog = template_catalog.get_catalog(db)
+    template = catalog["templates_by_id"].get(template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
-    
-    return {
+
+    return Response(content=cache.json_body({
         "template": template,
-        "available_volume": db.query(TransactionAnomalyCriteria).all(),
-        "available_special": db.query(SpecialAnomalyCriteria).all(),
-        "available_video": db.query(VideoAiParameter).all(),
-        "available_accumulated": db.query(AccumulatedAnomalyCriteria).all(),
-    }
+        "available_volume": catalog["available_volume"],
+        "available_special": catalog["available_special"],
+        "available_video": catalog["available_video"],
+        "available_accumulated": catalog["available_accumulated"],
+    }), media_type='application/json')
 
 @router.post("/templates", response_model=AnomalyTemplateMaster, status_code=201)
 def create_template(template: AnomalyTemplateMasterCreate, db: Session = Depends(get_db)):
@@ -167,8 +219,35 @@ def delete_template(template_id: int, db: Session = Depends(get_db)):
     return {"message": "Template deleted successfully."}
 
 # Endpoints for SpecialAnomalyCriteria
+def compile_violation_rule(violation_rule: str, value: Optional[str]):
+    try:
+        return compile_expression(violation_rule, value)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=f"violation_rule tidak valid: {e}")
+
+def check_violation_rule(criteria_code: str, violation_rule: str, value: Optional[str]):
+    """Kode bawaan dievaluasi oleh implementasi tetap; kriteria lain harus punya violation_rule yang bisa dikompilasi."""
+    if criteria_code not in analysis_crud.BUILTIN_SPECIAL_CRITERIA_CODES:
+        compile_violation_rule(violation_rule, value)
+
+@router.post("/special-criteria/validate", response_model=SpecialCriteriaExpressionResult)
+def validate_special_criteria_rule(expression: SpecialCriteriaExpression):
+    """
+    Memvalidasi violation_rule tanpa menyimpannya. Ekspresi yang memakai kolom, fungsi, atau sintaks
+    yang tidak dapat dievaluasi sebagai operasi kolom ditolak dengan 400.
+    """
+    compiled = compile_violation_rule(expression.violation_rule, expression.value)
+    return SpecialCriteriaExpressionResult(
+        violation_rule=expression.violation_rule,
+        normalized=compiled.normalized,
+        columns=compiled.columns,
+        functions=compiled.functions,
+        conjuncts=[conjunct["source"] for conjunct in compiled.conjuncts],
+    )
+
 @router.post("/special-criteria", response_model=SpecialAnomalyCriteria, status_code=201)
 def create_special_criteria(criteria: SpecialAnomalyCriteriaCreate, db: Session = Depends(get_db)):
+    check_violation_rule(criteria.criteria_code, criteria.violation_rule, criteria.value)
     return anomaly_crud.create_special_criteria(db=db, criteria=criteria)
 
 @router.get("/special-criteria", response_model=List[SpecialAnomalyCriteria])
@@ -184,6 +263,15 @@ def get_special_criteria(special_criteria_id: int, db: Session = Depends(get_db)
 
 @router.put("/special-criteria/{special_criteria_id}", response_model=SpecialAnomalyCriteria)
 def update_special_criteria(special_criteria_id: int, criteria: SpecialAnomalyCriteriaUpdate, db: Session = Depends(get_db)):
+    existing = anomaly_crud.get_special_criteria(db, special_criteria_id)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Special Criteria not found")
+    changes = criteria.model_dump(exclude_unset=True)
+    check_violation_rule(
+        changes.get("criteria_code", existing.criteria_code),
+        changes.get("violation_rule", existing.violation_rule),
+        changes.get("value", existing.value),
+    )
     updated_criteria = anomaly_crud.update_special_criteria(db, special_criteria_id, criteria)
     if not updated_criteria:
         raise HTTPException(status_code=404, detail="Special Criteria not found")
@@ -256,10 +344,98 @@ def delete_accumulated_criteria(accumulated_criteria_id: int, db: Session = Depe
         raise HTTPException(status_code=404, detail="Accumulated Criteria not found")
     return {"message": "Accumulated Criteria deleted successfully."}
 
+# Endpoints for AnomalyExecution
+@router.get("/executions/{execution_id}", response_model=AnomalyExecution)
+def get_execution(execution_id: str, db: Session = Depends(get_db)):
+    execution = anomaly_execution_crud.get_anomaly_execution_by_id(db, execution_id)
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    return execution
+
+@router.get("/executions/{execution_id}/profile")
+def get_execution_profile(execution_id: str, db: Session = Depends(get_db)):
+    """
+    Mengembalikan span waktu per tahap (fetch, build_dataframe, evaluate_rules, save_results)
+    dan per aturan (rows_evaluated, hits, wall_seconds, memory_delta_bytes) dari eksekusi terakhir.
+    """
+    execution = anomaly_execution_crud.get_anomaly_execution_by_id(db, execution_id)
+    if not execution:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    profile = (execution.rules_config or {}).get("profile")
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"No profile recorded yet for execution {execution_id}")
+    return {"execution_id": execution_id, "status": execution.status, "profile": profile}
+
 # Endpoints for AnomalyResult
+def encode_results_cursor(position: tuple) -> str:
+    payload = json.dumps(list(position), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_results_cursor(cursor: str) -> tuple:
+    """Mengembalikan (execution_id, transaction_id_asersi) baris terakhir halaman sebelumnya."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        execution_id, transaction_id_asersi = json.loads(base64.urlsafe_b64decode(padded))
+        return str(execution_id), str(transaction_id_asersi)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid.")
+
+@router.get("/results", response_model=List[AnomalyResult], responses={200: {"description": "List hasil (mode=rows) atau AnomalyFlagCountResult (mode=flag_counts)"}})
+def list_anomaly_results(
+    execution_id: Optional[str] = None,
+    summary_id: Optional[int] = None,
+    flag: Optional[str] = Query(None, description="Hanya hasil dengan flag ini, mis. RED_PLATE_VEHICLE"),
+    anomalous_only: bool = False,
+    mode: str = Query('rows', pattern=r'^(rows|flag_counts)$', description="rows = halaman hasil; flag_counts = jumlah transaksi per flag"),
+    limit: int = Query(RESULTS_PAGE_SIZE, ge=1, le=RESULTS_MAX_PAGE_SIZE),
+    after: Optional[str] = Query(None, description="Nilai header X-Next-Cursor dari halaman sebelumnya"),
+    db: Session = Depends(get_db)
+):
+    """
+    Hasil anomali per execution dan/atau summary dengan keyset pagination (cursor halaman
+    berikutnya di header X-Next-Cursor), urut (execution_id, transaction_id_asersi).
+    mode=flag_counts mengembalikan agregat jumlah per flag alih-alih baris.
+    Respons di-cache di Redis sampai eksekusi berikutnya selesai.
+    """
+    if execution_id is None and summary_id is None:
+        raise HTTPException(status_code=400, detail="Isi execution_id dan/atau summary_id.")
+
+    if mode == 'flag_counts':
+        def build():
+            total, counts = anomaly_crud.count_anomaly_flags(db, execution_id, summary_id)
+            result = AnomalyFlagCountResult(
+                execution_id=execution_id,
+                summary_id=summary_id,
+                total_anomalous=total,
+                flags=[{"flag": row.flag, "count": row.count} for row in counts],
+            )
+            return cache.json_body(result), {}
+
+        body, headers = cache.cached_response(cache.RESULTS_NAMESPACE, build, 'flag_counts', execution_id, summary_id)
+        return Response(content=body, media_type='application/json', headers=headers)
+
+    position = decode_results_cursor(after) if after else None
+
+    def build():
+        rows, next_position = anomaly_crud.get_anomaly_results_page(
+            db, execution_id, summary_id, flag, anomalous_only, limit, position
+        )
+        # Baris sudah bertipe benar dari kolom tabel; tanpa validasi Pydantic per baris
+        items = [dict(row._mapping) for row in rows]
+        return cache.json_body(items), ({'X-Next-Cursor': encode_results_cursor(next_position)} if next_position else {})
+
+    body, headers = cache.cached_response(
+        cache.RESULTS_NAMESPACE, build, 'page', execution_id, summary_id, flag, anomalous_only, limit, position
+    )
+    return Response(content=body, media_type='application/json', headers=headers)
+
 @router.get("/results/{summary_id}", response_model=List[AnomalyResult])
 def get_anomaly_results_for_summary(summary_id: int, db: Session = Depends(get_db)):
-    results = anomaly_crud.get_anomaly_results_by_summary_id(db, summary_id)
-    if not results:
-        raise HTTPException(status_code=404, detail=f"No anomaly results found for summary_id {summary_id}")
-    return results
+    def build():
+        results = anomaly_crud.get_anomaly_results_by_summary_id(db, summary_id)
+        if not results:
+            raise HTTPException(status_code=404, detail=f"No anomaly results found for summary_id {summary_id}")
+        return cache.json_body([AnomalyResult.model_validate(r, from_attributes=True) for r in results]), {}
+
+    body, headers = cache.cached_response(cache.RESULTS_NAMESPACE, build, 'summary', summary_id)
+    return Response(content=body, media_type='application/json', headers=headers)
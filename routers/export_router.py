@@ -1,5 +1,7 @@
 import os
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
@@ -7,13 +9,36 @@ import json
 import redis
 import requests
 import logging
-from datetime import datetime
+import csv
+import io
+import decimal
+from datetime import datetime, date, time
 from urllib.parse import urljoin
+from psycopg2 import sql
+
+import psycopg2
+from db_config import POSTGRES_CONFIG
+from app.filter_compiler import FilterError, apply_filters, check_filter_plan
+from export_worker import build_anomaly_data_query, build_summary_data_query
 
 # --- Konfigurasi ---
 REDIS_HOST = os.getenv('REDIS_HOST', 'redis_broker')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 EXPORT_QUEUE = 'export-queue'
+EXPORT_FORMATS = {'csv', 'xlsx', 'parquet'}
+# Hash progres yang ditulis worker (lihat export_worker.ExportProgress)
+EXPORT_PROGRESS_PREFIX = 'export:progress:'
+EXPORT_PROGRESS_TTL = int(os.getenv('EXPORT_PROGRESS_TTL_HOURS', '24')) * 3600
+# Format yang hasilnya dibungkus ZIP oleh worker (profile + data)
+ZIP_FORMATS = {'csv', 'parquet'}
+# Kompresi arsip CSV per permintaan (lihat export_worker.COMPRESSION_EXTENSIONS) dan rentang levelnya
+COMPRESSION_EXTENSIONS = {'deflate': 'zip', 'store': 'zip', 'gzip': 'tar.gz', 'zstd': 'tar.zst'}
+COMPRESSION_LEVELS = {'deflate': (0, 9), 'store': (0, 0), 'gzip': (1, 9), 'zstd': (1, 22)}
+EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'deflate').lower()
+# Format untuk unduhan langsung (/stream) dan batas estimasi baris sebelum dialihkan ke antrian
+STREAM_FORMATS = {'csv', 'ndjson'}
+EXPORT_STREAM_MAX_ROWS = int(os.getenv('EXPORT_STREAM_MAX_ROWS', '50000'))
+EXPORT_STREAM_FETCH_SIZE = 5000
 # URL ini adalah bagaimana FastAPI (di dalam Docker venv) akan berkomunikasi dengan Laravel (di dalam Docker Sail)
 # 'host.docker.internal' adalah DNS khusus yang merujuk ke mesin host dari dalam container.
 LARAVEL_API_BASE = 'http://host.docker.internal:8080/api/'
@@ -22,12 +47,41 @@ router = APIRouter(prefix="/v1/export", tags=["Export Jobs"])
 
 # --- Model Pydantic untuk Validasi ---
 class ExportRequest(BaseModel):
-    summary_id: int
+    # Pilih salah satu: satu summary, daftar summary, atau rentang tanggal import
+    summary_id: Optional[int] = None
+    summary_ids: Optional[List[int]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    # Untuk source 'anomalies': transaksi ter-flag dari satu execution analisis anomali
+    execution_id: Optional[str] = None
     format: str
     source: str
     filters: Optional[List[Dict[str, Any]]] = None
+    # Hanya untuk format csv: 'deflate' (default), 'store', 'gzip', atau 'zstd', opsional dengan level
+    compression: Optional[str] = None
+    compression_level: Optional[int] = None
     log_title: str # Diperlukan untuk nama file
 
+class ExportStatus(BaseModel):
+    job_id: str
+    status: str
+    format: Optional[str] = None
+    rows_written: int = 0
+    bytes_written: int = 0
+    estimated_total_rows: Optional[int] = None
+    percent_complete: Optional[float] = None
+    elapsed_seconds: Optional[float] = None
+    rows_per_second: Optional[float] = None
+    bytes_per_second: Optional[float] = None
+    file_size_bytes: Optional[int] = None
+    file_path: Optional[str] = None
+    cache_hit: bool = False
+    error_message: Optional[str] = None
+    queued_at: Optional[str] = None
+    started_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
 # --- Koneksi Redis ---
 try:
     redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
@@ -37,6 +91,30 @@ except redis.exceptions.ConnectionError as e:
     logging.error(f"Gagal terhubung ke Redis untuk router ekspor: {e}")
     redis_conn = None
 
+def validate_export_selection(request: ExportRequest):
+    """Source 'anomalies' memilih data lewat execution_id; source lain lewat tepat satu pilihan summary."""
+    selections = [request.summary_id is not None, bool(request.summary_ids), bool(request.date_from or request.date_to)]
+    if request.source == 'anomalies':
+        if not request.execution_id:
+            raise HTTPException(status_code=400, detail="Source 'anomalies' membutuhkan execution_id.")
+        if any(selections):
+            raise HTTPException(status_code=400, detail="Source 'anomalies' tidak menerima summary_id, summary_ids, atau date_from/date_to.")
+    elif sum(selections) != 1:
+        raise HTTPException(status_code=400, detail="Isi tepat satu dari summary_id, summary_ids, atau date_from/date_to.")
+
+def validate_compression(request: ExportRequest):
+    if request.compression is None and request.compression_level is None:
+        return
+    if request.format != 'csv':
+        raise HTTPException(status_code=400, detail="Opsi kompresi hanya berlaku untuk format csv.")
+    method = (request.compression or EXPORT_COMPRESSION).lower()
+    if method not in COMPRESSION_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Metode kompresi tidak didukung: {request.compression}")
+    if request.compression_level is not None:
+        low, high = COMPRESSION_LEVELS[method]
+        if not low <= request.compression_level <= high:
+            raise HTTPException(status_code=400, detail=f"Level kompresi {method} harus antara {low} dan {high}.")
+
 @router.post("/start")
 async def start_export_job(request: ExportRequest):
     """
@@ -46,18 +124,25 @@ async def start_export_job(request: ExportRequest):
     """
     if not redis_conn:
         raise HTTPException(status_code=503, detail="Layanan Redis tidak tersedia.")
+    if request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format ekspor tidak didukung: {request.format}")
+    validate_export_selection(request)
+    validate_compression(request)
 
     job_id = str(uuid.uuid4())
     now = datetime.now().strftime('%Y%m%d_%H%M%S')
     title_slug = "".join(c if c.isalnum() else '_' for c in request.log_title)
     
-    file_extension = 'zip' if request.format == 'csv' else request.format
+    if request.format == 'csv':
+        file_extension = COMPRESSION_EXTENSIONS[(request.compression or EXPORT_COMPRESSION).lower()]
+    else:
+        file_extension = 'zip' if request.format in ZIP_FORMATS else request.format
     file_name = f"{title_slug}_{now}.{file_extension}"
 
     # 1. Panggil API Laravel untuk membuat catatan log awal
     create_log_url = urljoin(LARAVEL_API_BASE, 'export/create-log')
     laravel_payload = {
-        "summary_id": request.summary_id,
+        "summary_id": request.summary_id if request.summary_id is not None else (request.summary_ids or [None])[0],
         "job_id": job_id,
         "format": request.format,
         "file_name": file_name,
@@ -86,39 +171,194 @@ async def start_export_job(request: ExportRequest):
     job_data = {
         'job_id': job_id,
         'summary_id': request.summary_id,
+        'summary_ids': request.summary_ids,
+        'date_from': request.date_from.isoformat() if request.date_from else None,
+        'date_to': request.date_to.isoformat() if request.date_to else None,
+        'execution_id': request.execution_id,
         'format': request.format,
         'source': request.source,
         'filters': request.filters,
+        'compression': request.compression.lower() if request.compression else None,
+        'compression_level': request.compression_level,
         'file_name': file_name,
         'log_title': request.log_title,
         'callback_url': callback_url,
     }
 
     try:
-        redis_conn.lpush(EXPORT_QUEUE, json.dumps(job_data))
+        pipe = redis_conn.pipeline()
+        pipe.hset(f"{EXPORT_PROGRESS_PREFIX}{job_id}", mapping={
+            'status': 'QUEUED', 'format': request.format, 'queued_at': datetime.now().isoformat(),
+        })
+        pipe.expire(f"{EXPORT_PROGRESS_PREFIX}{job_id}", EXPORT_PROGRESS_TTL)
+        pipe.lpush(EXPORT_QUEUE, json.dumps(job_data))
+        pipe.execute()
         logging.info(f"Pekerjaan ekspor {job_id} berhasil didorong ke antrian.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal mendorong pekerjaan ke Redis: {e}")
 
     return export_log
 
-@router.get("/status/{job_id}")
+@router.get("/status/{job_id}", response_model=ExportStatus)
 async def get_export_status(job_id: str):
     """
-    API untuk memeriksa status pekerjaan ekspor dari database.
+    API untuk memeriksa status dan progres pekerjaan ekspor dari hash Redis yang
+    diperbarui worker secara berkala (baris/byte yang sudah ditulis, estimasi total, throughput).
     """
-    query = "SELECT id, user_id, summary_id, job_id, status, file_path, file_name, format, error_message, created_at, updated_at FROM export_logs WHERE job_id = %s"
-    
+    if not redis_conn:
+        raise HTTPException(status_code=503, detail="Layanan Redis tidak tersedia.")
     try:
-        # Menggunakan koneksi psycopg2 langsung karena ini adalah query sederhana
-        from database import get_db_connection
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=requests.packages.urllib3.util.selectors.DictCursor) as cursor:
-                cursor.execute(query, (job_id,))
-                record = cursor.fetchone()
-                if not record:
-                    raise HTTPException(status_code=404, detail="Pekerjaan ekspor tidak ditemukan.")
-                return dict(record)
-    except Exception as e:
+        progress = redis_conn.hgetall(f"{EXPORT_PROGRESS_PREFIX}{job_id}")
+    except redis.exceptions.RedisError as e:
         logging.error(f"Gagal mengambil status pekerjaan {job_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Gagal mengambil status pekerjaan: {e}")
+        raise HTTPException(status_code=503, detail=f"Gagal mengambil status pekerjaan: {e}")
+    if not progress:
+        raise HTTPException(status_code=404, detail="Pekerjaan ekspor tidak ditemukan.")
+
+    fields = {key: value for key, value in progress.items() if value != ''}
+    fields['cache_hit'] = fields.get('cache_hit') == '1'
+    status_data = ExportStatus(job_id=job_id, **fields)
+    if status_data.estimated_total_rows:
+        status_data.percent_complete = round(min(status_data.rows_written / status_data.estimated_total_rows, 1.0) * 100, 2)
+    if status_data.status == 'COMPLETED':
+        status_data.percent_complete = 100.0
+    return status_data
+
+# --- Unduhan langsung (streaming) ---
+
+def build_export_data_query(request: ExportRequest):
+    """
+    Query data ekspor yang sama dengan worker: semua baris summary, opsional dengan filter,
+    atau transaksi ter-flag satu execution untuk source 'anomalies'.
+    """
+    if request.source == 'anomalies':
+        query, params = apply_filters(build_anomaly_data_query(per_summary=False), request.filters)
+        return query + sql.SQL(" ORDER BY r.summary_id, r.transaction_id_asersi"), [request.execution_id] + params
+
+    query = build_summary_data_query()
+    params = [request.summary_id]
+    if request.source == 'filtered':
+        query, filter_params = apply_filters(query, request.filters)
+        params += filter_params
+    return query, params
+
+def open_stream_connection():
+    """
+    Koneksi psycopg2 milik satu unduhan streaming. Tidak memakai context manager
+    get_db_connection karena koneksi harus tetap hidup sampai generator StreamingResponse selesai.
+    """
+    try:
+        return psycopg2.connect(**POSTGRES_CONFIG)
+    except psycopg2.Error as e:
+        logging.error(f"Database connection error: {e}", exc_info=True)
+        raise HTTPException(status_code=503, detail="Layanan Database tidak tersedia.")
+
+def count_export_rows(conn, query, params, source: str, limit: int) -> int:
+    """
+    Jumlah baris ekspor, dihitung paling banyak sampai `limit` + 1 sehingga biayanya terbatas.
+    Statistik planner belum tentu terbaru setelah import, jadi EXPLAIN hanya dipakai
+    untuk memeriksa Seq Scan pada filter.
+    """
+    with conn.cursor() as cursor:
+        if source == 'filtered':
+            check_filter_plan(cursor, query, params)
+        cursor.execute(sql.SQL("SELECT COUNT(*) FROM ({} LIMIT %s) AS limited").format(query), params + [limit + 1])
+        rows = cursor.fetchone()[0]
+    conn.rollback()
+    return rows
+
+def csv_value(value):
+    """Format nilai CSV sama seperti file ekspor: desimal koma, JSON sebagai teks."""
+    if value is None:
+        return ''
+    if isinstance(value, (decimal.Decimal, float)):
+        return str(value).replace('.', ',')
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+def json_value(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+def stream_export_rows(conn, query, params, export_format: str):
+    """
+    Generator yang membaca hasil query dari server-side cursor per batch dan menghasilkan
+    potongan CSV (';') atau NDJSON. Koneksi ditutup ketika stream selesai atau klien memutus.
+    """
+    try:
+        with conn.cursor(name='export_stream') as cursor:
+            cursor.itersize = EXPORT_STREAM_FETCH_SIZE
+            cursor.execute(query, params)
+            columns = None
+            while True:
+                rows = cursor.fetchmany(EXPORT_STREAM_FETCH_SIZE)
+                buffer = io.StringIO()
+                if columns is None:
+                    columns = [column.name for column in cursor.description]
+                    if export_format == 'csv':
+                        csv.writer(buffer, delimiter=';').writerow(columns)
+                if not rows:
+                    if buffer.tell():
+                        yield buffer.getvalue().encode('utf-8')
+                    break
+                if export_format == 'csv':
+                    writer = csv.writer(buffer, delimiter=';')
+                    writer.writerows([csv_value(value) for value in row] for row in rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps({column: json_value(value) for column, value in zip(columns, row)}, default=str))
+                        buffer.write('\n')
+                yield buffer.getvalue().encode('utf-8')
+    finally:
+        conn.close()
+
+@router.post("/stream")
+async def stream_export(request: ExportRequest):
+    """
+    Unduhan langsung untuk ekspor kecil/menengah (CSV ';' atau NDJSON) tanpa antrian, worker, dan callback.
+    Jika jumlah baris melebihi EXPORT_STREAM_MAX_ROWS, permintaan CSV dialihkan ke antrian ekspor
+    biasa (respons 202 berisi log ekspor).
+    """
+    if request.format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format streaming tidak didukung: {request.format}")
+    validate_export_selection(request)
+    if request.source != 'anomalies' and request.summary_id is None:
+        raise HTTPException(status_code=400, detail="Unduhan langsung hanya untuk satu summary_id. Gunakan /v1/export/start untuk multi-summary.")
+
+    try:
+        query, params = build_export_data_query(request)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    conn = await run_in_threadpool(open_stream_connection)
+    try:
+        export_rows = await run_in_threadpool(count_export_rows, conn, query, params, request.source, EXPORT_STREAM_MAX_ROWS)
+    except FilterError as e:
+        conn.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        conn.close()
+        raise
+
+    if export_rows > EXPORT_STREAM_MAX_ROWS:
+        conn.close()
+        if request.format != 'csv':
+            raise HTTPException(
+                status_code=413,
+                detail=f"Ekspor melebihi batas streaming ({EXPORT_STREAM_MAX_ROWS} baris). Gunakan /v1/export/start.",
+            )
+        logging.info(f"Ekspor summary {request.summary_id or request.execution_id} (>{EXPORT_STREAM_MAX_ROWS} baris) dialihkan ke antrian.")
+        export_log = await start_export_job(request)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"mode": "queued", "export_log": export_log})
+
+    title_slug = "".join(c if c.isalnum() else '_' for c in request.log_title)
+    media_type = 'text/csv; charset=utf-8' if request.format == 'csv' else 'application/x-ndjson'
+    headers = {
+        'Content-Disposition': f'attachment; filename="{title_slug}.{request.format}"',
+        'X-Export-Rows': str(export_rows),
+    }
+    return StreamingResponse(stream_export_rows(conn, query, params, request.format), media_type=media_type, headers=headers)
@@ -1,20 +1,253 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from statistics import median
+from app import cache
 from app.database import get_db
-from app.schemas import CsvSummaryMasterDaily
+from app.hll import HyperLogLog, SKETCH_COLUMNS, merge_sketches
+from app.schemas import CsvSummaryMasterDaily, DistinctCountEstimate, DistinctCountResult, ImportThroughputPoint, ImportThroughputTrend
 from app.models import CsvSummaryMasterDaily as models_CsvSummaryMasterDaily # Import models as schemas for now
+from app.models import SummaryDistinctSketch
 
 router = APIRouter(prefix="/v1/summary", tags=["CSV Summary"])
 
+# Penurunan throughput (median paruh terbaru vs paruh sebelumnya) yang dianggap melambat
+THROUGHPUT_SLOWDOWN_PERCENT = 20.0
+
+# Ukuran halaman listing summary (keyset pagination) jika hanya `after` yang diberikan
+SUMMARY_PAGE_SIZE = 100
+SUMMARY_MAX_PAGE_SIZE = 1000
+
+def summary_projection_fields() -> set:
+    """Kolom yang boleh dipilih lewat `fields`: ada di schema respons dan di tabel."""
+    return set(CsvSummaryMasterDaily.model_fields) & set(models_CsvSummaryMasterDaily.__table__.columns.keys())
+
+def parse_summary_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in requested if field not in summary_projection_fields()]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Field tidak dikenal: {', '.join(unknown)}")
+    return requested
+
+def encode_summary_cursor(order_key: str, row) -> str:
+    value = row.import_datetime.isoformat() if order_key == 'import_datetime' else None
+    payload = json.dumps([order_key, value, row.summary_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_summary_cursor(order_key: str, cursor: str):
+    """Mengembalikan (import_datetime atau None, summary_id) dari cursor halaman sebelumnya."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_key, value, summary_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_key != order_key:
+            raise ValueError(cursor_key)
+        return (datetime.fromisoformat(value) if value is not None else None), int(summary_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid untuk urutan ini.")
+
 @router.get("/daily", response_model=List[CsvSummaryMasterDaily])
-def get_all_daily_summaries(db: Session = Depends(get_db)):
-    summaries = db.query(models_CsvSummaryMasterDaily).all()
-    return summaries
+def get_all_daily_summaries(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=SUMMARY_MAX_PAGE_SIZE, description="Tanpa limit dan after, semua summary dikembalikan"),
+    after: Optional[str] = Query(None, description="Nilai header X-Next-Cursor dari halaman sebelumnya"),
+    order_by: str = Query('summary_id', pattern=r'^-?(summary_id|import_datetime)$', description="Awali dengan '-' untuk urutan menurun"),
+    fields: Optional[str] = Query(None, description="Daftar kolom dipisah koma, mis. summary_id,file_name,total_records_inserted"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    file_type: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Listing summary dengan keyset pagination (cursor halaman berikutnya di header X-Next-Cursor),
+    proyeksi kolom, dan filter tanggal import / file_type.
+    Pagination hanya aktif jika `limit` atau `after` diberikan: pemanggil lama tanpa parameter
+    tetap menerima semua summary seperti sebelumnya (tanpa X-Next-Cursor).
+    ETag diturunkan dari versi data summary di Redis, sehingga polling yang datanya tidak berubah
+    dijawab 304 tanpa menyentuh database; klien tanpa ETag yang cocok dilayani dari cache respons Redis.
+    """
+    projection = parse_summary_fields(fields)
+    if limit is None and after is not None:
+        limit = SUMMARY_PAGE_SIZE
+    version = cache.get_version(cache.SUMMARIES_NAMESPACE)
+    etag = cache.make_etag(version, limit, after, order_by, projection, date_from, date_to, file_type) if version else None
+    if etag and cache.etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    def build():
+        rows, next_cursor = query_summary_page(db, limit, after, order_by, projection, date_from, date_to, file_type)
+        if projection is None:
+            items = [CsvSummaryMasterDaily.model_validate(row, from_attributes=True).model_dump() for row in rows]
+        else:
+            # summary_id selalu disertakan sebagai identitas baris
+            include = {'summary_id', *projection}
+            items = [CsvSummaryMasterDaily.model_validate(dict(row._mapping)).model_dump(include=include) for row in rows]
+        return cache.json_body(items), ({'X-Next-Cursor': next_cursor} if next_cursor else {})
+
+    parts = ('daily', limit, after, order_by, projection, date_from, date_to, file_type)
+    body, headers = cache.cached_response(cache.SUMMARIES_NAMESPACE, build, *parts, version=version)
+    if etag:
+        headers['ETag'] = etag
+        headers['Cache-Control'] = 'no-cache'
+    return Response(content=body, media_type='application/json', headers=headers)
+
+def query_summary_page(db: Session, limit, after, order_by, projection, date_from, date_to, file_type):
+    """Satu halaman listing summary (limit None = semua baris); mengembalikan (rows, cursor halaman berikutnya atau None)."""
+    S = models_CsvSummaryMasterDaily
+    descending = order_by.startswith('-')
+    order_key = order_by.lstrip('-')
+    if projection is None:
+        query = db.query(S)
+    else:
+        # summary_id dan import_datetime selalu diambil untuk cursor dan validasi schema
+        columns = dict.fromkeys(['summary_id', 'import_datetime', *projection])
+        query = db.query(*(getattr(S, column) for column in columns))
+
+    if date_from:
+        query = query.filter(S.import_datetime >= date_from)
+    if date_to:
+        query = query.filter(S.import_datetime < date_to + timedelta(days=1))
+    if file_type:
+        query = query.filter(S.file_type == file_type)
+
+    if order_key == 'summary_id':
+        order_columns = [S.summary_id]
+        if after:
+            _, last_id = decode_summary_cursor(order_key, after)
+            query = query.filter(S.summary_id < last_id if descending else S.summary_id > last_id)
+    else:
+        order_columns = [S.import_datetime, S.summary_id]
+        if after:
+            last_datetime, last_id = decode_summary_cursor(order_key, after)
+            position = tuple_(S.import_datetime, S.summary_id)
+            query = query.filter(position < (last_datetime, last_id) if descending else position > (last_datetime, last_id))
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in order_columns))
+
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_summary_cursor(order_key, rows[-1])
+    return rows, None
 
 @router.get("/daily/{summary_id}", response_model=CsvSummaryMasterDaily)
 def get_daily_summary(summary_id: int, db: Session = Depends(get_db)):
-    summary = db.query(models_CsvSummaryMasterDaily).filter(models_CsvSummaryMasterDaily.summary_id == summary_id).first()
-    if not summary:
-        raise HTTPException(status_code=404, detail="Summary not found")
-    return summary
\ No newline at end of file
+    def build():
+        summary = db.query(models_CsvSummaryMasterDaily).filter(models_CsvSummaryMasterDaily.summary_id == summary_id).first()
+        if not summary:
+            raise HTTPException(status_code=404, detail="Summary not found")
+        return cache.json_body(CsvSummaryMasterDaily.model_validate(summary, from_attributes=True)), {}
+
+    body, headers = cache.cached_response(cache.SUMMARIES_NAMESPACE, build, 'detail', summary_id)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+@router.get("/distinct-counts", response_model=DistinctCountResult)
+def get_distinct_counts(
+    summary_ids: Optional[List[int]] = Query(None),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    columns: Optional[str] = Query(None, description=f"Kolom dipisah koma, default: {','.join(SKETCH_COLUMNS)}"),
+    db: Session = Depends(get_db)
+):
+    """
+    Estimasi jumlah nilai unik (plat_nomor, nik, operator, no_spbu) gabungan beberapa summary,
+    dari sketch HyperLogLog yang disimpan saat import, tanpa membaca csv_import_log.
+    Summary dipilih lewat summary_ids atau rentang tanggal import (date_from/date_to).
+    """
+    requested_columns = [c.strip() for c in columns.split(',') if c.strip()] if columns else list(SKETCH_COLUMNS)
+    unknown = [c for c in requested_columns if c not in SKETCH_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Kolom tanpa sketch: {', '.join(unknown)}")
+
+    S = models_CsvSummaryMasterDaily
+    if summary_ids:
+        selected_ids = list(dict.fromkeys(summary_ids))
+    elif date_from or date_to:
+        query = db.query(S.summary_id)
+        if date_from:
+            query = query.filter(S.import_datetime >= date_from)
+        if date_to:
+            query = query.filter(S.import_datetime < date_to + timedelta(days=1))
+        selected_ids = [row.summary_id for row in query.order_by(S.summary_id)]
+    else:
+        raise HTTPException(status_code=400, detail="Isi summary_ids atau date_from/date_to.")
+
+    sketch_rows = db.query(SummaryDistinctSketch).filter(
+        SummaryDistinctSketch.summary_id.in_(selected_ids),
+        SummaryDistinctSketch.column_name.in_(requested_columns)
+    ).all()
+
+    sketches_by_column = {column: [] for column in requested_columns}
+    summaries_with_sketch = set()
+    for row in sketch_rows:
+        sketches_by_column[row.column_name].append(HyperLogLog.from_bytes(row.registers, row.precision))
+        summaries_with_sketch.add(row.summary_id)
+
+    result = DistinctCountResult(
+        summary_ids=selected_ids,
+        missing_summary_ids=[summary_id for summary_id in selected_ids if summary_id not in summaries_with_sketch],
+    )
+    for column, sketches in sketches_by_column.items():
+        try:
+            merged = merge_sketches(sketches)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=f"Sketch {column}: {e}")
+        if merged is None:
+            continue
+        result.columns[column] = DistinctCountEstimate(
+            estimate=merged.estimate(),
+            relative_error=round(merged.relative_error, 4),
+            summaries_with_sketch=len(sketches),
+        )
+    return result
+
+@router.get("/import-throughput", response_model=ImportThroughputTrend)
+def get_import_throughput(
+    limit: int = Query(50, ge=2, le=1000),
+    file_type: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Tren throughput import terbaru. Membandingkan median rows_per_second paruh import terbaru
+    dengan paruh sebelumnya agar perlambatan akibat pertumbuhan database cepat terlihat.
+    """
+    S = models_CsvSummaryMasterDaily
+    query = db.query(
+        S.summary_id, S.import_datetime, S.file_type, S.total_records_read,
+        S.import_duration, S.rows_per_second, S.stage_durations
+    ).filter(S.rows_per_second.isnot(None))
+    if file_type:
+        query = query.filter(S.file_type == file_type)
+    rows = query.order_by(S.import_datetime.desc()).limit(limit).all()
+
+    points = []
+    for row in reversed(rows): # Urutan kronologis
+        insert_seconds = (row.stage_durations or {}).get("insert")
+        points.append(ImportThroughputPoint(
+            summary_id=row.summary_id,
+            import_datetime=row.import_datetime,
+            file_type=row.file_type,
+            total_records_read=row.total_records_read,
+            import_duration=float(row.import_duration) if row.import_duration is not None else None,
+            rows_per_second=float(row.rows_per_second),
+            insert_rows_per_second=round(row.total_records_read / insert_seconds, 3) if insert_seconds and row.total_records_read else None,
+            stage_durations=row.stage_durations
+        ))
+
+    trend = ImportThroughputTrend(imports_considered=len(points), points=points)
+    if len(points) >= 2:
+        half = len(points) // 2
+        previous = median(p.rows_per_second for p in points[:half])
+        recent = median(p.rows_per_second for p in points[half:])
+        trend.previous_median_rows_per_second = round(previous, 3)
+        trend.recent_median_rows_per_second = round(recent, 3)
+        if previous > 0:
+            trend.change_percent = round((recent - previous) / previous * 100, 2)
+            trend.slowing_down = trend.change_percent <= -THROUGHPUT_SLOWDOWN_PERCENT
+    return trend
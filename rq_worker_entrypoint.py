@@ -15,13 +15,14 @@ logger.debug(f"sys.path: {sys.path}")
 logger.debug(f"Current working directory: {os.getcwd()}")
 
 try:
-    from crud.analysis_crud import run_anomaly_analysis
+    from crud.analysis_crud import run_anomaly_analysis, run_multi_template_analysis
     logger.debug("Successfully imported run_anomaly_analysis from crud.analysis_crud")
 except ImportError as e:
     logger.error(f"Failed to import run_anomaly_analysis from crud.analysis_crud: {e}", exc_info=True)
     sys.exit(1)
 
 try:
+    from crud import anomaly_execution_crud
     from app.database import SessionLocal
     logger.debug("Successfully imported SessionLocal from app.database")
 except ImportError as e:
@@ -43,16 +44,48 @@ def execute_anomaly_analysis_job(execution_id: str, summary_ids: list, template_
     logger.info(f"Wrapper function received job for execution_id: {execution_id}, summary_ids: {summary_ids}, template_id: {template_id}")
     db = SessionLocal() # Create a new session for this job
     try:
+        anomaly_execution_crud.update_anomaly_execution_status(db, execution_id, "RUNNING")
         result = run_anomaly_analysis(execution_id=execution_id, summary_ids=summary_ids, template_id=template_id, db=db)
+        # Status akhir melepaskan fingerprint execution, sehingga submission identik berikutnya dijalankan ulang
+        anomaly_execution_crud.finish_anomaly_execution(db, execution_id, "FAILED" if result.get("status") == "failed" else "COMPLETED")
         logger.info(f"Anomaly analysis job completed with result: {result}")
         return result
     except Exception as e:
         logger.error(f"Error in execute_anomaly_analysis_job for execution_id {execution_id}: {e}", exc_info=True)
+        db.rollback()
+        try:
+            anomaly_execution_crud.finish_anomaly_execution(db, execution_id, "FAILED")
+        except Exception as status_error:
+            logger.error(f"Could not mark execution {execution_id} as FAILED: {status_error}")
         # Re-raise the exception so RQ marks the job as failed
         raise
     finally:
         db.close() # Close the session
 
+def execute_multi_template_analysis_job(executions: list, summary_ids: list):
+    """Job untuk beberapa execution [(execution_id, template_id), ...] atas summary yang sama."""
+    logger.info(f"Wrapper function received multi-template job for executions: {executions}, summary_ids: {summary_ids}")
+    db = SessionLocal()
+    try:
+        for execution_id, _ in executions:
+            anomaly_execution_crud.update_anomaly_execution_status(db, execution_id, "RUNNING")
+        results = run_multi_template_analysis(executions=[tuple(e) for e in executions], summary_ids=summary_ids, db=db)
+        for result in results:
+            anomaly_execution_crud.finish_anomaly_execution(db, result["execution_id"], "FAILED" if result.get("status") == "failed" else "COMPLETED")
+        logger.info(f"Multi-template analysis job completed with results: {results}")
+        return results
+    except Exception as e:
+        logger.error(f"Error in execute_multi_template_analysis_job for executions {executions}: {e}", exc_info=True)
+        db.rollback()
+        for execution_id, _ in executions:
+            try:
+                anomaly_execution_crud.finish_anomaly_execution(db, execution_id, "FAILED")
+            except Exception as status_error:
+                logger.error(f"Could not mark execution {execution_id} as FAILED: {status_error}")
+        raise
+    finally:
+        db.close()
+
 
 if __name__ == '__main__':
     logger.info("RQ Worker Entrypoint starting...")
@@ -0,0 +1,158 @@
+import decimal
+import json
+import tarfile
+import zipfile
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pyarrow.parquet as pq
+
+import export_worker
+from export_worker import parse_job, retry_or_dead_letter, write_csv_tar, write_parquet_zip, write_query_parquet
+
+class FakeCursor:
+    """
+    Cursor palsu. Named cursor mengembalikan hasil query menurut parameternya;
+    seperti psycopg2, description baru tersedia setelah fetch pertama.
+    """
+    def __init__(self, results=None):
+        self._results = results or {}
+        self._rows = []
+        self.description = None
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self._result = self._results.get(repr(params), ([], []))
+
+    def fetchone(self):
+        return ("snapshot-1",)
+
+    def fetchmany(self, size):
+        description, rows = self._result
+        self.description = description
+        rows, self._result = rows[:size], (description, rows[size:])
+        return rows
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, results=None):
+        self._results = results or {}
+
+    def cursor(self, name=None):
+        return FakeCursor(self._results)
+
+    def set_session(self, **kwargs):
+        pass
+
+    def rollback(self):
+        pass
+
+def column(name, type_code, precision=None, scale=None):
+    return SimpleNamespace(name=name, type_code=type_code, precision=precision, scale=scale)
+
+def test_unconstrained_numeric_decimals_are_written_as_float(tmp_path):
+    path = tmp_path / "data.parquet"
+    description = [column("volume_liter", 1700), column("kuota", 1700, 12, 2), column("plat_nomor", 25)]
+    rows = [(decimal.Decimal("1.5"), decimal.Decimal("10.25"), "B 1"), (None, None, None)]
+
+    assert write_query_parquet(FakeConnection({"[]": (description, rows)}), "export_data", None, [], str(path)) == 2
+
+    table = pq.read_table(path)
+    assert str(table.schema.field("volume_liter").type) == "double"
+    assert str(table.schema.field("kuota").type) == "decimal128(12, 2)"
+    assert table.to_pydict() == {
+        "volume_liter": [1.5, None], "kuota": [decimal.Decimal("10.25"), None], "plat_nomor": ["B 1", None],
+    }
+
+def test_multi_summary_parquet_export_writes_aggregated_profile(tmp_path, monkeypatch):
+    # Kolom agregat profile multi-summary: numeric hasil cast (lihat build_profile_query) dan numeric tanpa presisi
+    profile_description = [
+        column("summary_ids", 25), column("total_summaries", 20),
+        column("total_volume", 1700, 38, 3), column("total_kuota", 1700),
+    ]
+    data_description = [column("daily_summary_id", 23), column("volume_liter", 1700)]
+    conn = FakeConnection({
+        "{'summary_ids': [1, 2]}": (profile_description, [("1,2", 2, decimal.Decimal("30.500"), decimal.Decimal("7.5"))]),
+        "[1]": (data_description, [(1, decimal.Decimal("10.5"))]),
+        "[2]": (data_description, [(2, decimal.Decimal("20")), (2, None)]),
+    })
+    monkeypatch.setattr(export_worker, "get_db_connection", lambda: conn)
+    monkeypatch.setattr(export_worker, "release_db_connection", lambda conn: None)
+
+    full_path = tmp_path / "export.zip"
+    profile_query, profile_params = export_worker.build_profile_query([1, 2])
+    rows = write_parquet_zip(conn, str(full_path), "export", profile_query, profile_params, [(None, [1]), (None, [2])])
+
+    assert rows == 3
+    with zipfile.ZipFile(full_path) as zip_file:
+        zip_file.extractall(tmp_path / "out")
+    profile = pq.read_table(tmp_path / "out" / "profile_export.parquet").to_pylist()
+    assert profile == [{"summary_ids": "1,2", "total_summaries": 2, "total_volume": decimal.Decimal("30.500"), "total_kuota": 7.5}]
+    data = pq.read_table(tmp_path / "out" / "data_export").to_pydict()
+    assert data == {"daily_summary_id": [1, 2, 2], "volume_liter": [10.5, 20.0, None]}
+
+def test_csv_tar_streams_data_without_uncompressed_temp_file(tmp_path, monkeypatch):
+    data = b"".join(b"T%05d,B 1,%d\n" % (i, i) for i in range(5000))
+    def fake_copy(cursor, query, params, stream, header=True, progress=None):
+        # Data ditulis dalam beberapa potongan seperti COPY
+        payload = b"id\n1\n" if query == "profile" else data
+        for start in range(0, len(payload), 7000):
+            stream.write(payload[start:start + 7000])
+    monkeypatch.setattr(export_worker, "copy_query_to_stream", fake_copy)
+    monkeypatch.setattr(export_worker, "EXPORT_COMPRESSION_BLOCK_SIZE", 16 * 1024)
+    real_open = open
+    def guarded_open(path, mode="r", *args, **kwargs):
+        assert not ("w" in mode and str(path).endswith(".csv")), path
+        return real_open(path, mode, *args, **kwargs)
+    monkeypatch.setattr("builtins.open", guarded_open)
+
+    full_path = tmp_path / "export.tar.gz"
+    write_csv_tar(FakeConnection(), str(full_path), "export", "profile", None, [("data", None)], compression="gzip")
+
+    # Gabungan beberapa member gzip dibaca sebagai satu arsip tar yang utuh
+    assert not list(tmp_path.glob("*.part"))
+    with tarfile.open(full_path, "r:gz") as tar:
+        assert tar.getnames() == ["profile_export.csv", "data_export.csv"]
+        assert tar.extractfile("profile_export.csv").read() == b"id\n1\n"
+        assert tar.extractfile("data_export.csv").read() == data
+
+def test_failed_job_is_retried_at_the_back_then_dead_lettered():
+    job_json = json.dumps({"job_id": "J1", "callback_url": "http://laravel/callback/J1"})
+    r = MagicMock()
+    r.hincrby.side_effect = [1, 2, 3]
+    with patch("export_worker.send_callback") as send_callback, patch("export_worker.get_progress_redis", return_value=None):
+        for _ in range(3):
+            retry_or_dead_letter(r, job_json, "BrokenProcessPool")
+
+    # Dua percobaan pertama kembali ke belakang antrian (worker mengambil dari kanan)
+    assert [c.args for c in r.lpush.call_args_list] == [
+        (export_worker.EXPORT_QUEUE, job_json), (export_worker.EXPORT_QUEUE, job_json), (export_worker.EXPORT_DEAD_LETTER_QUEUE, job_json),
+    ]
+    r.rpush.assert_not_called()
+    r.hdel.assert_called_once_with(export_worker.EXPORT_ATTEMPTS_KEY, "J1")
+    send_callback.assert_called_once()
+    assert send_callback.call_args.args == ("http://laravel/callback/J1", "FAILED")
+
+def test_malformed_jobs_are_dropped():
+    assert parse_job("{not json") is None
+    assert parse_job(json.dumps({"callback_url": "http://laravel/callback"})) is None
+    assert parse_job(json.dumps(["J1"])) is None
+    assert parse_job(json.dumps({"job_id": "J1", "callback_url": "http://x"}))["job_id"] == "J1"
+
+def test_cached_export_is_published_under_the_requested_name(tmp_path):
+    import export_cache
+    (tmp_path / "exports" / "cache").mkdir(parents=True)
+    (tmp_path / "exports" / "cache" / "abc.zip").write_bytes(b"cached")
+    (tmp_path / "exports" / "bob.zip").write_bytes(b"old")
+
+    assert export_cache.publish(str(tmp_path), "exports/cache/abc.zip", "exports/bob.zip") == "exports/bob.zip"
+    assert (tmp_path / "exports" / "bob.zip").read_bytes() == b"cached"
+    assert (tmp_path / "exports" / "bob.zip").stat().st_ino == (tmp_path / "exports" / "cache" / "abc.zip").stat().st_ino
+    assert sorted(p.name for p in (tmp_path / "exports").iterdir()) == ["bob.zip", "cache"]
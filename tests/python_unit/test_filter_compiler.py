@@ -0,0 +1,82 @@
+import decimal
+import pytest
+from unittest.mock import MagicMock, patch
+from psycopg2 import sql
+
+from app.filter_compiler import FilterError, apply_filters, check_filter_plan, compile_filters
+
+@pytest.fixture(autouse=True)
+def fake_quote_ident():
+    # Render Identifier tanpa koneksi database
+    with patch('psycopg2.sql.ext.quote_ident', side_effect=lambda name, context: f'"{name}"'):
+        yield
+
+def render(composable):
+    return composable.as_string(MagicMock())
+
+def test_legacy_like_becomes_escaped_substring():
+    where, params = compile_filters([{'conditions': [{'field': 'plat_nomor', 'operator': 'LIKE', 'value': 'B_12%'}]}])
+    assert render(where) == '("plat_nomor" LIKE %s)'
+    assert params == ['%B\\_12\\%%']
+
+def test_starts_with_uses_prefix_pattern():
+    where, params = compile_filters([{'conditions': [{'field': 'nik', 'operator': 'starts_with', 'value': '3171'}]}])
+    assert render(where) == '("nik" LIKE %s)'
+    assert params == ['3171%']
+
+def test_groups_are_and_conditions_are_or():
+    filters = [
+        {'conditions': [{'field': 'mor', 'operator': '=', 'value': '7'}, {'field': 'mor', 'operator': '=', 'value': '8'}]},
+        {'conditions': [{'field': 'volume_liter', 'operator': '>=', 'value': '10.5'}]},
+    ]
+    query, params = apply_filters(sql.SQL("SELECT * FROM csv_import_log WHERE daily_summary_id = %s"), filters)
+    assert render(query) == (
+        'SELECT * FROM csv_import_log WHERE daily_summary_id = %s'
+        ' AND ("mor" = %s OR "mor" = %s) AND ("volume_liter" >= %s)'
+    )
+    assert params == ['7', '8', decimal.Decimal('10.5')]
+
+def test_in_and_between_are_typed():
+    where, params = compile_filters([
+        {'conditions': [{'field': 'produk', 'operator': 'IN', 'value': ['Solar', 'Pertalite']}]},
+        {'conditions': [{'field': 'tanggal', 'operator': 'BETWEEN', 'value': ['2025-01-01', '2025-01-31']}]},
+    ])
+    assert render(where) == '("produk" = ANY(%s)) AND ("tanggal" BETWEEN %s AND %s)'
+    assert params == [['Solar', 'Pertalite'], '2025-01-01', '2025-01-31']
+
+def test_empty_values_are_skipped():
+    assert compile_filters([{'conditions': [{'field': 'mor', 'operator': '=', 'value': None}]}]) == (None, [])
+
+@pytest.mark.parametrize("condition", [
+    {'field': 'id; DROP TABLE csv_import_log', 'operator': '=', 'value': '1'},
+    {'field': 'mor', 'operator': '= 1 OR 1 =', 'value': '1'},
+    {'field': 'volume_liter', 'operator': 'LIKE', 'value': '1'},
+    {'field': 'plat_nomor', 'operator': '>', 'value': 'B'},
+    {'field': 'volume_liter', 'operator': '>', 'value': 'banyak'},
+    {'field': 'tanggal', 'operator': '=', 'value': '01/02/2025'},
+])
+def test_invalid_filters_are_rejected(condition):
+    with pytest.raises(FilterError):
+        compile_filters([{'conditions': [condition]}])
+
+def _cursor_with_plan(plan, table_rows):
+    cursor = MagicMock()
+    cursor.fetchone.return_value = ([{'Plan': plan}],)
+    cursor.fetchall.return_value = list(table_rows.items())
+    return cursor
+
+def test_full_seq_scan_is_rejected_by_policy():
+    plan = {'Node Type': 'Seq Scan', 'Relation Name': 'csv_import_log', 'Total Cost': 1e6, 'Plan Rows': 10}
+    cursor = _cursor_with_plan(plan, {'csv_import_log': 50_000_000})
+    query = sql.SQL("SELECT * FROM csv_import_log")
+
+    assert check_filter_plan(cursor, query, [], policy='warn')['full_scan'] is True
+    with pytest.raises(FilterError):
+        check_filter_plan(cursor, query, [], policy='reject')
+
+def test_index_scan_passes():
+    plan = {'Node Type': 'Bitmap Heap Scan', 'Relation Name': 'csv_import_log', 'Total Cost': 12.0, 'Plan Rows': 10,
+            'Plans': [{'Node Type': 'Bitmap Index Scan', 'Index Name': 'ix_csv_import_log_plat_nomor_trgm'}]}
+    summary = check_filter_plan(_cursor_with_plan(plan, {}), sql.SQL("SELECT 1"), [], policy='reject')
+    assert summary['full_scan'] is False
+    assert summary['seq_scans'] == []
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from app.hll import HyperLogLog, merge_sketches
+
+def plates(start, stop):
+    return [f"B {i:06d} XY" for i in range(start, stop)]
+
+@pytest.mark.parametrize("n", [10, 1000, 200_000])
+def test_estimate_within_error(n):
+    sketch = HyperLogLog.from_values(plates(0, n))
+    # 4 standard error: praktis tidak pernah gagal karena kebetulan
+    assert abs(sketch.estimate() - n) <= max(1, 4 * sketch.relative_error * n)
+
+def test_duplicates_and_empty_values_are_ignored():
+    values = plates(0, 500) * 3 + [None, float('nan'), '', '   ']
+    assert HyperLogLog.from_values(values).estimate() == HyperLogLog.from_values(plates(0, 500)).estimate()
+
+def test_merge_equals_sketch_of_union():
+    day_1 = HyperLogLog.from_values(plates(0, 60_000))
+    day_2 = HyperLogLog.from_values(plates(40_000, 100_000))
+    merged = merge_sketches([day_1, day_2])
+
+    assert np.array_equal(merged.registers, HyperLogLog.from_values(plates(0, 100_000)).registers)
+    assert abs(merged.estimate() - 100_000) <= 4 * merged.relative_error * 100_000
+    # Sketch sumber tidak ikut berubah
+    assert np.array_equal(day_1.registers, HyperLogLog.from_values(plates(0, 60_000)).registers)
+
+def test_bytes_roundtrip_and_precision_check():
+    sketch = HyperLogLog.from_values(plates(0, 1000), precision=12)
+    restored = HyperLogLog.from_bytes(sketch.to_bytes(), precision=12)
+    assert restored.estimate() == sketch.estimate()
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(sketch.to_bytes(), precision=14)
+    with pytest.raises(ValueError):
+        merge_sketches([sketch, HyperLogLog.from_values(plates(0, 10), precision=14)])
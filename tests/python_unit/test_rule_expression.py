@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.rule_expression import ExpressionError, compile_expression
+
+@pytest.fixture
+def transactions():
+    # Urutan sama seperti analisis: per plat_nomor lalu waktu transaksi
+    return pd.DataFrame({
+        "transaction_id_asersi": ["T1", "T2", "T3", "T4", "T5"],
+        "plat_nomor": ["B 1", "B 1", "B 1", "B 2", None],
+        "nik": ["1", "", "1", "4", None],
+        "volume_liter": [250.0, 10.0, 300.0, None, 150.0],
+        "warna_plat": ["Merah", "merah", "Hitam", None, "Kuning"],
+        "jumlah_roda_kendaraan": ["6", "4", "6", "4", "6"],
+        "transaction_datetime": pd.to_datetime([
+            "2025-01-01 10:00:00", "2025-01-01 10:00:30", "2025-01-01 10:05:00", "2025-01-01 10:05:10", "2025-01-01 13:00:00",
+        ]),
+    })
+
+def hits(expression, df, value=None):
+    return compile_expression(expression, value).evaluate(df).nonzero()[0].tolist()
+
+def test_sql_style_rules_are_accepted(transactions):
+    assert compile_expression("plat_nomor IS NULL OR nik = ''").normalized == "plat_nomor is None or nik == ''"
+    assert hits("plat_nomor IS NULL OR nik = ''", transactions) == [1, 4]
+    assert hits("warna_plat <> 'Hitam' AND warna_plat IS NOT NULL", transactions) == [0, 1, 4]
+    assert hits("jumlah_roda_kendaraan NOT IN ('4')", transactions) == [0, 2, 4]
+
+def test_comparisons_with_null_are_never_true(transactions):
+    assert hits("volume_liter != 100", transactions) == [0, 1, 2, 4]
+    assert hits("lower(warna_plat) == 'merah'", transactions) == [0, 1]
+
+def test_not_keeps_null_comparisons_unknown(transactions):
+    # volume_liter NULL pada T4 dan warna_plat NULL pada T4: NOT (UNKNOWN) tetap UNKNOWN, tidak terpicu
+    assert hits("NOT volume_liter > 100", transactions) == [1]
+    assert hits("NOT warna_plat = 'Hitam'", transactions) == [0, 1, 4]
+    assert hits("NOT warna_plat IN ('Hitam')", transactions) == [0, 1, 4]
+    assert hits("NOT (volume_liter > 100 OR warna_plat = 'Hitam')", transactions) == [1]
+    # FALSE AND UNKNOWN = FALSE (T4 terpicu), FALSE OR UNKNOWN = UNKNOWN (T4, T5 tidak)
+    assert hits("NOT (volume_liter > 1000 AND plat_nomor = 'B 1')", transactions) == [0, 1, 2, 3, 4]
+    assert hits("NOT (volume_liter < 100 OR plat_nomor = 'x')", transactions) == [0, 2]
+    assert hits("NOT plat_nomor IS NULL", transactions) == [0, 1, 2, 3]
+
+def test_window_functions_stay_within_plate(transactions):
+    assert hits("seconds_since_prev() < value", transactions, "60") == [1]
+    assert hits("prev(volume_liter) > 200", transactions) == [1]
+    assert hits("seconds_until_next() <= 30", transactions) == [0]
+    assert hits("count_by(plat_nomor) >= 3 and sum_by(volume_liter, plat_nomor) > 500", transactions) == [0, 1, 2]
+
+def test_conjuncts_short_circuit_on_positions(transactions):
+    compiled = compile_expression("volume_liter > 100 AND seconds_since_prev() < 600")
+    assert [conjunct["kind"] for conjunct in compiled.conjuncts] == ["numeric", "window"]
+    # Predikat window hanya dievaluasi pada posisi yang lolos predikat sebelumnya
+    positions = np.array([0, 2, 4])
+    assert compiled.conjuncts[1]["evaluate"](transactions, positions).tolist() == [False, True, False]
+    assert compiled.details(transactions, np.array([2])) == [{"plat_nomor": "B 1", "transaction_datetime": "2025-01-01T10:05:00", "volume_liter": 300.0}]
+
+@pytest.mark.parametrize("expression, message", [
+    ("__import__('os').system('true')", "tidak didukung"),
+    ("volume_liter.real > 1", "tidak didukung"),
+    ("[x for x in plat_nomor]", "tidak didukung"),
+    ("unknown_column > 1", "tidak dikenal"),
+    ("volume_liter", "bukan kondisi"),
+    ("jumlah_roda_kendaraan == 4", "Tidak dapat membandingkan"),
+    ("prev(volume_liter * 2) > 1", "harus nama kolom"),
+    ("1 < 2", "harus berasal dari kolom"),
+    ("volume_liter > value", "tidak memiliki value"),
+    ("interval < value seconds", "tidak dapat di-parse"),
+])
+def test_non_vectorizable_expressions_are_rejected(expression, message):
+    with pytest.raises(ExpressionError, match=message):
+        compile_expression(expression)
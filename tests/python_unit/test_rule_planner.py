@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from app.instrumentation import SpanRecorder
+from app.rule_planner import evaluate_predicates, plan_predicates
+from crud.analysis_crud import _evaluate_rules
+
+def transactions():
+    df = pd.DataFrame({
+        "transaction_id_asersi": ["T1", "T2", "T3", "T4", "T5"],
+        "plat_nomor": ["B 1", "B 1", "B 2", None, "B 3"],
+        "nik": ["1", "", "3", "4", None],
+        "volume_liter": [250.0, 10.0, 300.0, None, 150.0],
+        "warna_plat": ["Kuning", "kuning", "Hitam", "Putih", "KUNING"],
+        "jumlah_roda_kendaraan": ["6", "4", "6", "4", "6"],
+        "batch_original_duplicate_count": [0, 0, 0, 0, 0],
+        "transaction_datetime": pd.to_datetime([
+            "2025-01-01 10:00:00", "2025-01-01 10:00:30", "2025-01-01 11:00:00", "2025-01-01 12:00:00", "2025-01-01 13:00:00",
+        ]),
+    })
+    return df
+
+def stats_for(df):
+    """Statistik seperti hasil COLUMN_STATS_SQL, dihitung dari DataFrame."""
+    groups = {}
+    for row in df.itertuples():
+        key = (str(row.warna_plat or '').lower(), str(row.jumlah_roda_kendaraan or ''))
+        group = groups.setdefault(key, {"rows": 0, "max_volume_liter": None})
+        group["rows"] += 1
+        if not pd.isna(row.volume_liter):
+            group["max_volume_liter"] = max(group["max_volume_liter"] or float('-inf'), row.volume_liter)
+    return {
+        "rows": len(df),
+        "missing_plat_nomor": int((df.plat_nomor.isna() | (df.plat_nomor == '')).sum()),
+        "missing_nik": int((df.nik.isna() | (df.nik == '')).sum()),
+        "duplicate_rows": int((df.batch_original_duplicate_count > 0).sum()),
+        "repeated_plat_nomor": int(df.plat_nomor.count() - df.plat_nomor.nunique()),
+        "groups": groups,
+    }
+
+def special(criteria_id, code, value=None):
+    return SimpleNamespace(special_criteria_id=criteria_id, criteria_code=code, value=value, description=code)
+
+TRANSACTION_RULES = [
+    SimpleNamespace(criteria_id=1, anomaly_type="SINGLE_VOLUME_EXCEED", min_volume_liter=200, plate_color=["Kuning"], consumer_type="roda 6"),
+    SimpleNamespace(criteria_id=2, anomaly_type="SINGLE_VOLUME_EXCEED", min_volume_liter=500, plate_color=["Kuning"], consumer_type="roda 6"),
+]
+SPECIAL_RULES = [
+    special(1, "MISSING_PLAT_NOMOR"), special(2, "MISSING_NIK"), special(3, "DUPLICATE_TRANSACTION"),
+    special(4, "RED_PLATE_VEHICLE"), special(5, "TRANSACTION_INTERVAL_TOO_CLOSE", "60"),
+]
+
+def test_rules_skipped_by_stats_give_same_hits():
+    df = transactions()
+    profiler = SpanRecorder()
+    with_stats = _evaluate_rules(df, TRANSACTION_RULES, SPECIAL_RULES, stats_for(df), {}, profiler)
+    without_stats = _evaluate_rules(df, TRANSACTION_RULES, SPECIAL_RULES, None, {}, SpanRecorder())
+
+    assert with_stats["TC_1"] == ("SINGLE_VOLUME_EXCEED", {0: {"threshold": 200, "actual_volume": 250.0, "plate_color": "Kuning", "consumer_type": "6"}})
+    assert set(with_stats["SC_1"][1]) == {3}
+    assert set(with_stats["SC_2"][1]) == {1, 4}
+    assert with_stats["SC_5"][1] == {1: {
+        "message": "TRANSACTION_INTERVAL_TOO_CLOSE", "interval_threshold_seconds": 60,
+        "actual_interval_seconds": 30.0, "previous_transaction_id": "T1",
+    }}
+    # Tidak ada volume > 500, tidak ada duplikat, tidak ada plat merah: terbukti tidak terpicu
+    skipped = {rule["name"]: rule["skip_reason"] for rule in profiler.of_kind("rule") if rule.get("skipped")}
+    assert set(skipped) == {"TC_2", "SC_3", "SC_4"}
+    for rule_key, hit in without_stats.items():
+        assert (with_stats[rule_key] or (None, {}))[1] == hit[1]
+
+def test_cheap_selective_predicate_runs_first_and_short_circuits():
+    calls = []
+    def predicate(name, kind, estimate, result):
+        def evaluate(df, positions):
+            calls.append((name, None if positions is None else list(positions)))
+            return np.asarray(result(df)) if positions is None else np.asarray(result(df))[positions]
+        return {"name": name, "kind": kind, "estimate": estimate, "evaluate": evaluate}
+
+    df = pd.DataFrame({"x": range(6)})
+    predicates = [
+        predicate("expensive", "string", 0.9, lambda df: df.x >= 0),
+        predicate("cheap", "numeric", 0.2, lambda df: df.x == 4),
+    ]
+    ordered, _ = plan_predicates("SC_1", predicates, {}, len(df))
+    assert [p["name"] for p in ordered] == ["cheap", "expensive"]
+
+    positions, records = evaluate_predicates(df, ordered)
+    assert list(positions) == [4]
+    assert calls == [("cheap", None), ("expensive", [4])]
+    assert [(r["rows_in"], r["rows_out"]) for r in records] == [(6, 1), (1, 1)]
+
+def test_history_overrides_default_cost():
+    predicates = [
+        {"name": "a", "kind": "numeric", "estimate": 0.5, "evaluate": None},
+        {"name": "b", "kind": "string", "estimate": 0.5, "evaluate": None},
+    ]
+    history = {("TC_1", "a"): {"seconds_per_row": 1e-3, "pass_rate": 0.5}}
+    ordered, _ = plan_predicates("TC_1", predicates, history, 100)
+    assert [p["name"] for p in ordered] == ["b", "a"]